@@ -93,6 +93,8 @@ def main(*args):
     )
 
     environ.setdefault('BWADDHOSTKEYS', "1" if pargs.add_ssh_host_keys else "0")
+    environ.setdefault('BWPERSISTENTSHELL', "1" if pargs.persistent_shell else "0")
+    environ.setdefault('BWTHREADS', "1" if pargs.threads else "0")
 
     if len(text_args) >= 1 and (
         text_args[0] == "--version" or
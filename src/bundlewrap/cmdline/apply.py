@@ -2,9 +2,11 @@
 from __future__ import unicode_literals
 
 from datetime import datetime
+from os import environ
 
-from ..concurrency import WorkerPool
+from ..concurrency import get_worker_pool, THREADS_ENV
 from ..exceptions import WorkerException
+from ..node import apply_nodes, DEPS_CACHE_ENV
 from ..utils import LOG
 from ..utils.cmdline import get_target_nodes
 from ..utils.text import bold, green, red, yellow
@@ -47,9 +49,59 @@ def bw_apply(repo, args):
 
     start_time = datetime.now()
 
+    if environ.get(DEPS_CACHE_ENV, "1") != "0":
+        # the repository is pickled along with every node sent to a
+        # worker process, so hash it here once instead of in each worker
+        repo.sources_hash
+
+    if environ.get(THREADS_ENV, "0") == "1" and not args['interactive']:
+        for line in _apply_nodes(pending_nodes, args, errors):
+            yield line
+    else:
+        for line in _apply_nodes_in_pool(pending_nodes, args, errors):
+            yield line
+
+    error_summary(errors)
+
+    repo.hooks.apply_end(
+        repo,
+        args['target'],
+        target_nodes,
+        duration=datetime.now() - start_time,
+    )
+
+
+def _apply_nodes(pending_nodes, args, errors):
+    """
+    Applies nodes and their items using a single shared pool of
+    threads.
+    """
+    for msg in apply_nodes(
+        pending_nodes,
+        node_workers=args['node_workers'],
+        item_workers=args['item_workers'],
+        force=args['force'],
+    ):
+        if msg['msg'] == 'NODE_STARTED':
+            for line in _node_started(msg['node'], args):
+                yield line
+        elif msg['msg'] == 'NODE_FINISHED':
+            for line in _node_finished(msg['node'].name, msg['result'], args):
+                yield line
+        elif msg['msg'] == 'NODE_FAILED':
+            if args['debug'] and msg['traceback']:
+                yield msg['traceback']
+            error = "{}: {} {}".format(msg['node'].name, red("!"), msg['error'])
+            yield error
+            errors.append(error)
+
+
+def _apply_nodes_in_pool(pending_nodes, args, errors):
+    """
+    Applies each node in a worker of its own.
+    """
     worker_count = 1 if args['interactive'] else args['node_workers']
-    with WorkerPool(workers=worker_count) as worker_pool:
-        results = {}
+    with get_worker_pool(workers=worker_count) as worker_pool:
         while worker_pool.keep_running():
             try:
                 msg = worker_pool.get_event()
@@ -65,18 +117,8 @@ def bw_apply(repo, args):
             if msg['msg'] == 'REQUEST_WORK':
                 if pending_nodes:
                     node = pending_nodes.pop()
-                    node_start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                    if args['interactive']:
-                        yield _("\n{}: run started at {}").format(
-                            bold(node.name),
-                            node_start_time,
-                        )
-                    else:
-                        LOG.info(_("{}: run started at {}").format(
-                            node.name,
-                            node_start_time,
-                        ))
+                    for line in _node_started(node, args):
+                        yield line
 
                     worker_pool.start_task(
                         msg['wid'],
@@ -92,40 +134,47 @@ def bw_apply(repo, args):
                 else:
                     worker_pool.quit(msg['wid'])
             elif msg['msg'] == 'FINISHED_WORK':
-                node_name = msg['task_id']
-                results[node_name] = msg['return_value']
-
-                if args['profiling']:
-                    total_time = 0.0
-                    yield _("{}: BEGIN PROFILING DATA (most expensive items first)").format(node_name)
-                    yield _("{}:    seconds   item").format(node_name)
-                    for time_elapsed, item_id in results[node_name].profiling_info:
-                        yield "{}: {:10.3f}   {}".format(node_name, time_elapsed.total_seconds(), item_id)
-                        total_time += time_elapsed.total_seconds()
-                    yield _("{}: {:10.3f}   (total)").format(node_name, total_time)
-                    yield _("{}: END PROFILING DATA").format(node_name)
-
-                if args['interactive']:
-                    yield _("\n{node}: run completed after {time}s ({stats})\n").format(
-                        node=bold(node_name),
-                        time=results[node_name].duration.total_seconds(),
-                        stats=format_node_result(results[node_name]),
-                    )
-                else:
-                    LOG.info(_("{node}: run completed after {time}s").format(
-                        node=node_name,
-                        time=results[node_name].duration.total_seconds(),
-                    ))
-                    LOG.info(_("{node}: stats: {stats}").format(
-                        node=node_name,
-                        stats=format_node_result(results[node_name]),
-                    ))
-
-    error_summary(errors)
-
-    repo.hooks.apply_end(
-        repo,
-        args['target'],
-        target_nodes,
-        duration=datetime.now() - start_time,
-    )
+                for line in _node_finished(msg['task_id'], msg['return_value'], args):
+                    yield line
+
+
+def _node_finished(node_name, result, args):
+    if args['profiling']:
+        total_time = 0.0
+        yield _("{}: BEGIN PROFILING DATA (most expensive items first)").format(node_name)
+        yield _("{}:    seconds   item").format(node_name)
+        for time_elapsed, item_id in result.profiling_info:
+            yield "{}: {:10.3f}   {}".format(node_name, time_elapsed.total_seconds(), item_id)
+            total_time += time_elapsed.total_seconds()
+        yield _("{}: {:10.3f}   (total)").format(node_name, total_time)
+        yield _("{}: END PROFILING DATA").format(node_name)
+
+    if args['interactive']:
+        yield _("\n{node}: run completed after {time}s ({stats})\n").format(
+            node=bold(node_name),
+            time=result.duration.total_seconds(),
+            stats=format_node_result(result),
+        )
+    else:
+        LOG.info(_("{node}: run completed after {time}s").format(
+            node=node_name,
+            time=result.duration.total_seconds(),
+        ))
+        LOG.info(_("{node}: stats: {stats}").format(
+            node=node_name,
+            stats=format_node_result(result),
+        ))
+
+
+def _node_started(node, args):
+    node_start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if args['interactive']:
+        yield _("\n{}: run started at {}").format(
+            bold(node.name),
+            node_start_time,
+        )
+    else:
+        LOG.info(_("{}: run started at {}").format(
+            node.name,
+            node_start_time,
+        ))
@@ -40,6 +40,23 @@ def build_parser_bw():
         dest='debug',
         help=_("print debugging info (implies -v)"),
     )
+    parser.add_argument(
+        "--persistent-shell",
+        action='store_true',
+        default=False,
+        dest='persistent_shell',
+        help=_("run commands through long-lived shells on each node "
+               "(requires bash 4.1+ on nodes, output of commands is only "
+               "shown after they have finished)"),
+    )
+    parser.add_argument(
+        "--threads",
+        action='store_true',
+        default=False,
+        dest='threads',
+        help=_("process nodes and items in threads of a single process "
+               "instead of subprocesses"),
+    )
     parser.add_argument(
         "--version",
         action='version',
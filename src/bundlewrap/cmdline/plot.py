@@ -9,7 +9,7 @@ def bw_plot_node(repo, args):
     node = repo.get_node(args['node'])
     for line in graph_for_items(
         node.name,
-        prepare_dependencies(node.items),
+        prepare_dependencies(node.items, cache=node.dependency_cache),
         cluster=args['cluster'],
         concurrency=args['depends_concurrency'],
         static=args['depends_static'],
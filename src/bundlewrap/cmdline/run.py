@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 from datetime import datetime
 
-from ..concurrency import WorkerPool
+from ..concurrency import get_worker_pool
 from ..exceptions import WorkerException
 from ..utils.cmdline import get_target_nodes
 from ..utils.text import mark_for_translation as _
@@ -68,7 +68,7 @@ def bw_run(repo, args):
     )
     start_time = datetime.now()
 
-    with WorkerPool(workers=args['node_workers']) as worker_pool:
+    with get_worker_pool(workers=args['node_workers']) as worker_pool:
         while worker_pool.keep_running():
             try:
                 msg = worker_pool.get_event()
@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 from copy import copy
 
-from ..concurrency import WorkerPool
+from ..concurrency import get_worker_pool
 from ..exceptions import WorkerException
 from ..plugins import PluginManager
 from ..utils.cmdline import get_target_nodes
@@ -15,7 +15,7 @@ def bw_test(repo, args):
         pending_nodes = get_target_nodes(repo, args['target'])
     else:
         pending_nodes = copy(list(repo.nodes))
-    with WorkerPool(workers=args['node_workers']) as worker_pool:
+    with get_worker_pool(workers=args['node_workers']) as worker_pool:
         while worker_pool.keep_running():
             try:
                 msg = worker_pool.get_event()
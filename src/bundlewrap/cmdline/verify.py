@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from ..concurrency import WorkerPool
+from ..concurrency import get_worker_pool
 from ..exceptions import WorkerException
 from ..utils.cmdline import get_target_nodes
 from ..utils.text import error_summary, mark_for_translation as _, red
@@ -65,7 +65,7 @@ def bw_verify(repo, args):
     errors = []
     node_stats = {}
     pending_nodes = get_target_nodes(repo, args['target'])
-    with WorkerPool(workers=args['node_workers']) as worker_pool:
+    with get_worker_pool(workers=args['node_workers']) as worker_pool:
         while worker_pool.keep_running():
             try:
                 msg = worker_pool.get_event()
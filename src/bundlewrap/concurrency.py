@@ -1,12 +1,25 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from collections import deque
 from datetime import datetime
 from inspect import ismethod, isgenerator
 from logging import getLogger, Handler
-from multiprocessing import Manager, Pipe, Process
-from os import dup, fdopen
+from multiprocessing import Pipe, Process
+try:
+    from multiprocessing.connection import wait
+except ImportError:  # Python 2
+    from select import select
+
+    def wait(connections):
+        return select(connections, [], [])[0]
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+from os import environ
 import sys
+from threading import Lock, Thread
 from traceback import format_exception
 
 from .exceptions import WorkerException
@@ -14,19 +27,20 @@ from .utils import LOG
 from .utils.text import force_text, mark_for_translation as _
 
 JOIN_TIMEOUT = 5  # seconds
+THREADS_ENV = 'BWTHREADS'
 
 
 class ChildLogHandler(Handler):
     """
-    Captures log events in child processes and inserts them into the
-    queue to be processed by the parent process.
+    Captures log events in child processes and sends them to the parent
+    process.
     """
-    def __init__(self, messages):
+    def __init__(self, send):
         Handler.__init__(self)
-        self.messages = messages
+        self.send = send
 
     def emit(self, record):
-        self.messages.put({'msg': 'LOG_ENTRY', 'log_entry': record})
+        self.send({'msg': 'LOG_ENTRY', 'log_entry': record})
 
 
 def _patch_logger(logger, new_handler=None):
@@ -37,65 +51,95 @@ def _patch_logger(logger, new_handler=None):
     logger.setLevel(0)
 
 
-def _worker_process(wid, messages, pipe):
+def _run_task(wid, msg):
+    """
+    Runs the task described by the given RUN message and returns the
+    corresponding FINISHED_WORK message.
+    """
+    exception = None
+    exception_task_id = None
+    return_value = None
+    start = datetime.now()
+    traceback = None
+
+    try:
+        if msg['target_obj'] is None:
+            target = msg['target']
+        else:
+            target = getattr(msg['target_obj'], msg['target'])
+
+        return_value = target(*msg['args'], **msg['kwargs'])
+
+        if isgenerator(return_value):
+            return_value = list(return_value)
+
+    except Exception as e:
+        if isinstance(e, WorkerException):
+            exception = e.wrapped_exception
+            exception_task_id = e.task_id
+        else:
+            exception = force_text(repr(e))
+            exception_task_id = msg['task_id']
+        traceback = "".join([force_text(line) for line in format_exception(*sys.exc_info())])
+        return_value = None
+
+    return {
+        'duration': datetime.now() - start,
+        'exception': exception,
+        'exception_task_id': exception_task_id,
+        'msg': 'FINISHED_WORK',
+        'return_value': return_value,
+        'task_id': msg['task_id'],
+        'traceback': traceback,
+        'wid': wid,
+    }
+
+
+def _worker_process(wid, pipe):
     """
     This is what actually runs in the child process.
     """
+    # log entries might be sent from other threads
+    send_lock = Lock()
+
+    def send(msg):
+        with send_lock:
+            pipe.send(msg)
+
     # replace the child logger with one that will send logs back to the
     # parent process
     from bundlewrap import utils
-    child_log_handler = ChildLogHandler(messages)
+    child_log_handler = ChildLogHandler(send)
     _patch_logger(getLogger(), child_log_handler)
     _patch_logger(utils.LOG)
 
     while True:
         # These two calls can block for an infinite amount of time. We
-        # request work via the public queue and, eventually, some day,
-        # we might get an answer via our private pipe.
-        messages.put({'msg': 'REQUEST_WORK', 'wid': wid})
+        # request work and, eventually, some day, we might get an
+        # answer.
+        send({'msg': 'REQUEST_WORK', 'wid': wid})
         msg = pipe.recv()
         if msg['msg'] == 'DIE':
             return
         elif msg['msg'] == 'NOOP':
             pass
         elif msg['msg'] == 'RUN':
-            exception = None
-            exception_task_id = None
-            return_value = None
-            start = datetime.now()
-            traceback = None
-
-            try:
-                if msg['target_obj'] is None:
-                    target = msg['target']
-                else:
-                    target = getattr(msg['target_obj'], msg['target'])
-
-                return_value = target(*msg['args'], **msg['kwargs'])
-
-                if isgenerator(return_value):
-                    return_value = list(return_value)
-
-            except Exception as e:
-                if isinstance(e, WorkerException):
-                    exception = e.wrapped_exception
-                    exception_task_id = e.task_id
-                else:
-                    exception = force_text(repr(e))
-                    exception_task_id = msg['task_id']
-                traceback = "".join([force_text(line) for line in format_exception(*sys.exc_info())])
-                return_value = None
-
-            messages.put({
-                'duration': datetime.now() - start,
-                'exception': exception,
-                'exception_task_id': exception_task_id,
-                'msg': 'FINISHED_WORK',
-                'return_value': return_value,
-                'task_id': msg['task_id'],
-                'traceback': traceback,
-                'wid': wid,
-            })
+            send(_run_task(wid, msg))
+
+
+def _worker_thread(wid, messages, tasks):
+    """
+    This is what actually runs in a worker thread.
+    """
+    while True:
+        messages.put({'msg': 'REQUEST_WORK', 'wid': wid})
+        msg = tasks.get()
+        if msg['msg'] == 'DIE':
+            return
+        elif msg['msg'] == 'NOOP':
+            pass
+        elif msg['msg'] == 'RUN':
+            messages.put(_run_task(wid, msg))
 
 
 class WorkerPool(object):
@@ -122,27 +166,23 @@ class WorkerPool(object):
         # job. We only need to know how many there are.
         self.jobs_open = 0
 
-        # The public message queue. Workers ask for jobs here, report
-        # finished work and log items.
-        # Note: There's (at least) two ways to organize a pool like
-        # this. One is to only open a pipe to each worker. Then, you can
-        # use select() to see which pipe can be read from. Problem is,
-        # this is not really supported by the multiprocessing module;
-        # you have to dig into the internals and that's ugly. So, we go
-        # for another option: A managed queue. Multiple processes can
-        # write to it (all the workers do) and the parent can read from
-        # it. However, this is only feasible when workers must talk to
-        # the parent. The parent can't talk to the workers using this
-        # queue. Thus, we still need a dedicated pipe to each worker
-        # (see below).
-        self.messages = Manager().Queue()
+        # Workers ask for jobs, report finished work and send log
+        # items through their pipe. We wait for any of the pipes of
+        # workers still alive to become readable and keep messages
+        # received but not yet returned by get_event() here.
+        self.messages = deque()
+        self.pipes_alive = []
 
         for i in range(workers):
             (parent_conn, child_conn) = Pipe()
             p = Process(target=_worker_process,
-                        args=(i, self.messages, child_conn))
+                        args=(i, child_conn))
             p.start()
+            # only the worker may keep its end of the pipe open,
+            # otherwise we would never see EOF if it dies
+            child_conn.close()
             self.workers.append((p, parent_conn))
+            self.pipes_alive.append(parent_conn)
 
     def __enter__(self):
         return self
@@ -150,11 +190,36 @@ class WorkerPool(object):
     def __exit__(self, type, value, traceback):
         self.shutdown()
 
+    def _receive(self):
+        while not self.messages:
+            if not self.pipes_alive:
+                raise RuntimeError(_("all worker processes died"))
+            for pipe in wait(self.pipes_alive):
+                try:
+                    self.messages.append(pipe.recv())
+                except EOFError:
+                    # worker died unexpectedly, taking whatever it was
+                    # working on with it
+                    self.pipes_alive.remove(pipe)
+                    raise RuntimeError(_("worker process with PID {pid} died unexpectedly").format(
+                        pid=self._process_for_pipe(pipe).pid,
+                    ))
+        return self.messages.popleft()
+
+    def _process_for_pipe(self, pipe):
+        for process, worker_pipe in self.workers:
+            if worker_pipe is pipe:
+                return process
+
+    def _send(self, wid, msg):
+        (process, pipe) = self.workers[wid]
+        pipe.send(msg)
+
     def get_event(self):
         """
         Blocks until a message from a worker is received.
         """
-        msg = self.messages.get()
+        msg = self._receive()
         if msg['msg'] == 'FINISHED_WORK':
             self.jobs_open -= 1
             # check for exception in child process and raise it
@@ -190,8 +255,7 @@ class WorkerPool(object):
         else:
             target_obj = None
 
-        (process, pipe) = self.workers[wid]
-        pipe.send({
+        self._send(wid, {
             'msg': 'RUN',
             'task_id': task_id,
             'target': target,
@@ -207,8 +271,8 @@ class WorkerPool(object):
         Mark a worker as "idle".
         """
         # We don't really need to do something here. The worker will
-        # simply keep blocking at his "pipe.read()". Just store his id
-        # so we can answer him later.
+        # simply keep blocking while waiting for our answer. Just store
+        # his id so we can answer him later.
         self.idle_workers.append(wid)
 
     def quit(self, wid):
@@ -220,6 +284,8 @@ class WorkerPool(object):
             pipe.send({'msg': 'DIE'})
         except IOError:
             pass
+        if pipe in self.pipes_alive:
+            self.pipes_alive.remove(pipe)
         pipe.close()
         process.join(JOIN_TIMEOUT)
         if process.is_alive():
@@ -247,8 +313,7 @@ class WorkerPool(object):
         for wid in self.idle_workers:
             # Send a noop to this worker. He will simply ask for new
             # work again.
-            (process, pipe) = self.workers[wid]
-            pipe.send({'msg': 'NOOP'})
+            self._send(wid, {'msg': 'NOOP'})
         self.idle_workers = []
 
     def keep_running(self):
@@ -256,3 +321,79 @@ class WorkerPool(object):
         Returns True if this pool is not ready to die.
         """
         return self.jobs_open > 0 or self.workers_alive
+
+
+class ThreadWorkerPool(WorkerPool):
+    """
+    Manages a bunch of worker threads. Tasks and their results are
+    shared with the caller by reference instead of being pickled, which
+    makes this pool suitable for work that mostly waits on subprocesses.
+    """
+    def __init__(self, workers=4):
+        if workers < 1:
+            raise ValueError(_("at least one worker is required"))
+
+        # see WorkerPool, except a worker is a tuple of a Thread object
+        # and the queue it receives tasks through
+        self.workers = []
+        self.idle_workers = []
+        self.workers_alive = list(range(workers))
+        self.jobs_open = 0
+
+        # workers ask for jobs and report finished work here, log
+        # entries are handled by the worker threads themselves
+        self.messages = Queue()
+
+        for i in range(workers):
+            tasks = Queue()
+            thread = Thread(target=_worker_thread, args=(i, self.messages, tasks))
+            # don't keep the interpreter running because of stuck threads
+            thread.daemon = True
+            thread.start()
+            self.workers.append((thread, tasks))
+
+    def _receive(self):
+        return self.messages.get()
+
+    def _send(self, wid, msg):
+        (thread, tasks) = self.workers[wid]
+        tasks.put(msg)
+
+    def start_task(self, wid, target, task_id=None, args=None, kwargs=None):
+        self._send(wid, {
+            'msg': 'RUN',
+            'task_id': task_id,
+            'target': target,
+            'target_obj': None,
+            'args': [] if args is None else list(args),
+            'kwargs': {} if kwargs is None else kwargs,
+        })
+        self.jobs_open += 1
+
+    def quit(self, wid):
+        """
+        Shutdown a worker.
+        """
+        self._send(wid, {'msg': 'DIE'})
+        (thread, tasks) = self.workers[wid]
+        thread.join(JOIN_TIMEOUT)
+        if thread.is_alive():
+            LOG.warn(_(
+                "worker thread {wid} didn't join within {time} seconds, "
+                "abandoning it...").format(
+                    wid=wid,
+                    time=JOIN_TIMEOUT,
+                )
+            )
+        self.workers_alive.remove(wid)
+
+
+def get_worker_pool(workers=4):
+    """
+    Returns a WorkerPool or, if BWTHREADS=1, a ThreadWorkerPool with
+    the given number of workers.
+    """
+    if environ.get(THREADS_ENV, "0") == "1":
+        return ThreadWorkerPool(workers=workers)
+    else:
+        return WorkerPool(workers=workers)
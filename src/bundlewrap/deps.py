@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from .exceptions import BundleError, NoSuchItem
+from collections import defaultdict, deque
+from heapq import heappop, heappush
+from json import dumps, loads
+from operator import attrgetter
+
+from .exceptions import BundleError, ItemDependencyError, NoSuchItem
 from .items import Item
 from .items.actions import Action
-from .utils import LOG
+from .items.directories import PathIndex
+from .utils import LOG, write_cache_file
 from .utils.text import mark_for_translation as _
 
 
@@ -81,10 +87,87 @@ class DummyItem(object):
         pass
 
 
+class ItemIndex(object):
+    """
+    Maps item IDs to items, allowing constant-time lookups in place of
+    find_item().
+    """
+    def __init__(self, items=()):
+        self._items = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        # just like find_item(), we return the first item with a given ID
+        self._items.setdefault(item.id, item)
+
+    def find(self, item_id):
+        """
+        Returns the item with the given ID.
+        """
+        try:
+            return self._items[item_id]
+        except KeyError:
+            raise NoSuchItem(_("item not found: {}").format(item_id))
+
+    def remove(self, item):
+        if self._items.get(item.id) is item:
+            del self._items[item.id]
+
+
+class DependencyCache(object):
+    """
+    Stores the result of prepare_dependencies() in a JSON file. The
+    result is reused as long as the given key stays the same, so the
+    key has to cover everything items and their attributes are derived
+    from.
+    """
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+
+    def load(self, items):
+        """
+        Returns prepared items previously stored for the given items or
+        None if there is no usable cache entry.
+        """
+        try:
+            with open(self.path) as f:
+                cached = loads(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(cached, dict) or cached.get('key') != self.key:
+            return None
+        try:
+            return _load_dependencies(items, cached['items'])
+        except (KeyError, NoSuchItem, TypeError, ValueError):
+            LOG.debug(_("ignoring malformed dependency cache at {}").format(self.path))
+            return None
+
+    def save(self, prepared_items, item_ids):
+        """
+        Stores prepared items, item_ids being the IDs of all items
+        prepare_dependencies() was called with.
+        """
+        write_cache_file(self.path, dumps({
+            'key': self.key,
+            'items': _dump_dependencies(prepared_items, item_ids),
+        }))
+
+
 def find_item(item_id, items):
     """
     Returns the first item with the given ID within the given list of
-    items.
+    items. Use ItemIndex for repeated lookups.
     """
     try:
         item = list(filter(lambda item: item.id == item_id, items))[0]
@@ -93,6 +176,112 @@ def find_item(item_id, items):
     return item
 
 
+def _check_duplicate_items(items):
+    """
+    Raises BundleError listing all item IDs defined more than once.
+    """
+    items_by_id = defaultdict(list)
+    for item in items:
+        items_by_id[item.id].append(item)
+
+    collisions = []
+    for item_id, duplicates in items_by_id.items():
+        if len(duplicates) > 1:
+            bundle_names = ["'{}'".format(item.bundle.name) for item in duplicates]
+            collisions.append(_(
+                "duplicate definition of {item} in bundles {bundles} and {last_bundle}"
+            ).format(
+                item=item_id,
+                bundles=", ".join(bundle_names[:-1]),
+                last_bundle=bundle_names[-1],
+            ))
+    if collisions:
+        raise BundleError("\n".join(sorted(collisions)))
+
+
+def _dump_dependencies(items, item_ids):
+    """
+    Returns a JSON-serializable representation of the items returned by
+    prepare_dependencies(). Items not in item_ids have been injected and
+    will be recreated by _load_dependencies().
+    """
+    dumped_items = []
+    for item in items:
+        if item.id in item_ids:
+            kind = 'item'
+        elif isinstance(item, DummyItem):
+            kind = 'dummy'
+        elif isinstance(item, BundleItem):
+            kind = 'bundle'
+        else:
+            kind = 'action'
+        dumped_items.append({
+            'bundle': None if item.bundle is None else item.bundle.name,
+            'concurrency_deps': item._concurrency_deps,
+            'deps': item._deps,
+            'flattened_deps': item._flattened_deps,
+            'flattened_triggers': sorted(item._flattened_triggers),
+            'id': item.id,
+            'kind': kind,
+            'preceded_by': item.preceded_by,
+            'precedes_items': [preceding_item.id for preceding_item in item._precedes_items],
+            'reverse_deps': item._reverse_deps,
+            'triggers': item.triggers,
+        })
+    return dumped_items
+
+
+def _load_dependencies(items, dumped_items):
+    """
+    Applies the output of _dump_dependencies() to the given items. Returns
+    None if the items don't match the dumped ones.
+    """
+    item_index = ItemIndex(items)
+    if len(item_index) != len(items) or set(
+        dumped_item['id'] for dumped_item in dumped_items if dumped_item['kind'] == 'item'
+    ) != set(item.id for item in items):
+        return None
+
+    bundles = {}
+    for item in items:
+        bundles.setdefault(item.bundle.name, item.bundle)
+
+    prepared_items = []
+    for dumped_item in dumped_items:
+        if dumped_item['kind'] == 'item':
+            item = item_index.find(dumped_item['id'])
+        elif dumped_item['kind'] == 'dummy':
+            item = DummyItem(dumped_item['id'][:-1])
+        elif dumped_item['kind'] == 'bundle':
+            item = BundleItem(bundles[dumped_item['bundle']])
+        else:
+            type_name, item_name, action_name = dumped_item['id'].split(":")
+            target_item = item_index.find("{}:{}".format(type_name, item_name))
+            action_attrs = target_item.get_canned_actions()[action_name]
+            action_attrs.update({'triggered': True})
+            item = Action(
+                bundles[dumped_item['bundle']],
+                dumped_item['id'],
+                action_attrs,
+                skip_name_validation=True,
+            )
+        prepared_items.append(item)
+
+    prepared_index = ItemIndex(prepared_items)
+    for item, dumped_item in zip(prepared_items, dumped_items):
+        item._concurrency_deps = list(dumped_item['concurrency_deps'])
+        item._deps = list(dumped_item['deps'])
+        item._flattened_deps = list(dumped_item['flattened_deps'])
+        item._flattened_triggers = set(dumped_item['flattened_triggers'])
+        item._precedes_items = [
+            prepared_index.find(item_id) for item_id in dumped_item['precedes_items']
+        ]
+        item._reverse_deps = list(dumped_item['reverse_deps'])
+        item.preceded_by = list(dumped_item['preceded_by'])
+        item.triggers = list(dumped_item['triggers'])
+    return prepared_items
+
+
 def _find_items_of_types(item_types, items, include_dummy=False):
     """
     Returns a subset of items with any of the given types.
@@ -106,50 +295,210 @@ def _find_items_of_types(item_types, items, include_dummy=False):
     ))
 
 
-def _flatten_dependencies(items):
+def _flatten_dependencies(items, item_index=None):
     """
     This will cause all dependencies - direct AND inherited - to be
-    listed in item._deps.
-    """
-    for item in items:
-        item._flattened_deps = list(set(
-            item._deps + _get_deps_for_item(item, items)
-        ))
+    listed in item._flattened_deps (sorted, so the result and the
+    dependency cache do not depend on set ordering).
+
+    Raises ItemDependencyError if the dependencies contain a loop.
+    """
+    if item_index is None:
+        item_index = ItemIndex(items)
+    components = _strongly_connected_components(items, item_index)
+    flattened_deps = _transitive_closures(components, attrgetter('_deps'))
+    for component in components:
+        loop = _find_loop_in_component(component)
+        if loop:
+            raise ItemDependencyError(
+                _("bad dependencies between these items: {items} (loop: {loop})").format(
+                    items=", ".join(sorted(item.id for item in component)),
+                    loop=" -> ".join(loop),
+                )
+            )
+        for item in component:
+            item._flattened_deps = sorted(flattened_deps[item.id])
     return items
 
 
-def _get_deps_for_item(item, items, deps_found=None):
+def _flatten_triggers(items, item_index=None):
     """
-    Recursively retrieves and returns a list of all inherited
-    dependencies of the given item.
-
-    Note: This can handle loops, but won't detect them.
+    Lists all items directly or indirectly triggered by an item in
+    item._flattened_triggers (a set of item IDs).
     """
-    if deps_found is None:
-        deps_found = []
-    deps = []
-    for dep in item._deps:
-        if dep not in deps_found:
-            deps.append(dep)
-            deps_found.append(dep)
-            deps += _get_deps_for_item(
-                find_item(dep, items),
-                items,
-                deps_found,
-            )
-    return deps
+    if item_index is None:
+        item_index = ItemIndex(items)
+    flattened_triggers = _transitive_closures(
+        _strongly_connected_components(
+            items,
+            item_index,
+            get_edges=attrgetter('triggers'),
+        ),
+        attrgetter('triggers'),
+    )
+    for item in items:
+        item._flattened_triggers = flattened_triggers[item.id]
+    return items
 
 
-def _has_trigger_path(items, item, target_item_id):
+def _find_loop_in_component(component):
+    """
+    Given a strongly connected component, returns a list of item IDs
+    describing a loop through the first item of the component (or None
+    if the component does not contain a loop).
+    """
+    start = component[0]
+    if len(component) == 1 and start.id not in start._deps:
+        return None
+    members = {item.id: item for item in component}
+    # breadth-first search for the shortest way back to the start
+    previous = {}
+    unvisited = deque([start.id])
+    while unvisited:
+        item_id = unvisited.popleft()
+        for dep in members[item_id]._deps:
+            if dep == start.id:
+                loop = [start.id]
+                while item_id != start.id:
+                    loop.insert(1, item_id)
+                    item_id = previous[item_id]
+                loop.append(start.id)
+                return loop
+            if dep in members and dep not in previous:
+                previous[dep] = item_id
+                unvisited.append(dep)
+
+
+def find_dependency_loop(items):
+    """
+    Returns a list of item IDs describing a dependency loop among the
+    given items (e.g. ["a", "b", "a"]) or None if there is no loop.
+    Dependencies on items not in the given list are ignored.
+    """
+    item_index = ItemIndex(items)
+    for component in _strongly_connected_components(items, item_index, ignore_missing=True):
+        loop = _find_loop_in_component(component)
+        if loop:
+            return loop
+    return None
+
+
+def _strongly_connected_components(
+    items,
+    item_index,
+    ignore_missing=False,
+    get_edges=attrgetter('_deps'),
+):
+    """
+    Returns the strongly connected components of the dependency graph
+    of the given items as lists of items. Every component is listed
+    after all components it depends on.
+
+    get_edges can be used to follow something other than item._deps.
+
+    This is an iterative version of Tarjan's algorithm, so it won't
+    run into the recursion limit on long dependency chains.
+    """
+    indexes = {}
+    lowlinks = {}
+    stack = []
+    on_stack = set()
+    components = []
+
+    def visit(item):
+        indexes[item.id] = lowlinks[item.id] = len(indexes)
+        stack.append(item)
+        on_stack.add(item.id)
+        return (item, iter(get_edges(item)))
+
+    for root_item in items:
+        if root_item.id in indexes:
+            continue
+        path = [visit(root_item)]
+        while path:
+            item, deps = path[-1]
+            for dep in deps:
+                if dep not in indexes:
+                    try:
+                        dep_item = item_index.find(dep)
+                    except NoSuchItem:
+                        if ignore_missing:
+                            continue
+                        raise
+                    path.append(visit(dep_item))
+                    break
+                elif dep in on_stack:
+                    lowlinks[item.id] = min(lowlinks[item.id], indexes[dep])
+            else:
+                # all deps of this item have been visited
+                path.pop()
+                if path:
+                    parent_id = path[-1][0].id
+                    lowlinks[parent_id] = min(lowlinks[parent_id], lowlinks[item.id])
+                if lowlinks[item.id] == indexes[item.id]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member.id)
+                        component.append(member)
+                        if member.id == item.id:
+                            break
+                    component.reverse()
+                    components.append(component)
+    return components
+
+
+def _transitive_closures(components, get_edges):
+    """
+    Takes strongly connected components as returned by
+    _strongly_connected_components() and returns a dict mapping item
+    IDs to the set of all item IDs reachable from that item.
+    """
+    # components are sorted so that we already know the closures of
+    # every component our current component has edges to
+    closures = {}
+    component_positions = {}
+    for position, component in enumerate(components):
+        component_closure = set()
+        # Visiting edges from the most recently handled component
+        # backwards lets us skip every target that has already been
+        # brought in by another target (along with its own closure).
+        # Edges to other members of this component (i.e. loops) are
+        # not in closures yet and are simply added.
+        targets = set()
+        for item in component:
+            targets.update(get_edges(item))
+        for target in sorted(
+            targets,
+            key=lambda target: component_positions.get(target, position),
+            reverse=True,
+        ):
+            if target not in component_closure:
+                component_closure.add(target)
+                component_closure.update(closures.get(target, ()))
+        for item in component:
+            component_positions[item.id] = position
+            closures[item.id] = component_closure
+    return closures
+
+
+def _has_trigger_path(items, item, target_item_id, item_index=None):
     """
     Returns True if the given item directly or indirectly (trough
     other items) triggers the item with the given target item id.
     """
     if target_item_id in item.triggers:
         return True
+    try:
+        # precomputed by prepare_dependencies()
+        return target_item_id in item._flattened_triggers
+    except AttributeError:
+        pass
+    if item_index is None:
+        item_index = ItemIndex(items)
     for triggered_id in item.triggers:
-        triggered_item = find_item(triggered_id, items)
-        if _has_trigger_path(items, triggered_item, target_item_id):
+        triggered_item = item_index.find(triggered_id)
+        if _has_trigger_path(items, triggered_item, target_item_id, item_index=item_index):
             return True
     return False
 
@@ -168,11 +517,13 @@ def _inject_bundle_items(items):
     return list(bundle_items.values()) + items
 
 
-def _inject_canned_actions(items):
+def _inject_canned_actions(items, item_index=None):
     """
     Looks for canned actions like "svc_upstart:mysql:reload" in item
-    triggers and adds them to the list of items.
+    triggers and adds them to the list of items (and item_index).
     """
+    if item_index is None:
+        item_index = ItemIndex(items)
     added_actions = {}
     for item in items:
         for triggered_item_id in item.triggers:
@@ -189,7 +540,7 @@ def _inject_canned_actions(items):
             target_item_id = "{}:{}".format(type_name, item_name)
 
             try:
-                target_item = find_item(target_item_id, items)
+                target_item = item_index.find(target_item_id)
             except NoSuchItem:
                 raise BundleError(_(
                     "{item} in bundle '{bundle}' triggers unknown item '{target_item}'"
@@ -222,6 +573,8 @@ def _inject_canned_actions(items):
             action._prepare_deps(items)
             added_actions[triggered_item_id] = action
 
+    for action in added_actions.values():
+        item_index.add(action)
     return items + list(added_actions.values())
 
 
@@ -251,27 +604,31 @@ def _inject_concurrency_blockers(items):
             blocked_types,
             items,
         )
-        processed_items = []
-        for item in type_items:
+        # number of same-type deps each item (by position in
+        # type_items) is still waiting for
+        blocker_counts = []
+        # maps item IDs to the positions of items waiting for them
+        waiting_items = defaultdict(list)
+        for position, item in enumerate(type_items):
             # disregard deps to items of other types
-            item.__deps = list(filter(
+            same_type_deps = list(filter(
                 lambda dep: dep.split(":", 1)[0] in blocked_types,
                 item._flattened_deps,
             ))
+            blocker_counts.append(len(same_type_deps))
+            for dep in set(same_type_deps):
+                waiting_items[dep].append(position)
+
+        # Positions of items without same-type deps we haven't
+        # processed yet. The lowest one is chained next. Items left
+        # waiting at the end already have a dependency on another item
+        # of this type in their flattened deps.
+        ready_positions = [
+            position for position, count in enumerate(blocker_counts) if not count
+        ]
         previous_item = None
-        while len(processed_items) < len(type_items):
-            # find the first item without same-type deps we haven't
-            # processed yet
-            try:
-                item = list(filter(
-                    lambda item: not item.__deps and item not in processed_items,
-                    type_items,
-                ))[0]
-            except IndexError:
-                # this can happen if the flattened deps of all items of
-                # this type already contain a dependency on another
-                # item of this type
-                break
+        while ready_positions:
+            item = type_items[heappop(ready_positions)]
             if previous_item is not None:  # unless we're at the first item
                 # add dep to previous item -- unless it's already in there
                 if previous_item.id not in item._deps:
@@ -279,12 +636,10 @@ def _inject_concurrency_blockers(items):
                     item._concurrency_deps.append(previous_item.id)
                     item._flattened_deps.append(previous_item.id)
             previous_item = item
-            processed_items.append(item)
-            for other_item in type_items:
-                try:
-                    other_item.__deps.remove(item.id)
-                except ValueError:
-                    pass
+            for position in waiting_items[item.id]:
+                blocker_counts[position] -= 1
+                if not blocker_counts[position]:
+                    heappush(ready_positions, position)
     return items
 
 
@@ -311,11 +666,14 @@ def _inject_dummy_items(items):
     return list(dummy_items.values()) + items
 
 
-def _inject_reverse_dependencies(items):
+def _inject_reverse_dependencies(items, item_index=None):
     """
     Looks for 'needed_by' deps and creates standard dependencies
     accordingly.
     """
+    if item_index is None:
+        item_index = ItemIndex(items)
+
     def add_dep(item, dep):
         if dep not in item._deps:
             item._deps.append(dep)
@@ -341,35 +699,39 @@ def _inject_reverse_dependencies(items):
 
             # single items
             else:
-                depending_item = find_item(depending_item_id, items)
+                depending_item = item_index.find(depending_item_id)
                 add_dep(depending_item, item.id)
     return items
 
 
-def _inject_reverse_triggers(items):
+def _inject_reverse_triggers(items, item_index=None):
     """
     Looks for 'triggered_by' and 'precedes' attributes and turns them
     into standard triggers (defined on the opposing end).
     """
+    if item_index is None:
+        item_index = ItemIndex(items)
     for item in items:
         for triggering_item_id in item.triggered_by:
-            triggering_item = find_item(triggering_item_id, items)
+            triggering_item = item_index.find(triggering_item_id)
             triggering_item.triggers.append(item.id)
         for preceded_item_id in item.precedes:
-            preceded_item = find_item(preceded_item_id, items)
+            preceded_item = item_index.find(preceded_item_id)
             preceded_item.preceded_by.append(item.id)
     return items
 
 
-def _inject_trigger_dependencies(items):
+def _inject_trigger_dependencies(items, item_index=None):
     """
     Injects dependencies from all triggered items to their triggering
     items.
     """
+    if item_index is None:
+        item_index = ItemIndex(items)
     for item in items:
         for triggered_item_id in item.triggers:
             try:
-                triggered_item = find_item(triggered_item_id, items)
+                triggered_item = item_index.find(triggered_item_id)
             except NoSuchItem:
                 raise BundleError(_(
                     "unable to find definition of '{item1}' triggered "
@@ -394,11 +756,13 @@ def _inject_trigger_dependencies(items):
     return items
 
 
-def _inject_preceded_by_dependencies(items):
+def _inject_preceded_by_dependencies(items, item_index=None):
     """
     Injects dependencies from all triggering items to their
     preceded_by items and attaches triggering items to preceding items.
     """
+    if item_index is None:
+        item_index = ItemIndex(items)
     for item in items:
         if item.preceded_by and item.triggered:
             raise BundleError(_(
@@ -410,7 +774,7 @@ def _inject_preceded_by_dependencies(items):
             ))
         for triggered_item_id in item.preceded_by:
             try:
-                triggered_item = find_item(triggered_item_id, items)
+                triggered_item = item_index.find(triggered_item_id)
             except NoSuchItem:
                 raise BundleError(_(
                     "unable to find definition of '{item1}' preceding "
@@ -436,30 +800,47 @@ def _inject_preceded_by_dependencies(items):
     return items
 
 
-def prepare_dependencies(items):
+def prepare_dependencies(items, cache=None):
     """
-    Performs all dependency preprocessing on a list of items.
+    Performs all dependency preprocessing on a list of items. If a
+    DependencyCache is given, a previous result is reused or the new
+    one is stored in it.
     """
     items = list(items)
-
+    if cache is not None:
+        prepared_items = cache.load(items)
+        if prepared_items is not None:
+            return prepared_items
+        item_ids = set(item.id for item in items)
+    _check_duplicate_items(items)
+
+    # built once for the auto deps of all file, directory and symlink
+    # items
+    path_index = PathIndex(items)
     for item in items:
-        item._check_bundle_collisions(items)
-        item._prepare_deps(items)
+        item._prepare_deps(items, path_index=path_index)
 
     items = _inject_dummy_items(items)
     items = _inject_bundle_items(items)
-    items = _inject_canned_actions(items)
-    items = _inject_reverse_triggers(items)
-    items = _inject_reverse_dependencies(items)
-    items = _inject_trigger_dependencies(items)
-    items = _inject_preceded_by_dependencies(items)
-    items = _flatten_dependencies(items)
+
+    # built once and shared by all following passes
+    item_index = ItemIndex(items)
+
+    items = _inject_canned_actions(items, item_index=item_index)
+    items = _inject_reverse_triggers(items, item_index=item_index)
+    items = _inject_reverse_dependencies(items, item_index=item_index)
+    items = _inject_trigger_dependencies(items, item_index=item_index)
+    items = _inject_preceded_by_dependencies(items, item_index=item_index)
+    items = _flatten_dependencies(items, item_index=item_index)
+    items = _flatten_triggers(items, item_index=item_index)
     items = _inject_concurrency_blockers(items)
 
     for item in items:
         if item.ITEM_TYPE_NAME != 'dummy':
             item._check_redundant_dependencies()
 
+    if cache is not None:
+        cache.save(items, item_ids)
     return items
 
 
@@ -476,14 +857,25 @@ def remove_dep_from_items(items, dep):
     return items
 
 
-def remove_item_dependents(items, dep_item, skipped=False):
+def collect_item_dependents(dep_item, get_dependents, skipped=False, item_index=None):
     """
-    Removes the items depending on the given item from the list of items.
+    Returns all items that have to be removed from the queue because
+    they depend on the given item or on another removed item.
+
+    get_dependents(item) must return the queued items that depend on
+    the given item, in queue order.
+
+    Items that are triggered by the removed item (and dummy items, see
+    below) just drop their dependency on it instead of being removed.
     """
-    removed_items = []
-    for item in items:
-        if dep_item.id in item._deps:
-            if _has_trigger_path(items, dep_item, item.id):
+    removed_ids = set()
+
+    def remove_dependents_of(dep_item):
+        removed_items = []
+        for item in get_dependents(dep_item):
+            if item.id in removed_ids or dep_item.id not in item._deps:
+                continue
+            if _has_trigger_path((), dep_item, item.id, item_index=item_index):
                 # triggered items cannot be removed here since they
                 # may yet be triggered by another item and will be
                 # skipped anyway if they aren't
@@ -496,25 +888,57 @@ def remove_item_dependents(items, dep_item, skipped=False):
             else:
                 removed_items.append(item)
 
-    for item in removed_items:
-        items.remove(item)
+        for item in removed_items:
+            removed_ids.add(item.id)
 
-    if removed_items:
-        LOG.debug(
-            "skipped these items because they depend on {item}, which was "
-            "skipped previously: {skipped}".format(
-                item=dep_item.id,
-                skipped=", ".join([item.id for item in removed_items]),
+        if removed_items:
+            LOG.debug(
+                "skipped these items because they depend on {item}, which was "
+                "skipped previously: {skipped}".format(
+                    item=dep_item.id,
+                    skipped=", ".join([item.id for item in removed_items]),
+                )
             )
-        )
+        return removed_items
+
+    # depth-first, listing all direct dependents of an item before
+    # descending into the first of them
+    all_removed_items = remove_dependents_of(dep_item)
+    unvisited = [iter(list(all_removed_items))]
+    while unvisited:
+        try:
+            removed_item = next(unvisited[-1])
+        except StopIteration:
+            unvisited.pop()
+            continue
+        removed_items = remove_dependents_of(removed_item)
+        all_removed_items += removed_items
+        unvisited.append(iter(removed_items))
+    return all_removed_items
 
-    all_recursively_removed_items = []
-    for removed_item in removed_items:
-        items, recursively_removed_items = \
-            remove_item_dependents(items, removed_item, skipped=skipped)
-        all_recursively_removed_items += recursively_removed_items
 
-    return (items, removed_items + all_recursively_removed_items)
+def remove_item_dependents(items, dep_item, skipped=False, item_index=None):
+    """
+    Removes the items depending on the given item from the list of items.
+    """
+    if not items:
+        return (items, [])
+    if item_index is None:
+        item_index = ItemIndex(items)
+    dependents = defaultdict(list)
+    for item in items:
+        for dep in item._deps:
+            dependents[dep].append(item)
+
+    removed_items = collect_item_dependents(
+        dep_item,
+        lambda item: dependents[item.id],
+        skipped=skipped,
+        item_index=item_index,
+    )
+    removed_ids = set(item.id for item in removed_items)
+    items[:] = [item for item in items if item.id not in removed_ids]
+    return (items, removed_items)
 
 
 def split_items_without_deps(items):
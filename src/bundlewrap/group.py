@@ -75,16 +75,12 @@ class Group(object):
             metadata_processor = getattr(module, function_name)
             yield metadata_processor
 
-    @cached_property
+    @property
     def nodes(self):
         """
         List of all nodes in this group.
         """
-        result = []
-        result += list(self._nodes_from_static_members)
-        result += list(self._nodes_from_subgroups)
-        result += list(self._nodes_from_patterns)
-        return sorted(set(result))
+        return sorted(self.repo.group_membership.nodes_by_group[self.name])
 
     @property
     def _nodes_from_static_members(self):
@@ -1,26 +1,140 @@
+from collections import defaultdict
+from heapq import heapify, heappop, heappush
+from json import dumps, loads
+
 from .deps import (
-    find_item,
+    ItemIndex,
+    collect_item_dependents,
     prepare_dependencies,
-    remove_item_dependents,
-    remove_dep_from_items,
-    split_items_without_deps,
 )
 from .exceptions import NoSuchItem
-from .utils import LOG
+from .utils import LOG, write_cache_file
 from .utils.text import mark_for_translation as _
 
 
+def _critical_paths(items, dependents, durations=None):
+    """
+    Returns a dict mapping the ID of each item to the total weight of
+    the heaviest chain of items that can only be processed after it
+    (including the item itself).
+
+    Items weigh their duration if durations are given (items without a
+    known duration weigh the average of all known durations) or 1
+    otherwise. Dummy items weigh nothing. Items in a dependency loop or
+    with one among their dependents only weigh themselves.
+    """
+    if durations:
+        default_weight = sum(durations.values()) / len(durations)
+    else:
+        durations = {}
+        default_weight = 1
+
+    def weight(item):
+        if item.ITEM_TYPE_NAME == 'dummy':
+            return 0
+        return durations.get(item.id, default_weight)
+
+    items_by_id = {}
+    # number of dependents whose critical path is still unknown
+    unresolved = {}
+    for item in items:
+        items_by_id[item.id] = item
+        unresolved[item.id] = len(dependents[item.id])
+
+    critical_paths = {}
+    resolved = [item for item in items if unresolved[item.id] == 0]
+    while resolved:
+        item = resolved.pop()
+        critical_paths[item.id] = weight(item) + max(
+            [critical_paths[dependent.id] for dependent in dependents[item.id]] or [0]
+        )
+        for dep in item._deps:
+            if dep in unresolved:
+                unresolved[dep] -= 1
+                if unresolved[dep] == 0:
+                    resolved.append(items_by_id[dep])
+
+    for item in items:
+        if item.id not in critical_paths:
+            critical_paths[item.id] = weight(item)
+    return critical_paths
+
+
 class ItemQueue(object):
-    def __init__(self, items):
-        self.items_with_deps = prepare_dependencies(items)
-        self.items_without_deps = []
-        self._split()
+    """
+    Hands out items in an order that satisfies their dependencies.
+
+    Every item keeps the IDs of the items it is still waiting for in
+    item._deps. Finishing an item only touches the items depending on
+    it (found via reverse edges), those left without dependencies are
+    moved to items_without_deps.
+
+    Among the items without dependencies, those with the longest chain
+    of items waiting for them are handed out first. Chains are measured
+    in items or, if an ItemDurations store is given, in the durations
+    recorded for the items.
+    """
+    def __init__(self, items, cache=None, durations=None):
+        items = prepare_dependencies(items, cache=cache)
+        # original position of each item, used to keep the order in
+        # which items are handed out stable
+        self._positions = {}
+        # maps item IDs to the items depending on them
+        self._dependents = defaultdict(list)
+        # items still waiting for dependencies, keyed by ID
+        self._waiting = {}
+        # heap of (-critical path, -sequence, item) for all items
+        # without dependencies
+        self._ready = []
+        for position, item in enumerate(items):
+            self._positions[item.id] = position
+            item._deps = set(item._deps)
+            for dep in item._deps:
+                self._dependents[dep].append(item)
+            if item._deps:
+                self._waiting[item.id] = item
+        self._critical_paths = _critical_paths(
+            items,
+            self._dependents,
+            None if durations is None else durations.load(),
+        )
+        # among items with equally long critical paths, the last
+        # initially available item is handed out first and items
+        # becoming available later on are handed out after all
+        # previously available items
+        self._sequence = 0
+        for position, item in enumerate(items):
+            if not item._deps:
+                self._ready.append(self._heap_entry(item, position))
+        heapify(self._ready)
         self.pending_items = []
+        # all items still queued or pending
+        self.item_index = ItemIndex(items)
 
     @property
     def all_items(self):
         return self.items_with_deps + self.items_without_deps
 
+    @property
+    def items_with_deps(self):
+        return self._sorted(self._waiting.values())
+
+    @property
+    def has_ready_items(self):
+        """
+        True if there are items available for processing. Unlike
+        items_without_deps, this does not sort them.
+        """
+        return bool(self._ready)
+
+    @property
+    def items_without_deps(self):
+        """
+        All items available for processing in the order pop() will
+        consider them.
+        """
+        return [entry[-1] for entry in sorted(self._ready)]
+
     def item_failed(self, item):
         """
         Called when an item could not be fixed. Yields all items that
@@ -35,19 +149,22 @@ class ItemQueue(object):
         """
         self.item_ok(item)
         self._fire_triggers_for_item(item)
+        # fixing an item (or running an action) may have side effects
+        # on any other item on the node (e.g. a package installing a
+        # file), so statuses prefetched before can no longer be trusted
+        for queued_item in self.all_items:
+            if queued_item.ITEM_TYPE_NAME != 'dummy':
+                queued_item._invalidate_cached_status()
 
     def item_ok(self, item):
         """
         Called when an item didn't need to be fixed.
         """
         self.pending_items.remove(item)
+        self.item_index.remove(item)
         # if an item is applied successfully, all dependencies on it can
         # be removed from the remaining items
-        self.items_with_deps = remove_dep_from_items(
-            self.items_with_deps,
-            item.id,
-        )
-        self._split()
+        self._remove_dep(item)
 
     def item_skipped(self, item, _skipped=True):
         """
@@ -55,14 +172,26 @@ class ItemQueue(object):
         been skipped as a result by cascading.
         """
         self.pending_items.remove(item)
+        self.item_index.remove(item)
         if item.cascade_skip:
             # if an item fails or is skipped, all items that depend on
             # it shall be removed from the queue
-            self.items_with_deps, skipped_items = remove_item_dependents(
-                self.items_with_deps,
+            skipped_items = collect_item_dependents(
                 item,
+                self._waiting_dependents,
                 skipped=_skipped,
+                item_index=self.item_index,
             )
+            for skipped_item in skipped_items:
+                del self._waiting[skipped_item.id]
+                self.item_index.remove(skipped_item)
+            # some dependents may have just lost their last dependency
+            # because they are triggered by the skipped item
+            self._enqueue_ready([
+                dependent
+                for dep_item in [item] + skipped_items
+                for dependent in self._dependents[dep_item.id]
+            ])
             # since we removed them from further processing, we
             # fake the status of the removed items so they still
             # show up in the result statistics
@@ -71,44 +200,42 @@ class ItemQueue(object):
                     continue
                 yield skipped_item
         else:
-            self.items_with_deps = remove_dep_from_items(
-                self.items_with_deps,
-                item.id,
-            )
-        self._split()
+            self._remove_dep(item)
+
+    def item_precedes_skipped(self, item):
+        """
+        Called when an item preceding other items was handed out by
+        pop(check_precedes=False) and turned out not to be needed.
+        """
+        self.pending_items.remove(item)
+        self._skip_preceding(item)
 
-    def pop(self, interactive=False):
+    def pop(self, interactive=False, check_precedes=True):
         """
         Gets the next item available for processing and moves it into
         self.pending_items. Will raise IndexError if no item is
         available. Otherwise, it will return the item and a list of
         items that have been skipped while looking for the item.
+
+        Whether an item preceding other items has to run at all depends
+        on the status of those items on the node. With check_precedes
+        set to False, pop() will not look at the node and leaves this
+        to the caller, who must report unneeded items using
+        item_precedes_skipped().
         """
         skipped_items = []
 
-        if not self.items_without_deps:
+        if not self._ready:
             raise IndexError
 
-        while self.items_without_deps:
-            item = self.items_without_deps.pop()
+        while self._ready:
+            item = heappop(self._ready)[-1]
 
-            if item._precedes_items:
+            if item._precedes_items and check_precedes:
                 if item._precedes_incorrect_item(interactive=interactive):
                     item.has_been_triggered = True
                 else:
-                    # we do not have to cascade here at all because
-                    # all chained preceding items will be skipped by
-                    # this same mechanism
-                    LOG.debug(
-                        _("skipping {node}:{bundle}:{item} because its precede trigger "
-                          "did not fire").format(
-                            bundle=item.bundle.name,
-                            item=item.id,
-                            node=item.node.name,
-                        ),
-                    )
-                    self.items_with_deps = remove_dep_from_items(self.items_with_deps, item.id)
-                    self._split()
+                    self._skip_preceding(item)
                     skipped_items.append(item)
                     item = None
                     continue
@@ -117,13 +244,24 @@ class ItemQueue(object):
         self.pending_items.append(item)
         return (item, skipped_items)
 
+    def _skip_preceding(self, item):
+        # we do not have to cascade here at all because all chained
+        # preceding items will be skipped by this same mechanism
+        LOG.debug(
+            _("skipping {node}:{bundle}:{item} because its precede trigger "
+              "did not fire").format(
+                bundle=item.bundle.name,
+                item=item.id,
+                node=item.node.name,
+            ),
+        )
+        self._remove_dep(item)
+        self.item_index.remove(item)
+
     def _fire_triggers_for_item(self, item):
         for triggered_item_id in item.triggers:
             try:
-                triggered_item = find_item(
-                    triggered_item_id,
-                    self.all_items,
-                )
+                triggered_item = self.item_index.find(triggered_item_id)
                 triggered_item.has_been_triggered = True
             except NoSuchItem:
                 LOG.debug(_(
@@ -134,6 +272,73 @@ class ItemQueue(object):
                     triggered_item=triggered_item_id,
                 ))
 
-    def _split(self):
-        self.items_with_deps, self.items_without_deps = \
-            split_items_without_deps(self.all_items)
+    def _waiting_dependents(self, item):
+        return [
+            dependent for dependent in self._dependents[item.id]
+            if dependent.id in self._waiting
+        ]
+
+    def _enqueue_ready(self, items):
+        """
+        Moves all given items that no longer have any dependencies from
+        waiting to items_without_deps.
+        """
+        ready_items = []
+        for item in items:
+            if not item._deps and item.id in self._waiting:
+                del self._waiting[item.id]
+                ready_items.append(item)
+        ready_items = self._sorted(ready_items)
+        self._sequence -= len(ready_items)
+        for index, item in enumerate(ready_items):
+            heappush(self._ready, self._heap_entry(item, self._sequence + index))
+
+    def _heap_entry(self, item, sequence):
+        # the sequence number is unique, so items are never compared
+        return (-self._critical_paths[item.id], -sequence, item)
+
+    def _remove_dep(self, dep_item):
+        """
+        Removes the given item from the dependencies of all items
+        waiting for it.
+        """
+        dependents = self._dependents[dep_item.id]
+        for dependent in dependents:
+            if dependent.id in self._waiting:
+                dependent._deps.discard(dep_item.id)
+        self._enqueue_ready(dependents)
+
+    def _sorted(self, items):
+        return sorted(items, key=lambda item: self._positions[item.id])
+
+
+class ItemDurations(object):
+    """
+    Stores how long processing each item of a node took in a JSON file,
+    so following runs can prioritize items by their durations.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """
+        Returns a dict mapping item IDs to durations in seconds.
+        """
+        try:
+            with open(self.path) as f:
+                durations = loads(f.read())
+            return {
+                item_id: float(duration)
+                for item_id, duration in durations.items()
+            }
+        except (AttributeError, IOError, OSError, TypeError, ValueError):
+            return {}
+
+    def save(self, durations):
+        """
+        Adds the given durations (a dict mapping item IDs to seconds) to
+        those previously stored.
+        """
+        stored_durations = self.load()
+        stored_durations.update(durations)
+        write_cache_file(self.path, dumps(stored_durations))
@@ -4,6 +4,7 @@ Note that modules in this package have to use absolute imports because
 Repository.item_classes loads them as files.
 """
 from __future__ import unicode_literals
+from collections import Counter
 from copy import copy
 from datetime import datetime
 from os.path import join
@@ -29,16 +30,20 @@ ITEM_CLASSES = {}
 ITEM_CLASSES_LOADED = False
 
 
-def unpickle_item_class(class_name, bundle, name, attributes, has_been_triggered):
+def unpickle_item_class(class_name, bundle, name, attributes, has_been_triggered,
+                        cached_status=None):
     for item_class in bundle.node.repo.item_classes:
         if item_class.__name__ == class_name:
-            return item_class(
+            item = item_class(
                 bundle,
                 name,
                 attributes,
                 has_been_triggered=has_been_triggered,
                 skip_validation=True,
             )
+            if cached_status is not None:
+                item._set_cached_status(cached_status)
+            return item
     raise RuntimeError(_("unable to unpickle {cls}").format(cls=class_name))
 
 
@@ -146,40 +151,31 @@ class Item(object):
                 self.name,
                 attrs,
                 self.has_been_triggered,
+                # a status prefetched by get_status_bulk() in the parent
+                # process must survive the trip to the worker process
+                getattr(self, '_cache', {}).get('cached_status'),
             ),
         )
 
     def __repr__(self):
         return "<Item {}>".format(self.id)
 
-    def _check_bundle_collisions(self, items):
-        for item in items:
-            if item == self:
-                continue
-            if item.id == self.id:
-                raise BundleError(_(
-                    "duplicate definition of {item} in bundles '{bundle1}' and '{bundle2}'"
-                ).format(
-                    item=item.id,
-                    bundle1=item.bundle.name,
-                    bundle2=self.bundle.name,
-                ))
-
     def _check_redundant_dependencies(self):
         """
         Alerts the user if they have defined a redundant dependency
         (such as settings 'needs' on a triggered item pointing to the
         triggering item).
         """
-        for dep in self._deps:
-            if self._deps.count(dep) > 1:
-                raise BundleError(_(
-                    "redundant dependency of {item1} in bundle '{bundle}' on {item2}".format(
-                        bundle=self.bundle.name,
-                        item1=self.id,
-                        item2=dep,
-                    ),
-                ))
+        dep_counts = Counter(self._deps)
+        redundant_deps = [dep for dep in dep_counts if dep_counts[dep] > 1]
+        if redundant_deps:
+            raise BundleError(_(
+                "redundant dependency of {item1} in bundle '{bundle}' on {item2}".format(
+                    bundle=self.bundle.name,
+                    item1=self.id,
+                    item2=", ".join(sorted(redundant_deps)),
+                ),
+            ))
 
     @cached_property
     def cached_status(self):
@@ -193,6 +189,20 @@ class Item(object):
         else:
             return False
 
+    def _invalidate_cached_status(self):
+        """
+        Forgets the cached status (e.g. because it was prefetched and
+        might have been changed by fixing another item since).
+        """
+        cache = getattr(self, '_cache', {})
+        cache.pop('cached_status', None)
+        cache.pop('cached_unless_result', None)
+
+    def _set_cached_status(self, status):
+        if not hasattr(self, '_cache'):
+            self._cache = {}
+        self._cache['cached_status'] = status
+
     def _precedes_incorrect_item(self, interactive=False):
         """
         Returns True if this item precedes another and the triggering
@@ -212,11 +222,18 @@ class Item(object):
                 return True
         return not self.cached_status.correct
 
-    def _prepare_deps(self, items):
+    def _get_auto_deps(self, items, path_index):
+        """
+        Like get_auto_deps(), but item types dealing with paths may use
+        the given PathIndex (or None) instead of looking at all items.
+        """
+        return self.get_auto_deps(items)
+
+    def _prepare_deps(self, items, path_index=None):
         # merge static and user-defined deps
         self._deps = list(self.NEEDS_STATIC)
         self._deps += self.needs
-        self._deps += list(self.get_auto_deps(items))
+        self._deps += list(self._get_auto_deps(items, path_index))
 
     @classmethod
     def _validate_attribute_names(cls, bundle, item_id, attributes):
@@ -373,6 +390,22 @@ class Item(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def get_status_bulk(cls, items):
+        """
+        Given a list of items of this type on the same node, determines
+        their status more efficiently than calling get_status() for each
+        of them (e.g. using a single node.run_many()) and stores the
+        result using item._set_cached_status(). Items left without a
+        cached status will fall back to get_status().
+
+        Item types using the same implementation (see files, directories
+        and symlinks) will receive their items in a single call.
+
+        MAY be overridden by subclasses.
+        """
+        pass
+
     def patch_attributes(self, attributes):
         """
         Allows an item to preprocess the attributes it is initialized
@@ -2,7 +2,8 @@
 from __future__ import unicode_literals
 
 from collections import defaultdict
-from os.path import normpath
+from operator import itemgetter
+from os.path import dirname, normpath
 from pipes import quote
 
 from bundlewrap.exceptions import BundleError
@@ -10,7 +11,7 @@ from bundlewrap.items import Item, ItemStatus
 from bundlewrap.utils import LOG
 from bundlewrap.utils.remote import PathInfo
 from bundlewrap.utils.text import mark_for_translation as _
-from bundlewrap.utils.text import bold, is_subdirectory
+from bundlewrap.utils.text import bold
 
 
 def validator_mode(item_id, value):
@@ -30,6 +31,96 @@ def validator_mode(item_id, value):
             "mode for {item} should be three or four digits long, was: '{value}'"
         ).format(item=item_id, value=value))
 
+
+class PathIndex(object):
+    """
+    Indexes file, directory and symlink items by path, so the items
+    located at or above a certain path can be found without looking at
+    every item.
+    """
+    def __init__(self, items):
+        # maps paths to (position, item) tuples, position being the
+        # index of the item in the given list
+        self._items_by_path = defaultdict(list)
+        for position, item in enumerate(items):
+            if item.ITEM_TYPE_NAME in ("directory", "file", "symlink"):
+                self._items_by_path[normpath(item.name)].append((position, item))
+
+    def items_above(self, path):
+        """
+        Returns (position, item) tuples for all items located in any
+        parent directory of the given path.
+        """
+        path = normpath(path)
+        if not path.startswith("/"):
+            raise ValueError(_("directory paths must be absolute"))
+        found = []
+        # normpath() keeps a leading "//", so we can't just walk up
+        # until we reach "/"
+        while dirname(path) != path:
+            path = dirname(path)
+            found.extend(self._items_by_path.get(path, ()))
+        return found
+
+    def items_at(self, path):
+        """
+        Returns (position, item) tuples for all items located at the
+        given path.
+        """
+        return list(self._items_by_path.get(normpath(path), ()))
+
+
+def get_path_auto_deps(path_item, items, path_index, colliding_types=()):
+    """
+    Implementation of get_auto_deps() shared by files, directories and
+    symlinks. Returns the IDs of all directories and symlinks above the
+    given item's path. Raises BundleError if a file is in the way or
+    an item of one of the given colliding types has the same path.
+    """
+    if path_index is None:
+        path_index = PathIndex(items)
+    items_above = path_index.items_above(path_item.name)
+
+    blocking_items = [
+        (position, item) for position, item in items_above
+        if item.ITEM_TYPE_NAME == "file"
+    ] + [
+        (position, item) for position, item in path_index.items_at(path_item.name)
+        if item is not path_item and item.ITEM_TYPE_NAME in colliding_types
+    ]
+    if blocking_items:
+        # report the same item a linear search through all items would
+        item = min(blocking_items, key=itemgetter(0))[1]
+        raise BundleError(_(
+            "{item1} (from bundle '{bundle1}') blocking path to "
+            "{item2} (from bundle '{bundle2}')"
+        ).format(
+            item1=item.id,
+            bundle1=item.bundle.name,
+            item2=path_item.id,
+            bundle2=path_item.bundle.name,
+        ))
+
+    return [
+        item.id for position, item in sorted(items_above, key=itemgetter(0))
+        if item.ITEM_TYPE_NAME in ("directory", "symlink")
+    ]
+
+
+def get_path_status_bulk(cls, items):
+    """
+    Implementation of get_status_bulk() shared by files, directories
+    and symlinks. Probes the paths of all given items with a single
+    command.
+    """
+    path_infos = PathInfo.bulk(
+        items[0].node,
+        {item.name: item._expected_content_size for item in items},
+    )
+    for item in items:
+        item._set_cached_status(item._status_for(path_infos[item.name]))
+
+
 ATTRIBUTE_VALIDATORS = defaultdict(lambda: lambda id, value: None)
 ATTRIBUTE_VALIDATORS.update({
     'mode': validator_mode,
@@ -150,38 +241,31 @@ class Directory(Item):
             self._fix_owner(status)
 
     def get_auto_deps(self, items):
-        deps = []
-        for item in items:
-            if item == self:
-                continue
-            if (
-                (
-                    item.ITEM_TYPE_NAME == "file" and
-                    is_subdirectory(item.name, self.name)
-                )
-                or
-                (
-                    item.ITEM_TYPE_NAME in ("file", "symlink") and
-                    item.name == self.name
-                )
-            ):
-                raise BundleError(_(
-                    "{item1} (from bundle '{bundle1}') blocking path to "
-                    "{item2} (from bundle '{bundle2}')"
-                ).format(
-                    item1=item.id,
-                    bundle1=item.bundle.name,
-                    item2=self.id,
-                    bundle2=self.bundle.name,
-                ))
-            elif item.ITEM_TYPE_NAME in ("directory", "symlink"):
-                if is_subdirectory(item.name, self.name):
-                    deps.append(item.id)
-        return deps
+        return self._get_auto_deps(items, None)
+
+    def _get_auto_deps(self, items, path_index):
+        return get_path_auto_deps(
+            self,
+            items,
+            path_index,
+            colliding_types=("file", "symlink"),
+        )
+
+    # files, directories and symlinks share a single bulk probe
+    get_status_bulk = classmethod(get_path_status_bulk)
+
+    # directories have no content to hash
+    _expected_content_size = None
 
     def get_status(self):
+        return self._status_for(PathInfo(
+            self.node,
+            self.name,
+            expected_size=self._expected_content_size,
+        ))
+
+    def _status_for(self, path_info):
         correct = True
-        path_info = PathInfo(self.node, self.name)
         status_info = {'needs_fixing': [], 'path_info': path_info}
 
         if not path_info.is_directory:
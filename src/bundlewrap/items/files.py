@@ -5,7 +5,7 @@ from collections import defaultdict
 from datetime import datetime
 from difflib import unified_diff
 from os import remove
-from os.path import dirname, exists, join, normpath
+from os.path import dirname, exists, getsize, join, normpath
 from pipes import quote
 from subprocess import call
 from sys import exc_info
@@ -14,11 +14,15 @@ from traceback import format_exception
 
 from bundlewrap.exceptions import BundleError, TemplateError
 from bundlewrap.items import BUILTIN_ITEM_ATTRIBUTES, Item, ItemStatus
-from bundlewrap.items.directories import validator_mode
+from bundlewrap.items.directories import (
+    get_path_auto_deps,
+    get_path_status_bulk,
+    validator_mode,
+)
 from bundlewrap.utils import cached_property, hash_local_file, LOG, sha1
 from bundlewrap.utils.remote import PathInfo
 from bundlewrap.utils.text import force_text, mark_for_translation as _
-from bundlewrap.utils.text import bold, green, is_subdirectory, red
+from bundlewrap.utils.text import bold, green, red
 
 
 DIFF_MAX_FILE_SIZE = 1024 * 1024 * 5  # bytes
@@ -390,25 +394,34 @@ class File(Item):
             self._fix_content(status)
 
     def get_auto_deps(self, items):
-        deps = []
-        for item in items:
-            if item.ITEM_TYPE_NAME == "file" and is_subdirectory(item.name, self.name):
-                raise BundleError(_(
-                    "{item1} (from bundle '{bundle1}') blocking path to "
-                    "{item2} (from bundle '{bundle2}')"
-                ).format(
-                    item1=item.id,
-                    bundle1=item.bundle.name,
-                    item2=self.id,
-                    bundle2=self.bundle.name,
-                ))
-            elif item.ITEM_TYPE_NAME in ("directory", "symlink"):
-                if is_subdirectory(item.name, self.name):
-                    deps.append(item.id)
-        return deps
+        return self._get_auto_deps(items, None)
+
+    def _get_auto_deps(self, items, path_index):
+        return get_path_auto_deps(self, items, path_index)
+
+    get_status_bulk = classmethod(get_path_status_bulk)
+
+    @property
+    def _expected_content_size(self):
+        """
+        Size of the content this file should have. Remote files of a
+        different size cannot match and need not be hashed.
+        """
+        if self.attributes['delete'] or self.attributes['content_type'] == 'any':
+            return None
+        elif self.attributes['content_type'] == 'binary':
+            return getsize(self.template)
+        else:
+            return len(self.content)
 
     def get_status(self):
-        path_info = PathInfo(self.node, self.name)
+        return self._status_for(PathInfo(
+            self.node,
+            self.name,
+            expected_size=self._expected_content_size,
+        ))
+
+    def _status_for(self, path_info):
         status_info = {'needs_fixing': [], 'path_info': path_info}
 
         if not path_info.is_file:
@@ -16,17 +16,22 @@ def pkg_install(node, pkgname):
                     "install {}".format(quote(pkgname)))
 
 
-def pkg_installed(node, pkgname):
-    result = node.run(
-        "dpkg -s {} | grep '^Status: '".format(quote(pkgname)),
-        may_fail=True,
-    )
+def _pkg_installed_command(pkgname):
+    return "dpkg -s {} | grep '^Status: '".format(quote(pkgname))
+
+
+def _pkg_installed_from_result(result):
     if result.return_code != 0 or " installed" not in result.stdout_text:
         return False
     else:
         return True
 
 
+def pkg_installed(node, pkgname):
+    result = node.run(_pkg_installed_command(pkgname), may_fail=True)
+    return _pkg_installed_from_result(result)
+
+
 def pkg_remove(node, pkgname):
     return node.run("DEBIAN_FRONTEND=noninteractive "
                     "apt-get -qy purge {}".format(quote(pkgname)))
@@ -77,7 +82,18 @@ class AptPkg(Item):
             pkg_install(self.node, self.name)
 
     def get_status(self):
-        install_status = pkg_installed(self.node, self.name)
+        return self._status_for(pkg_installed(self.node, self.name))
+
+    @classmethod
+    def get_status_bulk(cls, items):
+        results = items[0].node.run_many(
+            [_pkg_installed_command(item.name) for item in items],
+            may_fail=True,
+        )
+        for item, result in zip(items, results):
+            item._set_cached_status(item._status_for(_pkg_installed_from_result(result)))
+
+    def _status_for(self, install_status):
         item_status = (install_status == self.attributes['installed'])
         return ItemStatus(
             correct=item_status,
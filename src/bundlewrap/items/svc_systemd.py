@@ -14,17 +14,22 @@ def svc_start(node, svcname):
     return node.run("systemctl start -- {}".format(quote(svcname)))
 
 
-def svc_running(node, svcname):
-    result = node.run(
-        "systemctl status -- {}".format(quote(svcname)),
-        may_fail=True,
-    )
+def _svc_running_command(svcname):
+    return "systemctl status -- {}".format(quote(svcname))
+
+
+def _svc_running_from_result(result):
     if result.return_code != 0:
         return False
     else:
         return True
 
 
+def svc_running(node, svcname):
+    result = node.run(_svc_running_command(svcname), may_fail=True)
+    return _svc_running_from_result(result)
+
+
 def svc_stop(node, svcname):
     return node.run("systemctl stop -- {}".format(quote(svcname)))
 
@@ -91,7 +96,18 @@ class SvcSystemd(Item):
         }
 
     def get_status(self):
-        service_running = svc_running(self.node, self.name)
+        return self._status_for(svc_running(self.node, self.name))
+
+    @classmethod
+    def get_status_bulk(cls, items):
+        results = items[0].node.run_many(
+            [_svc_running_command(item.name) for item in items],
+            may_fail=True,
+        )
+        for item, result in zip(items, results):
+            item._set_cached_status(item._status_for(_svc_running_from_result(result)))
+
+    def _status_for(self, service_running):
         item_status = (service_running == self.attributes['running'])
         return ItemStatus(
             correct=item_status,
@@ -7,10 +7,11 @@ from pipes import quote
 
 from bundlewrap.exceptions import BundleError
 from bundlewrap.items import Item, ItemStatus
+from bundlewrap.items.directories import get_path_auto_deps, get_path_status_bulk
 from bundlewrap.utils import LOG
 from bundlewrap.utils.remote import PathInfo
 from bundlewrap.utils.text import mark_for_translation as _
-from bundlewrap.utils.text import bold, is_subdirectory
+from bundlewrap.utils.text import bold
 
 
 ATTRIBUTE_VALIDATORS = defaultdict(lambda: lambda id, value: None)
@@ -135,31 +136,30 @@ class Symlink(Item):
             self._fix_owner(status)
 
     def get_auto_deps(self, items):
-        deps = []
-        for item in items:
-            if item == self:
-                continue
-            if item.ITEM_TYPE_NAME == "file" and (
-                is_subdirectory(item.name, self.name) or
-                item.name == self.name
-            ):
-                raise BundleError(_(
-                    "{item1} (from bundle '{bundle1}') blocking path to "
-                    "{item2} (from bundle '{bundle2}')"
-                ).format(
-                    item1=item.id,
-                    bundle1=item.bundle.name,
-                    item2=self.id,
-                    bundle2=self.bundle.name,
-                ))
-            elif item.ITEM_TYPE_NAME in ("directory", "symlink"):
-                if is_subdirectory(item.name, self.name):
-                    deps.append(item.id)
-        return deps
+        return self._get_auto_deps(items, None)
+
+    def _get_auto_deps(self, items, path_index):
+        return get_path_auto_deps(
+            self,
+            items,
+            path_index,
+            colliding_types=("file",),
+        )
+
+    get_status_bulk = classmethod(get_path_status_bulk)
+
+    # symlinks have no content to hash
+    _expected_content_size = None
 
     def get_status(self):
+        return self._status_for(PathInfo(
+            self.node,
+            self.name,
+            expected_size=self._expected_content_size,
+        ))
+
+    def _status_for(self, path_info):
         correct = True
-        path_info = PathInfo(self.node, self.name)
         status_info = {'needs_fixing': [], 'path_info': path_info}
 
         if not path_info.is_symlink:
@@ -1,19 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from copy import deepcopy
 from datetime import datetime, timedelta
 from getpass import getuser
+from heapq import heapify, heappop, heappush
 import json
 from os import environ, remove
+from os.path import join
 from pipes import quote
 from socket import gethostname
 from tempfile import mkstemp
 from time import time
 
-from . import operations
+from . import operations, VERSION_STRING
 from .bundle import Bundle
-from .concurrency import WorkerPool
+from .concurrency import get_worker_pool, ThreadWorkerPool
 from .deps import (
+    DependencyCache,
+    find_dependency_loop,
     find_item,
     prepare_dependencies,
 )
@@ -22,16 +27,22 @@ from .exceptions import (
     NodeAlreadyLockedException,
     NoSuchBundle,
     RepositoryError,
+    WorkerException,
 )
-from .itemqueue import ItemQueue
+from .itemqueue import ItemDurations, ItemQueue
 from .items import Item
-from .utils import cached_property, LOG, graph_for_items, merge_dict, names, STDOUT_WRITER
+from .utils import cached_property, LOG, graph_for_items, merge_dict, names, sha1, STDOUT_WRITER
 from .utils.text import force_text, mark_for_translation as _
 from .utils.text import bold, green, red, validate_name, yellow
 from .utils.ui import ask_interactively
 
+DEPS_CACHE_ENV = 'BWDEPSCACHE'
+DURATIONS_ENV = 'BWDURATIONS'
 LOCK_PATH = "/tmp/bundlewrap.lock"
 LOCK_FILE = LOCK_PATH + "/info"
+# number of nodes apply_nodes() may start in addition to node_workers
+# to keep threads busy while the other nodes have no items ready
+NODE_OVERSHOOT = 2
 
 
 class ApplyResult(object):
@@ -94,9 +105,65 @@ def handle_apply_result(node, item, status_code, interactive):
                 LOG.info(formatted_result)
 
 
+def _item_finished(node, item_queue, item, status_code, duration, interactive):
+    """
+    Updates item_queue after item has been processed and returns the
+    results of that item and of all items skipped because of it.
+    """
+    if status_code == Item.STATUS_FAILED:
+        results = _items_skipped(node, item_queue.item_failed(item), interactive)
+    elif status_code in (Item.STATUS_FIXED, Item.STATUS_ACTION_SUCCEEDED):
+        item_queue.item_fixed(item)
+        results = []
+    elif status_code == Item.STATUS_OK:
+        item_queue.item_ok(item)
+        results = []
+    elif status_code == Item.STATUS_SKIPPED:
+        results = _items_skipped(node, item_queue.item_skipped(item), interactive)
+    else:
+        raise AssertionError(_(
+            "unknown item status return for {item}: {status}".format(
+                item=item.id,
+                status=repr(status_code),
+            ),
+        ))
+
+    handle_apply_result(node, item, status_code, interactive)
+    if item.ITEM_TYPE_NAME != 'dummy':
+        results.append((item.id, status_code, duration))
+    return results
+
+
+def _save_item_durations(node, item_results):
+    """
+    Records how long it took to apply each item that hasn't been
+    skipped.
+    """
+    durations = {
+        item_id: duration.total_seconds()
+        for item_id, status_code, duration in item_results
+        if status_code != Item.STATUS_SKIPPED
+    }
+    if durations and node.item_durations is not None:
+        node.item_durations.save(durations)
+
+
+def _items_skipped(node, skipped_items, interactive):
+    results = []
+    for skipped_item in skipped_items:
+        handle_apply_result(node, skipped_item, Item.STATUS_SKIPPED, interactive)
+        results.append((skipped_item.id, Item.STATUS_SKIPPED, timedelta(0)))
+    return results
+
+
 def apply_items(node, workers=1, interactive=False, profiling=False):
-    item_queue = ItemQueue(node.items)
-    with WorkerPool(workers=workers) as worker_pool:
+    item_queue = ItemQueue(
+        node.items,
+        cache=node.dependency_cache,
+        durations=node.item_durations,
+    )
+    prefetch_status(item_queue.all_items)
+    with get_worker_pool(workers=workers) as worker_pool:
         # This whole thing is set in motion because every worker
         # initially asks for work. He also reports back when he finished
         # a job. Actually, all these conditions are internal to
@@ -117,9 +184,8 @@ def apply_items(node, workers=1, interactive=False, profiling=False):
                         # quit() decreases workers_alive.
                         worker_pool.quit(msg['wid'])
                 else:
-                    for skipped_item in skipped_items:
-                        handle_apply_result(node, skipped_item, Item.STATUS_SKIPPED, interactive)
-                        yield(skipped_item.id, Item.STATUS_SKIPPED, timedelta(0))
+                    for result in _items_skipped(node, skipped_items, interactive):
+                        yield result
 
                     # start_task() increases jobs_open.
                     worker_pool.start_task(
@@ -135,38 +201,30 @@ def apply_items(node, workers=1, interactive=False, profiling=False):
 
                 # The task's id is the item we just processed.
                 item_id = msg['task_id']
-                item = find_item(item_id, item_queue.pending_items)
-
-                status_code = msg['return_value']
-
-                if status_code == Item.STATUS_FAILED:
-                    for skipped_item in item_queue.item_failed(item):
-                        handle_apply_result(node, skipped_item, Item.STATUS_SKIPPED, interactive)
-                        yield(skipped_item.id, Item.STATUS_SKIPPED, timedelta(0))
-                elif status_code in (Item.STATUS_FIXED, Item.STATUS_ACTION_SUCCEEDED):
-                    item_queue.item_fixed(item)
-                elif status_code == Item.STATUS_OK:
-                    item_queue.item_ok(item)
-                elif status_code == Item.STATUS_SKIPPED:
-                    for skipped_item in item_queue.item_skipped(item):
-                        handle_apply_result(node, skipped_item, Item.STATUS_SKIPPED, interactive)
-                        yield(skipped_item.id, Item.STATUS_SKIPPED, timedelta(0))
-                else:
-                    raise AssertionError(_(
-                        "unknown item status return for {item}: {status}".format(
-                            item=item.id,
-                            status=repr(status_code),
-                        ),
-                    ))
-
-                handle_apply_result(node, item, status_code, interactive)
-                if item.ITEM_TYPE_NAME != 'dummy':
-                    yield (item.id, status_code, msg['duration'])
+                item = item_queue.item_index.find(item_id)
+
+                for result in _item_finished(
+                    node,
+                    item_queue,
+                    item,
+                    msg['return_value'],
+                    msg['duration'],
+                    interactive,
+                ):
+                    yield result
 
                 # Finally, we have a new job queue. Thus, tell all idle
                 # workers to ask for work again.
                 worker_pool.activate_idle_workers()
 
+    _check_for_dependency_loop(node, item_queue)
+
+
+def _check_for_dependency_loop(node, item_queue):
+    """
+    Raises ItemDependencyError if items are left in item_queue after
+    all available items have been processed.
+    """
     # we have no items without deps left and none are processing
     # there must be a loop
     if item_queue.items_with_deps:
@@ -176,55 +234,319 @@ def apply_items(node, workers=1, interactive=False, profiling=False):
             "echo '{}' | dot -Tsvg -odebug.svg"
         ).format("\\n".join(graph_for_items(node.name, item_queue.items_with_deps))))
 
+        loop = find_dependency_loop(item_queue.items_with_deps)
         raise ItemDependencyError(
-            _("bad dependencies between these items: {}").format(
-                ", ".join([i.id for i in item_queue.items_with_deps]),
+            _("bad dependencies between these items: {items}{loop}").format(
+                items=", ".join([i.id for i in item_queue.items_with_deps]),
+                loop=_(" (loop: {})").format(" -> ".join(loop)) if loop else "",
             )
         )
 
 
+def _apply_queued_item(item):
+    """
+    Applies an item handed out by ItemQueue.pop(check_precedes=False).
+    Returns the status code or None if the item precedes other items
+    and none of them need fixing.
+    """
+    if item._precedes_items:
+        if item._precedes_incorrect_item():
+            item.has_been_triggered = True
+        else:
+            return None
+    if item.ITEM_TYPE_NAME == 'action':
+        return item.get_result(interactive=False)
+    return item.apply(interactive=False)
+
+
+class _NodeApplyRun(object):
+    """
+    Keeps track of a single node being applied by apply_nodes().
+    """
+    def __init__(self, node, force=False):
+        self.node = node
+        self.force = force
+        self.connection = None
+        self.failed = False
+        self.item_queue = None
+        self.item_results = []
+        self.jobs_open = 0
+        self.lock = None
+        # set once begin() has completed
+        self.ready = False
+        self.start = None
+
+    @property
+    def done(self):
+        """
+        True if nothing but end() is left to do for this node.
+        """
+        return self.ready and self.jobs_open == 0 and (
+            self.failed or
+            self.item_queue is None or
+            not self.item_queue.has_ready_items
+        )
+
+    def begin(self):
+        self.node.repo.hooks.node_apply_start(
+            self.node.repo,
+            self.node,
+            interactive=False,
+        )
+        self.start = datetime.now()
+
+        connection = self.node.connection()
+        connection.__enter__()
+        self.connection = connection
+
+        lock = NodeLock(self.node, False, ignore=self.force)
+        try:
+            lock.__enter__()
+        except NodeAlreadyLockedException as e:
+            LOG.error(_("Node '{node}' already locked: {info}").format(
+                node=self.node.name,
+                info=e.args,
+            ))
+            return
+        self.lock = lock
+
+        self.item_queue = ItemQueue(
+            self.node.items,
+            cache=self.node.dependency_cache,
+            durations=self.node.item_durations,
+        )
+        prefetch_status(self.item_queue.all_items)
+
+    def end(self):
+        """
+        Releases the node and returns its ApplyResult (None if applying
+        the node failed).
+        """
+        try:
+            if self.lock is not None:
+                self.lock.__exit__(None, None, None)
+        finally:
+            if self.connection is not None:
+                self.connection.__exit__(None, None, None)
+
+        if self.failed:
+            return None
+
+        _save_item_durations(self.node, self.item_results)
+        result = ApplyResult(self.node, self.item_results)
+        result.start = self.start
+        result.end = datetime.now()
+
+        self.node.repo.hooks.node_apply_end(
+            self.node.repo,
+            self.node,
+            duration=result.duration,
+            interactive=False,
+            result=result,
+        )
+
+        return result
+
+
+def apply_nodes(nodes, node_workers=4, item_workers=4, force=False):
+    """
+    Applies all given nodes using a single pool of
+    node_workers * item_workers threads, up to item_workers of which
+    may process the items of any one node at a time. Threads the nodes
+    currently being applied have no use for are used to start applying
+    additional nodes, but no more than node_workers + NODE_OVERSHOOT
+    nodes will be connected to and locked at any time.
+
+    Yields dicts with 'msg' set to NODE_STARTED, NODE_FINISHED (with
+    the ApplyResult as 'result') or NODE_FAILED (with 'error' and
+    'traceback').
+    """
+    pending_nodes = list(nodes)
+    runs = {}
+    # runs in the order they were started
+    active_runs = []
+    # runs waiting for end() to be called
+    done_runs = []
+
+    with ThreadWorkerPool(workers=node_workers * item_workers) as worker_pool:
+        while worker_pool.keep_running():
+            try:
+                msg = worker_pool.get_event()
+            except WorkerException as e:
+                node_name, kind, item_id = e.task_id
+                run = runs[node_name]
+                run.jobs_open -= 1
+                run.failed = True
+                if kind == 'begin':
+                    run.ready = True
+                yield {
+                    'msg': 'NODE_FAILED',
+                    'node': run.node,
+                    'error': e.wrapped_exception,
+                    'traceback': e.traceback,
+                }
+            else:
+                if msg['msg'] == 'REQUEST_WORK':
+                    task = None
+                    if done_runs:
+                        # releasing nodes comes first
+                        run = done_runs.pop(0)
+                        task = (run, 'end', None, run.end, {})
+                    else:
+                        for run in active_runs:
+                            if not run.ready or run.failed or run.item_queue is None:
+                                continue
+                            if run.jobs_open >= item_workers:
+                                continue
+                            try:
+                                # checking whether preceding items have
+                                # to run means looking at the node, so
+                                # we leave it to the worker
+                                item, skipped_items = run.item_queue.pop(check_precedes=False)
+                            except IndexError:
+                                continue
+                            run.item_results.extend(
+                                _items_skipped(run.node, skipped_items, False),
+                            )
+                            task = (run, 'item', item.id, _apply_queued_item, {'item': item})
+                            break
+                    if task is None and pending_nodes and (
+                        len(active_runs) < node_workers or (
+                            len(active_runs) < node_workers + NODE_OVERSHOOT and
+                            all(run.ready for run in active_runs)
+                        )
+                    ):
+                        # Nothing to do for the nodes we already
+                        # started. Start another one unless we are
+                        # still waiting to see how much work the nodes
+                        # we just started have for us. Like the other
+                        # commands, we take nodes from the end of the
+                        # list.
+                        run = _NodeApplyRun(pending_nodes.pop(), force=force)
+                        runs[run.node.name] = run
+                        active_runs.append(run)
+                        task = (run, 'begin', None, run.begin, {})
+                        yield {'msg': 'NODE_STARTED', 'node': run.node}
+
+                    if task is not None:
+                        run, kind, item_id, target, kwargs = task
+                        run.jobs_open += 1
+                        worker_pool.start_task(
+                            msg['wid'],
+                            target,
+                            task_id=(run.node.name, kind, item_id),
+                            kwargs=kwargs,
+                        )
+                    elif active_runs:
+                        # finishing any task might create new work
+                        worker_pool.mark_idle(msg['wid'])
+                    else:
+                        worker_pool.quit(msg['wid'])
+                    continue
+
+                elif msg['msg'] == 'FINISHED_WORK':
+                    node_name, kind, item_id = msg['task_id']
+                    run = runs[node_name]
+                    run.jobs_open -= 1
+                    if kind == 'begin':
+                        run.ready = True
+                    elif kind == 'item' and not run.failed:
+                        item = run.item_queue.item_index.find(item_id)
+                        if msg['return_value'] is None:
+                            run.item_queue.item_precedes_skipped(item)
+                            run.item_results.extend(
+                                _items_skipped(run.node, [item], False),
+                            )
+                        else:
+                            run.item_results.extend(_item_finished(
+                                run.node,
+                                run.item_queue,
+                                item,
+                                msg['return_value'],
+                                msg['duration'],
+                                False,
+                            ))
+                    elif kind == 'end' and not run.failed:
+                        yield {
+                            'msg': 'NODE_FINISHED',
+                            'node': run.node,
+                            'result': msg['return_value'],
+                        }
+                else:
+                    continue
+
+            if kind == 'end':
+                active_runs.remove(run)
+            elif run.done:
+                if not run.failed and run.item_queue is not None:
+                    try:
+                        _check_for_dependency_loop(run.node, run.item_queue)
+                    except ItemDependencyError as e:
+                        run.failed = True
+                        yield {
+                            'msg': 'NODE_FAILED',
+                            'node': run.node,
+                            'error': force_text(e),
+                            'traceback': None,
+                        }
+                done_runs.append(run)
+            worker_pool.activate_idle_workers()
+
+
 def _flatten_group_hierarchy(groups):
     """
     Takes a list of groups and returns a list of group names ordered so
-    that parent groups will appear before any of their subgroups.
+    that parent groups will appear before any of their subgroups. Groups
+    without such a relation keep their relative order.
     """
-    # dict mapping groups to subgroups
+    positions = {}
+    for position, group in enumerate(groups):
+        positions.setdefault(group.name, position)
+
+    # number of parents each group is still waiting for
+    parent_counts = dict.fromkeys(positions, 0)
     child_groups = {}
     for group in groups:
-        child_groups[group.name] = list(names(group.subgroups))
+        child_groups[group.name] = set(
+            name for name in names(group.subgroups) if name in positions
+        )
+        for child_group in child_groups[group.name]:
+            parent_counts[child_group] += 1
 
-    # dict mapping groups to parent groups
-    parent_groups = {}
-    for child_group in child_groups.keys():
-        parent_groups[child_group] = []
-        for parent_group, subgroups in child_groups.items():
-            if child_group in subgroups:
-                parent_groups[child_group].append(parent_group)
+    # positions of groups whose parents have all been added to order,
+    # the first one in the given list goes next
+    ready_positions = [
+        positions[group_name] for group_name, count in parent_counts.items() if not count
+    ]
+    heapify(ready_positions)
 
     order = []
+    while ready_positions:
+        group_name = groups[heappop(ready_positions)].name
+        order.append(group_name)
+        for child_group in child_groups[group_name]:
+            parent_counts[child_group] -= 1
+            if not parent_counts[child_group]:
+                heappush(ready_positions, positions[child_group])
+
+    if len(order) < len(parent_counts):
+        raise RuntimeError(
+            _("encountered subgroup loop that should have been detected")
+        )
+    return order
 
-    while True:
-        top_level_group = None
-        for group, parents in parent_groups.items():
-            if parents:
-                continue
-            else:
-                top_level_group = group
-                break
-        if not top_level_group:
-            if parent_groups:
-                raise RuntimeError(
-                    _("encountered subgroup loop that should have been detected")
-                )
-            else:
-                break
-        order.append(top_level_group)
-        del parent_groups[top_level_group]
-        for group in parent_groups.keys():
-            if top_level_group in parent_groups[group]:
-                parent_groups[group].remove(top_level_group)
 
-    return order
+def _json_default(obj):
+    """
+    Makes sets in metadata serializable with a stable order. Raises
+    TypeError for anything else json doesn't know about.
+    """
+    if isinstance(obj, (set, frozenset)):
+        try:
+            return sorted(obj)
+        except TypeError:
+            return sorted(obj, key=repr)
+    raise TypeError(_("{} is not JSON serializable").format(repr(obj)))
 
 
 def format_item_result(result, node, bundle, item, interactive=False):
@@ -371,10 +693,7 @@ class Node(object):
         return False
 
     def in_group(self, group_name):
-        for group in self.groups:
-            if group.name == group_name:
-                return True
-        return False
+        return group_name in self.repo.group_membership.groups_by_node.get(self.name, ())
 
     @property
     def items(self):
@@ -398,7 +717,7 @@ class Node(object):
         start = datetime.now()
         worker_count = 1 if interactive else workers
         try:
-            with NodeLock(self, interactive, ignore=force):
+            with self.connection(), NodeLock(self, interactive, ignore=force):
                 item_results = list(apply_items(
                     self,
                     workers=worker_count,
@@ -412,6 +731,7 @@ class Node(object):
                     info=e.args,
                 ))
             item_results = []
+        _save_item_durations(self, item_results)
         result = ApplyResult(self, item_results)
         result.start = start
         result.end = datetime.now()
@@ -426,6 +746,44 @@ class Node(object):
 
         return result
 
+    def connection(self):
+        """
+        Returns a context manager keeping a single SSH connection to
+        this node open. All remote operations for this node (including
+        those from worker processes) will share it.
+        """
+        return operations.ConnectionManager(
+            hostnames=[self.hostname],
+            add_host_keys=True if environ.get('BWADDHOSTKEYS', False) == "1" else False,
+        )
+
+    @property
+    def dependency_cache(self):
+        """
+        Returns a DependencyCache for the items of this node or None if
+        caching has been disabled by setting BWDEPSCACHE=0 or the
+        metadata of this node cannot be represented reliably in the
+        cache key.
+        """
+        if environ.get(DEPS_CACHE_ENV, "1") == "0" or self.repo.path == "/dev/null":
+            return None
+        try:
+            metadata_json = json.dumps(self.metadata, default=_json_default, sort_keys=True)
+        except TypeError as e:
+            # the repr() of arbitrary objects might differ between
+            # runs, so we can't use it to build the key
+            LOG.debug(_("not caching dependencies of {node}: {error}").format(
+                error=e,
+                node=self.name,
+            ))
+            return None
+        key = sha1("\n".join([
+            VERSION_STRING,
+            self.repo.sources_hash,
+            metadata_json,
+        ]).encode('utf-8'))
+        return DependencyCache(join(self.repo.cache_dir, "deps", self.name + ".json"), key)
+
     def download(self, remote_path, local_path, ignore_failure=False):
         return operations.download(
             self.hostname,
@@ -437,18 +795,33 @@ class Node(object):
     def get_item(self, item_id):
         return find_item(item_id, self.items)
 
+    @property
+    def item_durations(self):
+        """
+        Returns an ItemDurations store for the items of this node or
+        None if recording durations has been disabled by setting
+        BWDURATIONS=0.
+        """
+        if environ.get(DURATIONS_ENV, "1") == "0" or self.repo.path == "/dev/null":
+            return None
+        return ItemDurations(join(self.repo.cache_dir, "durations", self.name + ".json"))
+
     @cached_property
     def metadata(self):
-        m = {}
-
         # step 1: group metadata
-        group_order = _flatten_group_hierarchy(self.groups)
-        for group_name in group_order:
-            m = merge_dict(m, self.repo.get_group(group_name).metadata)
+        group_order = self.repo.flattened_group_hierarchy(self.groups)
+        m = self.repo.merged_group_metadata(group_order)
 
         # step 2: node metadata
         m = merge_dict(m, self._node_metadata)
 
+        # merge_dict() shares unchanged subtrees with the cached group
+        # metadata of other nodes and with our own node metadata.
+        # Metadata processors and bundles are free to modify the result,
+        # so this one full copy per node cannot be avoided without
+        # making node metadata read-only.
+        m = deepcopy(m)
+
         # step 3: metadata processors
         for group_name in group_order:
             group = self.repo.get_group(group_name)
@@ -471,6 +844,18 @@ class Node(object):
             log_function=log_function,
         )
 
+    def run_many(self, commands, may_fail=False):
+        """
+        Runs all given commands on the node in a single round trip and
+        returns a list of RunResults in the same order.
+        """
+        return operations.run_many(
+            self.hostname,
+            commands,
+            ignore_failure=may_fail,
+            add_host_keys=True if environ.get('BWADDHOSTKEYS', False) == "1" else False,
+        )
+
     def test(self, workers=4):
         test_items(
             self.items,
@@ -491,15 +876,16 @@ class Node(object):
     def verify(self, only_needs_fixing=False, workers=4):
         bad = 0
         good = 0
-        for item_status in verify_items(
-            self.items,
-            only_needs_fixing=only_needs_fixing,
-            workers=workers,
-        ):
-            if item_status:
-                good += 1
-            else:
-                bad += 1
+        with self.connection():
+            for item_status in verify_items(
+                self.items,
+                only_needs_fixing=only_needs_fixing,
+                workers=workers,
+            ):
+                if item_status:
+                    good += 1
+                else:
+                    bad += 1
 
         return {'good': good, 'bad': bad}
 
@@ -575,10 +961,42 @@ class NodeLock(object):
         )
 
 
+def prefetch_status(items):
+    """
+    Lets every item type determine the status of all of its items at
+    once (see Item.get_status_bulk()) before they are processed one by
+    one. Actions and triggered items are left alone since their status
+    is only of interest after other items have been fixed.
+
+    Item types sharing the same get_status_bulk() implementation are
+    handled in a single call.
+    """
+    items_by_bulk_function = {}
+    for item in items:
+        if item.ITEM_TYPE_NAME in ('action', 'dummy') or item.triggered:
+            continue
+        bulk_function = getattr(item.get_status_bulk, '__func__', item.get_status_bulk)
+        items_by_bulk_function.setdefault(bulk_function, []).append(item)
+
+    for bulk_items in items_by_bulk_function.values():
+        try:
+            bulk_items[0].get_status_bulk(bulk_items)
+        except Exception as e:
+            # not fatal, items will just determine their status on
+            # their own
+            LOG.warning(_("unable to prefetch status of {type} items on {node}: {error}").format(
+                error=e,
+                node=bulk_items[0].node.name,
+                type="/".join(sorted(set(item.ITEM_TYPE_NAME for item in bulk_items))),
+            ))
+            for item in bulk_items:
+                item._invalidate_cached_status()
+
+
 def test_items(items, workers=1):
     items = prepare_dependencies(items)
 
-    with WorkerPool(workers=workers) as worker_pool:
+    with get_worker_pool(workers=workers) as worker_pool:
         while worker_pool.keep_running():
             msg = worker_pool.get_event()
             if msg['msg'] == 'REQUEST_WORK':
@@ -604,13 +1022,40 @@ def test_items(items, workers=1):
                 ))
 
 
+def _verify_result(item_id, item_status, only_needs_fixing=False):
+    if not item_status.correct:
+        LOG.warning("{} {}".format(
+            red("✘"),
+            item_id,
+        ))
+        return False
+    else:
+        if not only_needs_fixing:
+            LOG.info("{} {}".format(
+                green("✓"),
+                item_id,
+            ))
+        return True
+
+
 def verify_items(all_items, only_needs_fixing=False, workers=1):
     items = []
     for item in all_items:
         if not item.ITEM_TYPE_NAME == 'action' and not item.triggered:
             items.append(item)
 
-    with WorkerPool(workers=workers) as worker_pool:
+    prefetch_status(items)
+    for item in list(items):
+        item_status = getattr(item, '_cache', {}).get('cached_status')
+        if item_status is not None:
+            items.remove(item)
+            yield _verify_result(
+                item.node.name + ":" + item.id,
+                item_status,
+                only_needs_fixing=only_needs_fixing,
+            )
+
+    with get_worker_pool(workers=workers) as worker_pool:
         while worker_pool.keep_running():
             msg = worker_pool.get_event()
             if msg['msg'] == 'REQUEST_WORK':
@@ -624,18 +1069,8 @@ def verify_items(all_items, only_needs_fixing=False, workers=1):
                 else:
                     worker_pool.quit(msg['wid'])
             elif msg['msg'] == 'FINISHED_WORK':
-                item_id = msg['task_id']
-                item_status = msg['return_value']
-                if not item_status.correct:
-                    LOG.warning("{} {}".format(
-                        red("✘"),
-                        item_id,
-                    ))
-                    yield False
-                else:
-                    if not only_needs_fixing:
-                        LOG.info("{} {}".format(
-                            green("✓"),
-                            item_id,
-                        ))
-                    yield True
+                yield _verify_result(
+                    msg['task_id'],
+                    msg['return_value'],
+                    only_needs_fixing=only_needs_fixing,
+                )
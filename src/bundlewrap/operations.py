@@ -3,15 +3,215 @@ from __future__ import unicode_literals
 
 from pipes import quote
 from select import select
+from atexit import register as register_exit_handler
+from contextlib import contextmanager
+from io import BytesIO
+from shutil import rmtree
 from subprocess import Popen, PIPE
-from threading import Event, Thread
-from os import close, pipe, read
+from tempfile import mkdtemp, TemporaryFile
+from threading import Event, Lock, Thread
+from os import close, devnull, environ, getpid, pipe, read
+from os.path import join
 
 from .exceptions import RemoteException
-from .utils import cached_property, LOG
+from .utils import cached_property, LOG, sha1
 from .utils.text import force_text, mark_for_translation as _, randstr
 from .utils.ui import LineBuffer
 
+# Worker processes find the sockets of master connections opened by a
+# ConnectionManager in their parent through this environment variable.
+CONTROL_DIR_ENV = 'BWSSHCONTROLDIR'
+CONTROL_PERSIST = 300  # seconds
+
+PERSISTENT_SHELL_ENV = 'BWPERSISTENTSHELL'
+
+# Runs on the node as the single 'sudo bash' behind a RemoteShell.
+# Requests are "<id> <length>\n<command>", responses are
+# "<id> <return code> <stdout length> <stderr length>\n<stdout><stderr>".
+# Requires bash 4.1 or later for 'read -N'.
+SHELL_DRIVER = """
+export LC_ALL=C
+tmp=$(mktemp -d) || exit 1
+trap 'rm -rf "$tmp"' EXIT
+while read -r id length; do
+    IFS= read -r -N "$length" command
+    printf '%s' "$command" >"$tmp/command"
+    (unset LC_ALL; bash "$tmp/command") </dev/null >"$tmp/stdout" 2>"$tmp/stderr"
+    rcode=$?
+    printf '%s %d %d %d\\n' "$id" "$rcode" $(wc -c <"$tmp/stdout") $(wc -c <"$tmp/stderr")
+    cat "$tmp/stdout" "$tmp/stderr"
+done
+"""
+
+# Prepended to the scripts built by run_many(). Writes one response
+# frame (see SHELL_DRIVER) per command.
+BATCH_PREAMBLE = """
+tmp=$(mktemp -d) || exit 1
+trap 'rm -rf "$tmp"' EXIT
+run_command() {
+    bash -c "$2" </dev/null >"$tmp/stdout" 2>"$tmp/stderr"
+    rcode=$?
+    printf '%s %d %d %d\\n' "$1" "$rcode" $(wc -c <"$tmp/stdout") $(wc -c <"$tmp/stderr")
+    cat "$tmp/stdout" "$tmp/stderr"
+}
+"""
+
+# hostname -> RemoteShells not running a command right now, only valid
+# in the process that started them
+_REMOTE_SHELLS = {}
+_REMOTE_SHELLS_LOCK = Lock()
+
+# control directory shared by all ConnectionManagers active in this
+# process, possibly from several threads
+_CONTROL_DIR = None
+_CONTROL_DIR_LOCK = Lock()
+
+
+class ConnectionManager(object):
+    """
+    Keeps one multiplexed SSH master connection per hostname open while
+    active. Every call to run(), upload() and download() made in the
+    meantime (also from worker threads or processes started in the
+    meantime) is routed through these connections instead of doing a
+    full SSH handshake of its own.
+    """
+    def __init__(self, hostnames=(), add_host_keys=False):
+        self.add_host_keys = add_host_keys
+        self.control_dir = None
+        self.hostnames = []
+        self._initial_hostnames = list(hostnames)
+
+    def __enter__(self):
+        global _CONTROL_DIR
+        with _CONTROL_DIR_LOCK:
+            if _CONTROL_DIR is None or _CONTROL_DIR['pid'] != getpid():
+                # sockets are named after hostnames, so all managers in
+                # this process can share a single directory
+                _CONTROL_DIR = {
+                    'path': mkdtemp(prefix="bw_ssh_"),
+                    'pid': getpid(),
+                    'previous': environ.get(CONTROL_DIR_ENV),
+                    'users': 0,
+                }
+                environ[CONTROL_DIR_ENV] = _CONTROL_DIR['path']
+            _CONTROL_DIR['users'] += 1
+            self.control_dir = _CONTROL_DIR['path']
+        try:
+            for hostname in self._initial_hostnames:
+                self.connect(hostname)
+        except:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes all master connections and cleans up their sockets.
+        """
+        global _CONTROL_DIR
+        for hostname in list(self.hostnames):
+            self.disconnect(hostname)
+        with _CONTROL_DIR_LOCK:
+            _CONTROL_DIR['users'] -= 1
+            if _CONTROL_DIR['users'] > 0:
+                return
+            previous_control_dir = _CONTROL_DIR['previous']
+            _CONTROL_DIR = None
+            if previous_control_dir is None:
+                del environ[CONTROL_DIR_ENV]
+            else:
+                environ[CONTROL_DIR_ENV] = previous_control_dir
+            rmtree(self.control_dir, ignore_errors=True)
+
+    def connect(self, hostname):
+        """
+        Opens the master connection for the given hostname unless it is
+        already open. Failing to do so is not fatal: ssh will simply
+        connect without a master later on.
+        """
+        if hostname in self.hostnames:
+            return
+        LOG.debug(_("opening master connection to {host}").format(host=hostname))
+        with open(devnull, 'w') as null:
+            # ssh will fork into the background once the connection
+            # has been established
+            return_code = Popen(
+                [
+                    "ssh",
+                    "-o",
+                    "StrictHostKeyChecking=no" if self.add_host_keys
+                    else "StrictHostKeyChecking=yes",
+                    "-o",
+                    "ControlMaster=yes",
+                    "-o",
+                    "ControlPath=" + _control_path(hostname, self.control_dir),
+                    "-o",
+                    "ControlPersist={}".format(CONTROL_PERSIST),
+                    "-f",
+                    "-N",
+                    hostname,
+                ],
+                stderr=null,
+                stdin=null,
+                stdout=null,
+            ).wait()
+        if return_code == 0:
+            self.hostnames.append(hostname)
+        else:
+            LOG.debug(_(
+                "unable to open master connection to {host}, "
+                "continuing without (return code {rcode})"
+            ).format(host=hostname, rcode=return_code))
+
+    def disconnect(self, hostname):
+        """
+        Closes the master connection for the given hostname.
+        """
+        _close_remote_shell(hostname)
+        LOG.debug(_("closing master connection to {host}").format(host=hostname))
+        with open(devnull, 'w') as null:
+            Popen(
+                [
+                    "ssh",
+                    "-o",
+                    "ControlPath=" + _control_path(hostname, self.control_dir),
+                    "-O",
+                    "exit",
+                    hostname,
+                ],
+                stderr=null,
+                stdin=null,
+                stdout=null,
+            ).wait()
+        self.hostnames.remove(hostname)
+
+
+def _control_path(hostname, control_dir):
+    # hashing keeps us well below the length limit for socket paths
+    return join(control_dir, sha1(hostname.encode('utf-8'))[:16])
+
+
+def _ssh_options(hostname, add_host_keys=False):
+    """
+    Returns the options passed to every ssh and scp invocation.
+    """
+    options = [
+        "-o",
+        "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
+    ]
+    control_dir = environ.get(CONTROL_DIR_ENV)
+    if control_dir:
+        options += [
+            "-o",
+            "ControlMaster=no",
+            "-o",
+            "ControlPath=" + _control_path(hostname, control_dir),
+        ]
+    return options
+
 
 def output_thread_body(line_buffer, read_fd, quit_event):
     while not quit_event.is_set():
@@ -61,23 +261,192 @@ class RunResult(object):
         return force_text(self.stdout)
 
 
-def run(hostname, command, ignore_failure=False, add_host_keys=False, log_function=None):
+class RemoteShell(object):
     """
-    Runs a command on a remote system.
+    A single long-lived 'sudo bash' on a node. Commands are streamed to
+    it and results streamed back over one SSH session, so individual
+    commands pay neither for an SSH handshake nor for sudo.
+    """
+    def __init__(self, hostname, add_host_keys=False):
+        self.hostname = hostname
+        self.lock = Lock()
+        self.pid = getpid()
+        self._last_id = 0
+        self._stderr = TemporaryFile()
+        self.process = Popen(
+            ["ssh"] + _ssh_options(hostname, add_host_keys=add_host_keys) + [
+                hostname,
+                "LANG=C sudo bash -c " + quote(SHELL_DRIVER),
+            ],
+            stderr=self._stderr,
+            stdin=PIPE,
+            stdout=PIPE,
+        )
+
+    def __repr__(self):
+        return "<RemoteShell for {}>".format(self.hostname)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        """
+        Ends the remote shell by closing its input.
+        """
+        try:
+            self.process.stdin.close()
+        except IOError:
+            pass
+        self.process.wait()
+        self._stderr.close()
+
+    def run(self, command):
+        """
+        Runs the given command and returns a RunResult.
+        """
+        if not isinstance(command, bytes):
+            command = command.encode('utf-8')
+        with self.lock:
+            self._last_id += 1
+            try:
+                self.process.stdin.write(
+                    "{} {}\n".format(self._last_id, len(command)).encode('utf-8') + command,
+                )
+                self.process.stdin.flush()
+                command_id, result = _read_frame(self.process.stdout)
+            except (EOFError, IOError, OSError):
+                self._kill()
+                self._stderr.seek(0)
+                raise RemoteException(_(
+                    "persistent shell on {host} died unexpectedly:\n\n{error}"
+                ).format(
+                    error=force_text(self._stderr.read()),
+                    host=self.hostname,
+                ))
+            except RemoteException as e:
+                self._kill()
+                raise RemoteException(_(
+                    "persistent shell on {host} sent a malformed response: {error}"
+                ).format(
+                    error=e,
+                    host=self.hostname,
+                ))
+            if command_id != self._last_id:
+                # we are out of sync with the remote side, nothing read
+                # from this shell can be trusted anymore
+                self._kill()
+                raise RemoteException(_(
+                    "persistent shell on {host} sent the result of command "
+                    "{received} instead of {expected}"
+                ).format(
+                    expected=self._last_id,
+                    host=self.hostname,
+                    received=command_id,
+                ))
+        return result
+
+    def _kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def _close_remote_shell(hostname):
+    with _REMOTE_SHELLS_LOCK:
+        remote_shells = _REMOTE_SHELLS.pop(hostname, [])
+    for remote_shell in remote_shells:
+        if remote_shell.pid == getpid():
+            remote_shell.close()
+
+
+@register_exit_handler
+def _close_remote_shells():
+    for hostname in list(_REMOTE_SHELLS.keys()):
+        _close_remote_shell(hostname)
+
+
+@contextmanager
+def _remote_shell(hostname, add_host_keys=False):
+    """
+    Lends out a RemoteShell for the given hostname, starting a new one
+    if all shells for the host are busy. Every thread running commands
+    on a host at the same time thus gets a shell of its own, so there
+    are never more shells per host than item workers for it.
+
+    Shells inherited from a parent process are never used since their
+    pipes are still owned by the parent.
+    """
+    remote_shell = None
+    with _REMOTE_SHELLS_LOCK:
+        idle_shells = _REMOTE_SHELLS.get(hostname, [])
+        while idle_shells and remote_shell is None:
+            candidate = idle_shells.pop()
+            if candidate.pid != getpid():
+                continue
+            if candidate.alive:
+                remote_shell = candidate
+            else:
+                candidate.close()
+    if remote_shell is None:
+        LOG.debug(_("starting persistent shell on {host}").format(host=hostname))
+        remote_shell = RemoteShell(hostname, add_host_keys=add_host_keys)
+    try:
+        yield remote_shell
+    finally:
+        if remote_shell.alive:
+            with _REMOTE_SHELLS_LOCK:
+                _REMOTE_SHELLS.setdefault(hostname, []).append(remote_shell)
+
+
+def _read_exactly(stream, length):
+    data = b""
+    while len(data) < length:
+        chunk = stream.read(length - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def _read_frame(stream):
+    """
+    Reads a single response frame as written by SHELL_DRIVER and
+    returns the command id and a RunResult.
+    """
+    header = stream.readline()
+    if not header:
+        raise EOFError()
+    try:
+        command_id, return_code, stdout_length, stderr_length = \
+            [int(field) for field in header.split()]
+    except ValueError:
+        raise RemoteException(_("invalid frame header: {}").format(repr(header)))
+    result = RunResult()
+    result.return_code = return_code
+    result.stdout = _read_exactly(stream, stdout_length)
+    result.stderr = _read_exactly(stream, stderr_length)
+    return (command_id, result)
+
+
+def _batch_script(commands):
+    script = BATCH_PREAMBLE
+    for command_id, command in enumerate(commands):
+        script += "run_command {} {}\n".format(command_id, quote(command))
+    return script
+
+
+def _run_ssh(hostname, command, add_host_keys=False, log_function=None):
+    """
+    Runs a command on a remote system using a dedicated SSH session.
     """
     stderr_lb = LineBuffer(log_function)
     stdout_lb = LineBuffer(log_function)
 
-    LOG.debug("running on {host}: {command}".format(command=command, host=hostname))
-
     stdout_fd_r, stdout_fd_w = pipe()
     stderr_fd_r, stderr_fd_w = pipe()
 
     ssh_process = Popen(
-        [
-            "ssh",
-            "-o",
-            "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
+        ["ssh"] + _ssh_options(hostname, add_host_keys=add_host_keys) + [
             hostname,
             "LANG=C sudo bash -c " + quote(command),
         ],
@@ -106,12 +475,57 @@ def run(hostname, command, ignore_failure=False, add_host_keys=False, log_functi
         for fd in (stdout_fd_r, stdout_fd_w, stderr_fd_r, stderr_fd_w):
             close(fd)
 
-    LOG.debug("command finished with return code {}".format(ssh_process.returncode))
-
     result = RunResult()
     result.stdout = stdout_lb.record.getvalue()
     result.stderr = stderr_lb.record.getvalue()
     result.return_code = ssh_process.returncode
+    return result
+
+
+def _run_ssh_script(hostname, script, add_host_keys=False):
+    """
+    Feeds the given script to a shell on a remote system using a
+    dedicated SSH session. Unlike passing it as a command, this is not
+    subject to limits on the length of command lines.
+    """
+    ssh_process = Popen(
+        ["ssh"] + _ssh_options(hostname, add_host_keys=add_host_keys) + [
+            hostname,
+            "LANG=C sudo bash",
+        ],
+        stderr=PIPE,
+        stdin=PIPE,
+        stdout=PIPE,
+    )
+    result = RunResult()
+    result.stdout, result.stderr = ssh_process.communicate(script.encode('utf-8'))
+    result.return_code = ssh_process.returncode
+    return result
+
+
+def run(hostname, command, ignore_failure=False, add_host_keys=False, log_function=None):
+    """
+    Runs a command on a remote system.
+    """
+    LOG.debug("running on {host}: {command}".format(command=command, host=hostname))
+
+    if environ.get(PERSISTENT_SHELL_ENV, "0") == "1":
+        with _remote_shell(hostname, add_host_keys=add_host_keys) as remote_shell:
+            result = remote_shell.run(command)
+        # output only becomes available once the command has finished
+        for output in (result.stdout, result.stderr):
+            line_buffer = LineBuffer(log_function)
+            line_buffer.write(output)
+            line_buffer.close()
+    else:
+        result = _run_ssh(
+            hostname,
+            command,
+            add_host_keys=add_host_keys,
+            log_function=log_function,
+        )
+
+    LOG.debug("command finished with return code {}".format(result.return_code))
 
     if not result.return_code == 0 and not ignore_failure:
         raise RemoteException(_(
@@ -125,6 +539,59 @@ def run(hostname, command, ignore_failure=False, add_host_keys=False, log_functi
     return result
 
 
+def run_many(hostname, commands, ignore_failure=False, add_host_keys=False):
+    """
+    Runs several commands on a remote system in a single round trip.
+    Returns a list of RunResults in the same order as the commands.
+    """
+    commands = list(commands)
+    if not commands:
+        return []
+
+    LOG.debug("running {count} commands on {host}: {commands}".format(
+        commands="; ".join(commands),
+        count=len(commands),
+        host=hostname,
+    ))
+
+    script = _batch_script(commands)
+    if environ.get(PERSISTENT_SHELL_ENV, "0") == "1":
+        with _remote_shell(hostname, add_host_keys=add_host_keys) as remote_shell:
+            batch_result = remote_shell.run(script)
+    else:
+        batch_result = _run_ssh_script(hostname, script, add_host_keys=add_host_keys)
+
+    results = []
+    stream = BytesIO(batch_result.stdout)
+    try:
+        for command_id in range(len(commands)):
+            frame_id, result = _read_frame(stream)
+            if frame_id != command_id:
+                raise ValueError(frame_id)
+            results.append(result)
+    except (EOFError, RemoteException, ValueError):
+        raise RemoteException(_(
+            "running {count} commands on '{host}' failed (return code {rcode}):\n\n{result}"
+        ).format(
+            count=len(commands),
+            host=hostname,
+            rcode=batch_result.return_code,
+            result=force_text(batch_result.stderr),
+        ))
+
+    for command, result in zip(commands, results):
+        if not result.return_code == 0 and not ignore_failure:
+            raise RemoteException(_(
+                "Non-zero return code ({rcode}) running '{command}' on '{host}':\n\n{result}"
+            ).format(
+                command=command,
+                host=hostname,
+                rcode=result.return_code,
+                result=force_text(result.stdout) + force_text(result.stderr),
+            ))
+    return results
+
+
 def upload(hostname, local_path, remote_path, mode=None, owner="",
            group="", add_host_keys=False):
     """
@@ -135,10 +602,7 @@ def upload(hostname, local_path, remote_path, mode=None, owner="",
     temp_filename = ".bundlewrap_tmp_" + randstr()
 
     scp_process = Popen(
-        [
-            "scp",
-            "-o",
-            "StrictHostKeyChecking=no" if add_host_keys else "StrictHostKeyChecking=yes",
+        ["scp"] + _ssh_options(hostname, add_host_keys=add_host_keys) + [
             local_path,
             "{}:{}".format(hostname, temp_filename),
         ],
@@ -1,20 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from collections import defaultdict, namedtuple
 from copy import copy
 from imp import load_source
-from os import listdir, mkdir
-from os.path import isdir, isfile, join
+from os import listdir, mkdir, walk
+from os.path import isdir, isfile, join, relpath
+import re
+from threading import RLock
 
 from . import items
 from .exceptions import NoSuchGroup, NoSuchNode, NoSuchRepository, RepositoryError
 from .group import Group
-from .node import Node
+from .node import _flatten_group_hierarchy, Node
 from . import utils
 from .utils.scm import get_rev
 from .utils.text import mark_for_translation as _, validate_name
 
 DIRNAME_BUNDLES = "bundles"
+DIRNAME_CACHE = ".bw_cache"
 DIRNAME_DATA = "data"
 DIRNAME_HOOKS = "hooks"
 DIRNAME_ITEM_TYPES = "items"
@@ -69,6 +73,42 @@ nodes = {
 }
 
 
+# nodes_by_group maps group names to sets of member nodes,
+# groups_by_node maps node names to sets of names of their groups
+GroupMembership = namedtuple('GroupMembership', ('nodes_by_group', 'groups_by_node'))
+
+
+def _build_group_membership(groups, nodes):
+    """
+    Resolves the members of all groups in a single pass over all nodes
+    and returns a GroupMembership.
+    """
+    direct_members = {}
+    patterns = []
+    for group in groups:
+        direct_members[group.name] = set(group._nodes_from_static_members)
+        for pattern in group.patterns:
+            patterns.append((group.name, re.compile(pattern)))
+
+    for node in nodes:
+        for group_name, compiled_pattern in patterns:
+            if compiled_pattern.search(node.name) is not None:
+                direct_members[group_name].add(node)
+
+    nodes_by_group = {}
+    groups_by_node = defaultdict(set)
+    for group in groups:
+        members = set(direct_members[group.name])
+        # group.subgroups includes indirect subgroups and takes care of
+        # detecting loops
+        for subgroup in group.subgroups:
+            members.update(direct_members[subgroup.name])
+        nodes_by_group[group.name] = members
+        for node in members:
+            groups_by_node[node.name].add(group.name)
+    return GroupMembership(nodes_by_group, groups_by_node)
+
+
 def groups_from_file(filepath, libs):
     """
     Returns all groups as defined in the given groups.py.
@@ -254,13 +294,19 @@ class Repository(object):
         self._set_path(self.path)
 
         self.bundle_names = []
-        self.group_dict = {}
-        self.node_dict = {}
+        self._group_dict = {}
+        self._group_hierarchy_cache = {}
+        self._group_membership = None
+        self._nodes_by_bundle = None
+        self._group_metadata_cache = {}
+        self._item_classes = None
+        # guards loading groups, nodes and item classes since the
+        # first access may happen from several threads at once
+        self._load_lock = RLock()
+        self._node_dict = {}
 
         if repo_path is not None:
             self.populate_from_path(repo_path)
-        else:
-            self.item_classes = list(items_from_path(items.__path__[0]))
 
     def __eq__(self, other):
         if self.path == "/dev/null":
@@ -274,14 +320,13 @@ class Repository(object):
         dynamically and can't be pickled.
         """
         state = copy(self.__dict__)
-        state['item_classes'] = []
+        state['_item_classes'] = None
+        del state['_load_lock']
         return state
 
     def __setstate__(self, state):
         self.__dict__ = state
-        self.item_classes = list(items_from_path(items.__path__[0]))
-        if self.path != "/dev/null":
-            self.item_classes += list(items_from_path(self.items_dir))
+        self._load_lock = RLock()
 
     def __repr__(self):
         return "<Repository at '{}'>".format(self.path)
@@ -303,28 +348,39 @@ class Repository(object):
         """
         Adds the given group object to this repo.
         """
-        if group.name in utils.names(self.nodes):
+        self._add_group(group, self.group_dict, self.node_dict)
+        self._group_hierarchy_cache = {}
+        self._group_membership = None
+        self._nodes_by_bundle = None
+        self._group_metadata_cache = {}
+
+    def add_node(self, node):
+        """
+        Adds the given node object to this repo.
+        """
+        self._add_node(node, self.node_dict, self.group_dict)
+        self._group_membership = None
+        self._nodes_by_bundle = None
+
+    def _add_group(self, group, group_dict, node_dict):
+        if group.name in node_dict:
             raise RepositoryError(_("you cannot have a node and a group "
                                     "both named '{}'").format(group.name))
-        if group.name in utils.names(self.groups):
+        if group.name in group_dict:
             raise RepositoryError(_("you cannot have two groups "
                                     "both named '{}'").format(group.name))
         group.repo = self
-        self.group_dict[group.name] = group
+        group_dict[group.name] = group
 
-    def add_node(self, node):
-        """
-        Adds the given node object to this repo.
-        """
-        if node.name in utils.names(self.groups):
+    def _add_node(self, node, node_dict, group_dict):
+        if node.name in group_dict:
             raise RepositoryError(_("you cannot have a node and a group "
                                     "both named '{}'").format(node.name))
-        if node.name in utils.names(self.nodes):
+        if node.name in node_dict:
             raise RepositoryError(_("you cannot have two nodes "
                                     "both named '{}'").format(node.name))
-
         node.repo = self
-        self.node_dict[node.name] = node
+        node_dict[node.name] = node
 
     @classmethod
     def create(cls, path):
@@ -369,19 +425,126 @@ class Repository(object):
         except KeyError:
             raise NoSuchNode(node_name)
 
+    @property
+    def group_dict(self):
+        if self._group_dict is None:
+            self._load_groups_and_nodes()
+        return self._group_dict
+
     @property
     def groups(self):
         return sorted(self.group_dict.values())
 
+    @property
+    def group_membership(self):
+        """
+        Returns a GroupMembership for all groups and nodes, built on
+        first access.
+        """
+        if self._group_membership is None:
+            with self._load_lock:
+                if self._group_membership is None:
+                    self._group_membership = _build_group_membership(self.groups, self.nodes)
+        return self._group_membership
+
+    def flattened_group_hierarchy(self, groups):
+        """
+        Returns the names of the given groups with parent groups before
+        their subgroups (see node._flatten_group_hierarchy()). Computed
+        only once for the same list of groups.
+        """
+        key = tuple(utils.names(groups))
+        if key not in self._group_hierarchy_cache:
+            self._group_hierarchy_cache[key] = _flatten_group_hierarchy(groups)
+        # the result is passed on to metadata processors, hand out a
+        # copy to keep the cached one safe from modification
+        return list(self._group_hierarchy_cache[key])
+
+    def merged_group_metadata(self, group_names):
+        """
+        Returns the metadata of the given groups merged in the given
+        order. The result is shared with other callers and must not be
+        modified.
+
+        Results are cached for every prefix of group_names, so nodes
+        with the same or overlapping group orders reuse each other's
+        merges.
+        """
+        group_names = tuple(group_names)
+        # find the longest prefix we have already merged
+        prefix_length = len(group_names)
+        while prefix_length and group_names[:prefix_length] not in self._group_metadata_cache:
+            prefix_length -= 1
+        merged = self._group_metadata_cache.get(group_names[:prefix_length], {})
+
+        for index in range(prefix_length, len(group_names)):
+            merged = utils.merge_dict(merged, self.get_group(group_names[index]).metadata)
+            self._group_metadata_cache[group_names[:index + 1]] = merged
+        return merged
+
     def groups_for_node(self, node):
-        for group in self.groups:
-            if node in group.nodes:
-                yield group
+        for group_name in sorted(self.group_membership.groups_by_node.get(node.name, ())):
+            yield self.get_group(group_name)
+
+    @property
+    def item_classes(self):
+        if self._item_classes is None:
+            with self._load_lock:
+                if self._item_classes is None:
+                    item_classes = list(items_from_path(items.__path__[0]))
+                    if self.path != "/dev/null":
+                        item_classes += list(items_from_path(self.items_dir))
+                    self._item_classes = item_classes
+        return self._item_classes
+
+    @property
+    def node_dict(self):
+        if self._node_dict is None:
+            self._load_groups_and_nodes()
+        return self._node_dict
+
+    def _load_groups_and_nodes(self):
+        """
+        Loads groups and nodes together since their names must not
+        collide. Other threads never get to see partially loaded dicts.
+        """
+        with self._load_lock:
+            if self._group_dict is not None:
+                return
+            group_dict = {}
+            node_dict = {}
+            for node in nodes_from_file(self.nodes_file, self.libs, self.path):
+                self._add_node(node, node_dict, group_dict)
+            for group in groups_from_file(self.groups_file, self.libs):
+                self._add_group(group, group_dict, node_dict)
+            self._node_dict = node_dict
+            self._group_dict = group_dict
 
     @property
     def nodes(self):
         return sorted(self.node_dict.values())
 
+    @property
+    def nodes_by_bundle(self):
+        """
+        Returns a dict mapping bundle names to sets of nodes with that
+        bundle. Built on first access for all nodes at once, without
+        loading any bundles.
+        """
+        if self._nodes_by_bundle is None:
+            with self._load_lock:
+                if self._nodes_by_bundle is None:
+                    groups_by_node = self.group_membership.groups_by_node
+                    nodes_by_bundle = defaultdict(set)
+                    for node in self.nodes:
+                        for group_name in groups_by_node.get(node.name, ()):
+                            for bundle_name in self.get_group(group_name).bundle_names:
+                                nodes_by_bundle[bundle_name].add(node)
+                        for bundle_name in node._bundles:
+                            nodes_by_bundle[bundle_name].add(node)
+                    self._nodes_by_bundle = dict(nodes_by_bundle)
+        return self._nodes_by_bundle
+
     def nodes_in_all_groups(self, group_names):
         """
         Returns a list of nodes where every node is a member of every
@@ -402,9 +565,11 @@ class Repository(object):
         Returns all nodes that are a member of at least one of the given
         groups.
         """
-        for node in self.nodes:
-            if node.in_any_group(group_names):
-                yield node
+        nodes_by_group = self.group_membership.nodes_by_group
+        result = set()
+        for group_name in group_names:
+            result.update(nodes_by_group.get(group_name, ()))
+        return sorted(result)
 
     def nodes_in_group(self, group_name):
         """
@@ -427,28 +592,48 @@ class Repository(object):
             if validate_name(dir_entry):
                 self.bundle_names.append(dir_entry)
 
-        # populate groups
-        self.group_dict = {}
-        for group in groups_from_file(self.groups_file, self.libs):
-            self.add_group(group)
-
-        # populate items
-        self.item_classes = list(items_from_path(items.__path__[0]))
-        for item_class in items_from_path(self.items_dir):
-            self.item_classes.append(item_class)
-
-        # populate nodes
-        self.node_dict = {}
-        for node in nodes_from_file(self.nodes_file, self.libs, self.path):
-            self.add_node(node)
+        # groups, nodes and item classes are loaded on first access,
+        # so commands only pay for what they actually use
+        self._group_dict = None
+        self._group_hierarchy_cache = {}
+        self._group_membership = None
+        self._nodes_by_bundle = None
+        self._group_metadata_cache = {}
+        self._item_classes = None
+        self._node_dict = None
 
     @utils.cached_property
     def revision(self):
         return get_rev()
 
+    @utils.cached_property
+    def sources_hash(self):
+        """
+        Returns a hash of all files in this repo items can be derived
+        from: bundles (including their templates and other files),
+        custom item types, libs, data, groups.py and nodes.py.
+        """
+        paths = [self.groups_file, self.nodes_file]
+        for source_dir in (self.bundles_dir, self.data_dir, self.items_dir, self.libs_dir):
+            for dirpath, dirnames, filenames in walk(source_dir):
+                if "__pycache__" in dirnames:
+                    dirnames.remove("__pycache__")
+                for filename in filenames:
+                    if not filename.endswith((".pyc", ".pyo")):
+                        paths.append(join(dirpath, filename))
+
+        file_hashes = []
+        for path in sorted(paths):
+            file_hashes.append("{} {}".format(
+                utils.hash_local_file(path),
+                relpath(path, self.path),
+            ))
+        return utils.sha1("\n".join(file_hashes).encode('utf-8'))
+
     def _set_path(self, path):
         self.path = path
         self.bundles_dir = join(self.path, DIRNAME_BUNDLES)
+        self.cache_dir = join(self.path, DIRNAME_CACHE)
         self.data_dir = join(self.path, DIRNAME_DATA)
         self.hooks_dir = join(self.path, DIRNAME_HOOKS)
         self.items_dir = join(self.path, DIRNAME_ITEM_TYPES)
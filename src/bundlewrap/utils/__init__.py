@@ -2,17 +2,18 @@
 from __future__ import unicode_literals
 
 from codecs import getwriter
-from copy import deepcopy
+from copy import copy
 import hashlib
 from inspect import isgenerator
 import logging
-from os import chmod, makedirs
-from os.path import dirname, exists
+from os import chmod, getpid, makedirs, rename
+from os.path import dirname, exists, getmtime, getsize
 import stat
 from sys import stderr, stdout
 
 from requests import get
 
+__COMPILE_CACHE = {}
 __GETATTR_CACHE = {}
 __GETATTR_NODEFAULT = "very_unlikely_default_value"
 
@@ -71,27 +72,46 @@ def get_file_contents(path):
     return content
 
 
+def get_compiled_file(path, cache=True):
+    """
+    Returns a code object for the given source file. Code objects are
+    cached for as long as the file's mtime and size stay the same.
+    """
+    try:
+        file_stat = (getmtime(path), getsize(path))
+    except OSError:
+        # let get_file_contents() raise a proper error (if any)
+        file_stat = None
+        cache = False
+    if cache and path in __COMPILE_CACHE:
+        cached_stat, code = __COMPILE_CACHE[path]
+        if cached_stat == file_stat:
+            return code
+    code = compile(get_file_contents(path), path, 'exec')
+    if cache:
+        __COMPILE_CACHE[path] = (file_stat, code)
+    return code
+
+
 def get_all_attrs_from_file(path, cache=True, base_env=None):
     """
     Reads all 'attributes' (if it were a module) from a source file.
     """
     if base_env is None:
         base_env = {}
-    if base_env:
-        # do not allow caching when passing in a base env because that
-        # breaks repeated calls with different base envs for the same
-        # file
-        cache = False
-    if path not in __GETATTR_CACHE or not cache:
-        source = get_file_contents(path)
+    # do not cache the resulting env when passing in a base env because
+    # that breaks repeated calls with different base envs for the same
+    # file (the compiled code can still be reused)
+    cache_env = cache and not base_env
+    if path not in __GETATTR_CACHE or not cache_env:
         env = base_env.copy()
         try:
-            exec(source, env)
+            exec(get_compiled_file(path, cache=cache), env)
         except:
             LOG.error("Exception while executing {} "
                       "(use --debug to get a traceback):".format(path))
             raise
-        if cache:
+        if cache_env:
             __GETATTR_CACHE[path] = env
     else:
         env = __GETATTR_CACHE[path]
@@ -237,11 +257,15 @@ ATOMIC_TYPES = {
 def merge_dict(base, update):
     """
     Recursively merges the base dict into the update dict.
+
+    Neither base nor update are modified. Only dicts and sequences that
+    actually change are copied, everything else is shared between the
+    result and the input dicts.
     """
     if not isinstance(update, dict):
         return update
 
-    merged = deepcopy(base)
+    merged = copy(base)
 
     for key, value in update.items():
         merge = key in base and not isinstance(value, _Atomic)
@@ -256,7 +280,7 @@ def merge_dict(base, update):
                 isinstance(value, tuple)
             )
         ):
-            extended = deepcopy(base[key])
+            extended = copy(base[key])
             extended.extend(value)
             merged[key] = extended
         elif (
@@ -303,3 +327,20 @@ def sha1(data):
     hasher = hashlib.sha1()
     hasher.update(data)
     return hasher.hexdigest()
+
+
+def write_cache_file(path, content):
+    """
+    Writes the given text to a file in the cache directory of a repo.
+    Concurrent runs will never see a partially written file. Failing to
+    write is not fatal since the cache is just an optimization.
+    """
+    tmp_path = "{}.{}.tmp".format(path, getpid())
+    try:
+        if not exists(dirname(path)):
+            makedirs(dirname(path))
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        LOG.debug("unable to write cache file {}: {}".format(path, e))
@@ -2,7 +2,6 @@
 from __future__ import unicode_literals
 
 from ..exceptions import NoSuchNode, NoSuchGroup, UsageException
-from . import names
 from .text import mark_for_translation as _
 
 
@@ -20,18 +19,21 @@ def get_target_nodes(repo, target_string):
         name = name.strip()
         if name.startswith("bundle:"):
             bundle_name = name.split(":", 1)[1]
-            for node in repo.nodes:
-                if bundle_name in names(node.bundles):
-                    targets.append(node)
+            targets += list(repo.nodes_by_bundle.get(bundle_name, ()))
         elif name.startswith("!bundle:"):
             bundle_name = name.split(":", 1)[1]
+            excluded_nodes = repo.nodes_by_bundle.get(bundle_name, set())
             for node in repo.nodes:
-                if bundle_name not in names(node.bundles):
+                if node not in excluded_nodes:
                     targets.append(node)
         elif name.startswith("!group:"):
             group_name = name.split(":", 1)[1]
+            try:
+                excluded_nodes = set(repo.get_group(group_name).nodes)
+            except NoSuchGroup:
+                excluded_nodes = set()
             for node in repo.nodes:
-                if group_name not in names(node.groups):
+                if node not in excluded_nodes:
                     targets.append(node)
         else:
             try:
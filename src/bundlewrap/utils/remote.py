@@ -3,10 +3,49 @@ from __future__ import unicode_literals
 
 from pipes import quote
 
+from ..exceptions import RemoteException
 from . import cached_property, LOG
 from .text import force_text, mark_for_translation as _
 
 
+# Prints five NUL-terminated fields for the given path:
+#
+#     'exists' or 'nonexistent'
+#     output of file -bh
+#     owner:group:mode:size
+#     symlink target (symlinks only)
+#     SHA1 of the content (regular files only)
+#
+# The optional second argument controls hashing: '-' disables it, a
+# number restricts it to files of exactly that size.
+PROBE_FUNCTION = """probe() {
+    if [ -e "$1" ] || [ -L "$1" ]; then
+        printf 'exists\\0'
+        printf '%s\\0' "$(file -bh -- "$1")"
+        stat_output="$(stat --printf '%U:%G:%a:%s' -- "$1")"
+        printf '%s\\0' "$stat_output"
+        if [ -L "$1" ]; then
+            printf '%s\\0' "$(readlink -- "$1")"
+        else
+            printf '\\0'
+        fi
+        if [ -f "$1" ] && [ ! -L "$1" ] && [ "$2" != "-" ] && \\
+                { [ -z "$2" ] || [ "$2" = "${stat_output##*:}" ]; }; then
+            printf '%s\\0' "$(sha1sum -- "$1" | cut -d ' ' -f 1)"
+        else
+            printf '\\0'
+        fi
+    else
+        printf 'nonexistent\\0\\0\\0\\0\\0'
+    fi
+}
+"""
+PROBE_FIELDS = 5
+# keep each command well below the kernel's limit for a single
+# argument (MAX_ARG_STRLEN, usually 128 KiB)
+PROBE_MAX_SCRIPT_LENGTH = 64 * 1024
+
+
 def _parse_file_output(file_output):
     if file_output.startswith("cannot open "):
         # required for Mac OS X and CentOS/RHEL
@@ -38,16 +77,113 @@ def get_path_type(node, path):
     return _parse_file_output(file_output)
 
 
-def stat(node, path):
-    result = node.run("stat --printf '%U:%G:%a:%s' -- {}".format(quote(path)))
-    owner, group, mode, size = force_text(result.stdout).split(":")
-    mode = mode.zfill(4)
-    file_stat = {
+def _parse_stat_output(stat_output):
+    owner, group, mode, size = stat_output.split(":")
+    return {
         'owner': owner,
         'group': group,
-        'mode': mode,
+        'mode': mode.zfill(4),
         'size': int(size),
     }
+
+
+def _probe_argument(path, expected_sizes):
+    if expected_sizes is None or path not in expected_sizes:
+        return quote(path)
+    elif expected_sizes[path] is None:
+        return "{} -".format(quote(path))
+    else:
+        return "{} {}".format(quote(path), int(expected_sizes[path]))
+
+
+def _probe_scripts(paths, expected_sizes):
+    """
+    Yields (paths, script) tuples, splitting the given paths across as
+    few scripts as possible.
+    """
+    chunk_paths = []
+    chunk_lines = []
+    chunk_length = len(PROBE_FUNCTION)
+    for path in paths:
+        line = "probe {}\n".format(_probe_argument(path, expected_sizes))
+        if chunk_paths and chunk_length + len(line) > PROBE_MAX_SCRIPT_LENGTH:
+            yield chunk_paths, PROBE_FUNCTION + "".join(chunk_lines)
+            chunk_paths = []
+            chunk_lines = []
+            chunk_length = len(PROBE_FUNCTION)
+        chunk_paths.append(path)
+        chunk_lines.append(line)
+        chunk_length += len(line)
+    if chunk_paths:
+        yield chunk_paths, PROBE_FUNCTION + "".join(chunk_lines)
+
+
+def probe_paths(node, paths, expected_sizes=None):
+    """
+    Collects type, file description, owner, group, mode, size, symlink
+    target and SHA1 for all given paths with as few commands as
+    possible (usually one).
+
+    expected_sizes may map paths to the size their content is supposed
+    to have. Those files will only be hashed if their size matches,
+    None meaning they should not be hashed at all. Paths not included
+    are always hashed if they are regular files.
+
+    Returns a dict mapping each path to a dict with the keys 'desc',
+    'path_type', 'sha1', 'sha1_skipped', 'stat' and 'symlink_target'.
+    'sha1_skipped' is True if hashing was skipped because of a size
+    mismatch.
+    """
+    probe_results = {}
+    for chunk_paths, script in _probe_scripts(paths, expected_sizes):
+        result = node.run(script)
+        fields = result.stdout.split(b"\0")
+        if len(fields) != len(chunk_paths) * PROBE_FIELDS + 1:
+            raise RemoteException(_(
+                "unable to parse path information for {count} paths on {node}"
+            ).format(count=len(chunk_paths), node=node.name))
+
+        for index, path in enumerate(chunk_paths):
+            probe_results[path] = _parse_probe_fields(
+                fields[index * PROBE_FIELDS:(index + 1) * PROBE_FIELDS],
+                None if expected_sizes is None else expected_sizes.get(path),
+            )
+            LOG.debug(_("probe for '{path}' on {node}: {result}".format(
+                node=node.name,
+                path=path,
+                result=repr(probe_results[path]),
+            )))
+    return probe_results
+
+
+def _parse_probe_fields(fields, expected_size):
+    exists, file_output, stat_output, symlink_target, content_hash = \
+        [force_text(field) for field in fields]
+    if exists != "exists":
+        path_type, desc = ('nonexistent', "")
+    else:
+        path_type, desc = _parse_file_output(file_output.strip())
+    if path_type == 'nonexistent':
+        file_stat = {}
+    else:
+        file_stat = _parse_stat_output(stat_output)
+    return {
+        'desc': desc,
+        'path_type': path_type,
+        'sha1': content_hash or None,
+        'sha1_skipped': (
+            path_type == 'file' and
+            expected_size is not None and
+            file_stat['size'] != expected_size
+        ),
+        'stat': file_stat,
+        'symlink_target': symlink_target or None,
+    }
+
+
+def stat(node, path):
+    result = node.run("stat --printf '%U:%G:%a:%s' -- {}".format(quote(path)))
+    file_stat = _parse_stat_output(force_text(result.stdout))
     LOG.debug(_("stat for '{path}' on {node}: {result}".format(
         node=node.name,
         path=path,
@@ -58,13 +194,47 @@ def stat(node, path):
 
 class PathInfo(object):
     """
-    Serves as a proxy to get_path_type.
+    Serves as a proxy to probe_paths.
+
+    If expected_size is given, the content of a regular file is hashed
+    right away if its size matches and sha1 will be None if it does
+    not. Otherwise, sha1 is determined when first accessed. The same
+    applies to the sizes passed to PathInfo.bulk().
     """
-    def __init__(self, node, path):
+    def __init__(self, node, path, probe_result=None, expected_size=None):
         self.node = node
         self.path = path
-        self.path_type, self.desc = get_path_type(node, path)
-        self.stat = stat(node, path) if self.path_type != 'nonexistent' else {}
+        if probe_result is None:
+            probe_result = probe_paths(
+                node,
+                [path],
+                expected_sizes={path: expected_size},
+            )[path]
+        self.path_type = probe_result['path_type']
+        self.desc = probe_result['desc']
+        self.stat = probe_result['stat']
+        self._symlink_target = probe_result['symlink_target']
+        if probe_result['sha1'] is not None or probe_result['sha1_skipped']:
+            self._cache = {'sha1': probe_result['sha1']}
+
+    @classmethod
+    def bulk(cls, node, paths):
+        """
+        Returns a dict mapping each of the given paths to a PathInfo
+        instance, probing all of them with a single command.
+
+        paths may also be a dict mapping paths to the expected size of
+        their content (see probe_paths()).
+        """
+        if isinstance(paths, dict):
+            expected_sizes = paths
+        else:
+            expected_sizes = None
+        return {
+            path: cls(node, path, probe_result=probe_result)
+            for path, probe_result in
+            probe_paths(node, list(paths), expected_sizes=expected_sizes).items()
+        }
 
     def __repr__(self):
         return "<PathInfo for {}:{}>".format(self.node.name, quote(self.path))
@@ -125,7 +295,9 @@ class PathInfo(object):
     def symlink_target(self):
         if not self.is_symlink:
             raise ValueError("{} is not a symlink".format(quote(self.path)))
-        if self.desc.startswith("symbolic link to `"):
+        if self._symlink_target is not None:
+            return self._symlink_target
+        elif self.desc.startswith("symbolic link to `"):
             return self.desc[18:-1]
         elif self.desc.startswith("broken symbolic link to `"):
             return self.desc[25:-1]
@@ -57,6 +57,7 @@ class PlotTest(TestCase):
             item.bundle = bundle2
 
         node = MagicMock()
+        node.dependency_cache = None
         node.bundles = [bundle1, bundle2]
         node.items = [item1, item2, item3, item4]
         node.name = "node"
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from os import _exit, environ
+from unittest import TestCase
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from bundlewrap.concurrency import get_worker_pool, THREADS_ENV, ThreadWorkerPool, WorkerPool
+from bundlewrap.exceptions import WorkerException
+
+
+def double(x):
+    return x * 2
+
+
+def die():
+    _exit(1)
+
+
+def fail():
+    raise ValueError("47")
+
+
+def identity(x):
+    return x
+
+
+def run_tasks(pool, tasks):
+    results = {}
+    while pool.keep_running():
+        msg = pool.get_event()
+        if msg['msg'] == 'REQUEST_WORK':
+            if tasks:
+                task_id, target, args = tasks.pop()
+                pool.start_task(msg['wid'], target, task_id=task_id, args=args)
+            else:
+                pool.quit(msg['wid'])
+        elif msg['msg'] == 'FINISHED_WORK':
+            results[msg['task_id']] = msg['return_value']
+    return results
+
+
+class WorkerPoolTest(TestCase):
+    """
+    Tests bundlewrap.concurrency.WorkerPool.
+    """
+    pool_class = WorkerPool
+
+    def test_results(self):
+        with self.pool_class(workers=3) as pool:
+            results = run_tasks(
+                pool,
+                [(i, double, (i,)) for i in range(10)],
+            )
+        self.assertEqual(results, {i: i * 2 for i in range(10)})
+        self.assertEqual(pool.workers_alive, [])
+
+    def test_exception(self):
+        with self.pool_class(workers=2) as pool:
+            with self.assertRaises(WorkerException) as cm:
+                run_tasks(pool, [("task1", fail, ())])
+        self.assertEqual(cm.exception.task_id, "task1")
+        self.assertIn("ValueError", cm.exception.traceback)
+
+
+class WorkerPoolDiedTest(TestCase):
+    """
+    Tests bundlewrap.concurrency.WorkerPool with workers dying.
+    """
+    def test_died(self):
+        with WorkerPool(workers=2) as pool:
+            with self.assertRaises(RuntimeError):
+                run_tasks(pool, [("task1", die, ())])
+        self.assertEqual(pool.workers_alive, [])
+
+
+class ThreadWorkerPoolTest(WorkerPoolTest):
+    """
+    Tests bundlewrap.concurrency.ThreadWorkerPool.
+    """
+    pool_class = ThreadWorkerPool
+
+    def test_shared_by_reference(self):
+        obj = object()
+        with self.pool_class(workers=2) as pool:
+            results = run_tasks(pool, [("task1", identity, (obj,))])
+        self.assertIs(results["task1"], obj)
+
+
+class GetWorkerPoolTest(TestCase):
+    """
+    Tests bundlewrap.concurrency.get_worker_pool.
+    """
+    @patch.dict(environ, {THREADS_ENV: "1"})
+    def test_threads(self):
+        with get_worker_pool(workers=1) as pool:
+            self.assertIsInstance(pool, ThreadWorkerPool)
+
+    @patch.dict(environ, {THREADS_ENV: "0"})
+    def test_processes(self):
+        with get_worker_pool(workers=1) as pool:
+            self.assertNotIsInstance(pool, ThreadWorkerPool)
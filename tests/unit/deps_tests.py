@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 
 try:
@@ -9,7 +12,7 @@ except ImportError:
     from mock import MagicMock
 
 from bundlewrap import deps
-from bundlewrap.exceptions import BundleError
+from bundlewrap.exceptions import BundleError, ItemDependencyError, NoSuchItem
 from bundlewrap.items import Item
 
 from .node_tests import get_mock_item
@@ -28,6 +31,95 @@ class MockItem(Item):
         }
 
 
+class CheckDuplicateItemsTest(TestCase):
+    """
+    Tests bundlewrap.deps._check_duplicate_items.
+    """
+    def test_collisions(self):
+        items = [
+            get_mock_item("type1", "name1", [], []),
+            get_mock_item("type1", "name2", [], []),
+            get_mock_item("type1", "name1", [], []),
+            get_mock_item("type2", "name1", [], []),
+            get_mock_item("type1", "name2", [], []),
+            get_mock_item("type1", "name1", [], []),
+        ]
+        with self.assertRaises(BundleError) as context:
+            deps._check_duplicate_items(items)
+        self.assertEqual(
+            str(context.exception),
+            "duplicate definition of type1:name1 in bundles 'mock', 'mock' and 'mock'\n"
+            "duplicate definition of type1:name2 in bundles 'mock' and 'mock'",
+        )
+
+    def test_no_collision(self):
+        deps._check_duplicate_items([
+            get_mock_item("type1", "name1", [], []),
+            get_mock_item("type2", "name1", [], []),
+        ])
+
+
+class DependencyCacheTest(TestCase):
+    """
+    Tests bundlewrap.deps.DependencyCache.
+    """
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def get_items(self):
+        bundle = MagicMock()
+        bundle.name = "bundle1"
+        return [
+            MockItem(bundle, "item1", {'triggers': ["mock:item2:action1"]}),
+            MockItem(bundle, "item2", {'needed_by': ["mock:item3"]}),
+            MockItem(bundle, "item3", {'precedes': ["mock:item1"], 'triggered': True}),
+            MockItem(bundle, "item4", {'triggered': True, 'triggered_by': ["mock:item2"]}),
+        ]
+
+    def test_roundtrip(self):
+        path = join(self.tmpdir, "deps", "node1.json")
+        expected = deps.prepare_dependencies(self.get_items())
+        deps.prepare_dependencies(self.get_items(), cache=deps.DependencyCache(path, "key1"))
+
+        items = self.get_items()
+        items[0]._prepare_deps = MagicMock()
+        prepared_items = deps.DependencyCache(path, "key1").load(items)
+
+        self.assertFalse(items[0]._prepare_deps.called)
+        self.assertEqual(
+            [(item.id, type(item)) for item in prepared_items],
+            [(item.id, type(item)) for item in expected],
+        )
+        for item, expected_item in zip(prepared_items, expected):
+            self.assertEqual(item._deps, expected_item._deps)
+            self.assertEqual(item._flattened_deps, expected_item._flattened_deps)
+            self.assertEqual(item._flattened_triggers, expected_item._flattened_triggers)
+            self.assertEqual(item.triggers, expected_item.triggers)
+            self.assertEqual(
+                [i.id for i in item._precedes_items],
+                [i.id for i in expected_item._precedes_items],
+            )
+        self.assertIs(prepared_items[-1].bundle, items[0].bundle)
+        self.assertTrue(prepared_items[-1].triggered)
+
+    def test_key_changed(self):
+        path = join(self.tmpdir, "node1.json")
+        deps.prepare_dependencies(self.get_items(), cache=deps.DependencyCache(path, "key1"))
+        self.assertIsNone(deps.DependencyCache(path, "key2").load(self.get_items()))
+
+    def test_items_changed(self):
+        path = join(self.tmpdir, "node1.json")
+        deps.prepare_dependencies(self.get_items(), cache=deps.DependencyCache(path, "key1"))
+        self.assertIsNone(deps.DependencyCache(path, "key1").load(self.get_items()[:3]))
+
+    def test_missing(self):
+        cache = deps.DependencyCache(join(self.tmpdir, "node1.json"), "key1")
+        self.assertIsNone(cache.load(self.get_items()))
+
+
 class FlattenDependenciesTest(TestCase):
     """
     Tests bundlewrap.deps._flatten_dependencies.
@@ -65,6 +157,105 @@ class FlattenDependenciesTest(TestCase):
         for item in items:
             self.assertEqual(set(item._flattened_deps), set(deps_should[item]))
 
+    def test_loop(self):
+        item1 = get_mock_item("type1", "name1", [], ["type1:name2"])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name3"])
+        item3 = get_mock_item("type1", "name3", [], ["type1:name2", "type1:name4"])
+        item4 = get_mock_item("type1", "name4", [], [])
+        for item in (item1, item2, item3, item4):
+            item._deps = list(item.needs)
+        with self.assertRaises(ItemDependencyError) as context:
+            deps._flatten_dependencies([item1, item2, item3, item4])
+        self.assertIn(
+            "type1:name2 -> type1:name3 -> type1:name2",
+            str(context.exception),
+        )
+
+    def test_sorted(self):
+        item1 = get_mock_item("type1", "name1", [], ["type1:name4", "type1:name2"])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name3"])
+        item3 = get_mock_item("type1", "name3", [], [])
+        item4 = get_mock_item("type1", "name4", [], [])
+        for item in (item1, item2, item3, item4):
+            item._deps = list(item.needs)
+        deps._flatten_dependencies([item1, item2, item3, item4])
+        self.assertEqual(
+            item1._flattened_deps,
+            ["type1:name2", "type1:name3", "type1:name4"],
+        )
+
+    def test_long_chain(self):
+        items = [get_mock_item("type1", "name0", [], [])]
+        items[0]._deps = []
+        for i in range(1, 1500):
+            item = get_mock_item("type1", "name{}".format(i), [], [])
+            item._deps = ["type1:name{}".format(i - 1)]
+            items.append(item)
+        deps._flatten_dependencies(items)
+        self.assertEqual(len(items[-1]._flattened_deps), 1499)
+
+
+class FindDependencyLoopTest(TestCase):
+    """
+    Tests bundlewrap.deps.find_dependency_loop.
+    """
+    def test_no_loop(self):
+        item1 = get_mock_item("type1", "name1", [], ["type1:name2"])
+        item2 = get_mock_item("type1", "name2", [], [])
+        item1._deps = ["type1:name2", "type2:"]
+        item2._deps = []
+        self.assertIsNone(deps.find_dependency_loop([item1, item2]))
+
+    def test_loop(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], [])
+        item3 = get_mock_item("type1", "name3", [], [])
+        item1._deps = ["type1:name2"]
+        item2._deps = ["type1:name3"]
+        item3._deps = ["type1:name1"]
+        self.assertEqual(
+            deps.find_dependency_loop([item1, item2, item3]),
+            ["type1:name1", "type1:name2", "type1:name3", "type1:name1"],
+        )
+
+    def test_self_loop(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item1._deps = ["type1:name1"]
+        self.assertEqual(
+            deps.find_dependency_loop([item1]),
+            ["type1:name1", "type1:name1"],
+        )
+
+
+class ItemIndexTest(TestCase):
+    """
+    Tests bundlewrap.deps.ItemIndex.
+    """
+    def test_find(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], [])
+        item_index = deps.ItemIndex([item1, item2])
+        self.assertEqual(item_index.find("type1:name2"), item2)
+        self.assertIn("type1:name1", item_index)
+        self.assertEqual(len(item_index), 2)
+        with self.assertRaises(NoSuchItem):
+            item_index.find("type1:name3")
+
+    def test_first_item_wins(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name1", [], [])
+        item_index = deps.ItemIndex([item1, item2])
+        self.assertIs(item_index.find("type1:name1"), item1)
+        item_index.remove(item2)
+        self.assertIs(item_index.find("type1:name1"), item1)
+
+    def test_remove(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item_index = deps.ItemIndex([item1])
+        item_index.remove(item1)
+        self.assertNotIn("type1:name1", item_index)
+        self.assertEqual(list(item_index), [])
+
 
 class InjectCannedActionsTest(TestCase):
     """
@@ -201,6 +392,33 @@ class InjectConcurrencyBlockersTest(TestCase):
         for item in injected:
             self.assertEqual(item._deps, deps_should[item])
 
+    def test_existing_deps(self):
+        class FakeItem(object):
+            BLOCK_CONCURRENT = ['type1']
+            ITEM_TYPE_NAME = 'type1'
+
+        def make_item(item_id, deps):
+            item = FakeItem()
+            item._deps = list(deps)
+            item._flattened_deps = list(deps)
+            item.id = item_id
+            return item
+
+        item1 = make_item("type1:name1", ["type1:name3"])
+        item2 = make_item("type1:name2", [])
+        item3 = make_item("type1:name3", [])
+        item4 = make_item("type1:name4", ["type1:name1"])
+
+        deps._inject_concurrency_blockers([item1, item2, item3, item4])
+
+        # chain: item2 -> item3 -> item1 -> item4
+        self.assertEqual(item1._deps, ["type1:name3"])
+        self.assertEqual(item2._deps, [])
+        self.assertEqual(item3._deps, ["type1:name2"])
+        self.assertEqual(item4._deps, ["type1:name1"])
+        self.assertEqual(item3._concurrency_deps, ["type1:name2"])
+        self.assertEqual(item1._concurrency_deps, [])
+
     def test_noop(self):
         class FakeItem(object):
             pass
@@ -335,6 +553,25 @@ class ItemsRemoveDepTest(TestCase):
         self.assertEqual(items[1]._deps, [])
 
 
+class FlattenTriggersTest(TestCase):
+    """
+    Tests bundlewrap.deps._flatten_triggers.
+    """
+    def test_flatten(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item1.triggers = ["type1:name2"]
+        item2 = get_mock_item("type1", "name2", [], [])
+        item2.triggers = ["type1:name3"]
+        item3 = get_mock_item("type1", "name3", [], [])
+        item4 = get_mock_item("type1", "name4", [], [])
+        deps._flatten_triggers([item1, item2, item3, item4])
+        self.assertEqual(item1._flattened_triggers, {"type1:name2", "type1:name3"})
+        self.assertEqual(item2._flattened_triggers, {"type1:name3"})
+        self.assertEqual(item3._flattened_triggers, set())
+        self.assertTrue(deps._has_trigger_path([], item1, "type1:name3"))
+        self.assertFalse(deps._has_trigger_path([], item1, "type1:name4"))
+
+
 class RemoveItemDependentsTest(TestCase):
     """
     Tests bundlewrap.deps.remove_item_dependents.
@@ -358,3 +595,40 @@ class RemoveItemDependentsTest(TestCase):
             deps.remove_item_dependents(items, item3),
             ([item3], [item2, item1]),
         )
+
+    def test_order(self):
+        items = []
+        for name, item_deps in (
+            ("item1", ["item0"]),
+            ("item2", ["item1"]),
+            ("item3", ["item0"]),
+            ("item4", ["item3"]),
+            ("item5", ["item2"]),
+        ):
+            item = MagicMock()
+            item.id = name
+            item._deps = item_deps
+            items.append(item)
+        item0 = MagicMock()
+        item0.id = "item0"
+
+        remaining_items, removed_items = deps.remove_item_dependents(items, item0)
+        self.assertEqual(remaining_items, [])
+        self.assertEqual(
+            [item.id for item in removed_items],
+            ["item1", "item3", "item2", "item5", "item4"],
+        )
+
+    def test_triggered(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item1.triggers = ["type1:name2"]
+        item1._flattened_triggers = {"type1:name2"}
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item2.triggered = True
+        item2._deps = ["type1:name1"]
+        items = [item2]
+        self.assertEqual(
+            deps.remove_item_dependents(items, item1),
+            ([item2], []),
+        )
+        self.assertEqual(item2._deps, [])
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 from unittest import TestCase
 
 try:
@@ -11,6 +14,8 @@ except ImportError:
 from .node_tests import get_mock_item
 
 from bundlewrap import itemqueue
+from bundlewrap.exceptions import ItemDependencyError
+from bundlewrap.items import ItemStatus
 
 
 class ItemQueueFireTriggersTest(TestCase):
@@ -37,6 +42,35 @@ class ItemQueueFireTriggersTest(TestCase):
         iq.item_fixed(item2)
 
 
+class ItemQueueItemFixedInvalidatesStatusTest(TestCase):
+    """
+    Tests invalidation of prefetched status in
+    bundlewrap.itemqueue.ItemQueue.item_fixed().
+    """
+    def test_invalidate_queued(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], ["type1:name2"])
+        item4 = get_mock_item("type1", "name4", [], [])
+        iq = itemqueue.ItemQueue([item1, item2, item3, item4])
+        for item in (item2, item3, item4):
+            item._set_cached_status(ItemStatus(correct=True))
+        self.assertEqual(iq.pop(), (item1, []))
+        iq.item_fixed(item1)
+        self.assertNotIn('cached_status', item2._cache)
+        self.assertNotIn('cached_status', item3._cache)
+        self.assertNotIn('cached_status', item4._cache)
+
+    def test_keep_after_ok(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        iq = itemqueue.ItemQueue([item1, item2])
+        item2._set_cached_status(ItemStatus(correct=True))
+        self.assertEqual(iq.pop(), (item1, []))
+        iq.item_ok(item1)
+        self.assertIn('cached_status', item2._cache)
+
+
 class ItemQueueItemFailedTest(TestCase):
     """
     Tests bundlewrap.itemqueue.ItemQueue.item_failed().
@@ -226,6 +260,26 @@ class ItemQueueItemSkippedTest(TestCase):
         self.assertEqual(skipped_items, [])
 
 
+class ItemQueueItemsWithDepsTest(TestCase):
+    """
+    Tests bundlewrap.itemqueue.ItemQueue.items_with_deps.
+    """
+    def test_remaining_deps(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], ["type1:name1", "type1:name2"])
+        iq = itemqueue.ItemQueue([item1, item2, item3])
+        self.assertIn(item3, iq.items_with_deps)
+        self.assertEqual(iq.pop(), (item1, []))
+        iq.item_ok(item1)
+        self.assertEqual(item3._deps, {"type1:name2"})
+        self.assertNotIn(item2, iq.items_with_deps)
+        self.assertEqual(iq.pop(), (item2, []))
+        iq.item_ok(item2)
+        self.assertEqual(iq.pop(), (item3, []))
+        self.assertNotIn(item3, iq.items_with_deps)
+
+
 class ItemQueuePopTest(TestCase):
     """
     Tests bundlewrap.itemqueue.ItemQueue.pop().
@@ -238,7 +292,9 @@ class ItemQueuePopTest(TestCase):
     def test_pop_single(self):
         item = get_mock_item("type1", "name1", [], [])
         iq = itemqueue.ItemQueue([item])
+        self.assertTrue(iq.has_ready_items)
         self.assertEqual(iq.pop(), (item, []))
+        self.assertFalse(iq.has_ready_items)
         with self.assertRaises(IndexError):
             iq.pop()
         self.assertEqual(iq.pending_items, [item])
@@ -266,3 +322,119 @@ class ItemQueuePopTest(TestCase):
         popped_item, skipped_items = iq.pop()
         self.assertEqual(popped_item, item2)
         self.assertEqual(skipped_items, [])
+
+    def test_preceded_by_unchecked(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item1.preceded_by = ["type1:name2"]
+        item2 = get_mock_item("type1", "name2", [], [])
+        item2.triggered = True
+        item2._precedes_incorrect_item = MagicMock()
+        iq = itemqueue.ItemQueue([item1, item2])
+        self.assertEqual(iq.pop(check_precedes=False), (item2, []))
+        self.assertFalse(item2._precedes_incorrect_item.called)
+        with self.assertRaises(IndexError):
+            iq.pop()
+        iq.item_precedes_skipped(item2)
+        self.assertEqual(iq.pending_items, [])
+        self.assertEqual(iq.pop(), (item1, []))
+
+    def test_critical_path_first(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], ["type1:name2"])
+        item4 = get_mock_item("type1", "name4", [], [])
+        iq = itemqueue.ItemQueue([item1, item2, item3, item4])
+        self.assertEqual(iq.items_without_deps, [item1, item4])
+        self.assertEqual(iq.pop(), (item1, []))
+        self.assertEqual(iq.pop(), (item4, []))
+
+    def test_durations(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], [])
+        durations = MagicMock()
+        durations.load.return_value = {
+            "type1:name1": 1.0,
+            "type1:name2": 2.0,
+            "type1:name3": 5.0,
+        }
+        iq = itemqueue.ItemQueue([item1, item2, item3], durations=durations)
+        self.assertEqual(iq.pop(), (item3, []))
+        self.assertEqual(iq.pop(), (item1, []))
+
+    def test_loop(self):
+        item1 = get_mock_item("type1", "name1", [], ["type1:name2"])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], [])
+        with self.assertRaises(ItemDependencyError):
+            itemqueue.ItemQueue([item1, item2, item3])
+
+
+class CriticalPathsTest(TestCase):
+    """
+    Tests bundlewrap.itemqueue._critical_paths().
+    """
+    def critical_paths(self, items, durations=None):
+        if durations is not None:
+            durations_store = MagicMock()
+            durations_store.load.return_value = durations
+            durations = durations_store
+        iq = itemqueue.ItemQueue(items, durations=durations)
+        return {
+            item.id: iq._critical_paths[item.id]
+            for item in items
+        }
+
+    def test_branches(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], ["type1:name2"])
+        item4 = get_mock_item("type1", "name4", [], ["type1:name1"])
+        self.assertEqual(self.critical_paths([item1, item2, item3, item4]), {
+            "type1:name1": 3,
+            "type1:name2": 2,
+            "type1:name3": 1,
+            "type1:name4": 1,
+        })
+
+    def test_default_duration(self):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item2 = get_mock_item("type1", "name2", [], ["type1:name1"])
+        item3 = get_mock_item("type1", "name3", [], [])
+        self.assertEqual(
+            self.critical_paths(
+                [item1, item2, item3],
+                {"type1:name1": 1.0, "type1:name3": 3.0},
+            ),
+            {
+                "type1:name1": 3.0,
+                "type1:name2": 2.0,
+                "type1:name3": 3.0,
+            },
+        )
+
+
+class ItemDurationsTest(TestCase):
+    """
+    Tests bundlewrap.itemqueue.ItemDurations.
+    """
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.durations = itemqueue.ItemDurations(join(self.tmpdir, "durations", "node1.json"))
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def test_missing(self):
+        self.assertEqual(self.durations.load(), {})
+
+    def test_save(self):
+        self.durations.save({"type1:name1": 1.5, "type1:name2": 2.0})
+        self.durations.save({"type1:name2": 3.0})
+        self.assertEqual(self.durations.load(), {"type1:name1": 1.5, "type1:name2": 3.0})
+
+    def test_malformed(self):
+        self.durations.save({})
+        with open(self.durations.path, 'w') as f:
+            f.write("[1, 2]")
+        self.assertEqual(self.durations.load(), {})
@@ -9,7 +9,7 @@ except ImportError:
     from mock import call, MagicMock, patch
 
 from bundlewrap.exceptions import BundleError
-from bundlewrap.items import directories, ItemStatus
+from bundlewrap.items import directories, files, symlinks, ItemStatus
 
 
 class DirectoryFixTest(TestCase):
@@ -308,6 +308,69 @@ class DirectoryGetStatusTest(TestCase):
         self.assertEqual(status.info['needs_fixing'], [])
 
 
+class GetPathStatusBulkTest(TestCase):
+    """
+    Tests bundlewrap.items.directories.get_path_status_bulk.
+    """
+    @patch('bundlewrap.items.files.File.content_hash', new="47")
+    @patch('bundlewrap.items.directories.PathInfo')
+    def test_mixed(self, PathInfo):
+        bundle = MagicMock()
+        directory = directories.Directory(bundle, "/foo", {})
+        f = files.File(bundle, "/foo/bar", {'content_type': 'any'})
+        symlink = symlinks.Symlink(bundle, "/foo/baz", {'target': "/47"})
+        path_infos = {
+            "/foo": MagicMock(is_directory=True),
+            "/foo/bar": MagicMock(is_file=True, is_directory=False, is_symlink=False),
+            "/foo/baz": MagicMock(is_symlink=True, symlink_target="/48"),
+        }
+        PathInfo.bulk.return_value = path_infos
+
+        directories.Directory.get_status_bulk([directory, f, symlink])
+
+        self.assertEqual(PathInfo.bulk.call_count, 1)
+        self.assertEqual(
+            PathInfo.bulk.call_args[0][1],
+            {"/foo": None, "/foo/bar": None, "/foo/baz": None},
+        )
+        self.assertTrue(directory.cached_status.correct)
+        self.assertIs(directory.cached_status.info['path_info'], path_infos["/foo"])
+        self.assertTrue(f.cached_status.correct)
+        self.assertFalse(symlink.cached_status.correct)
+        self.assertEqual(symlink.cached_status.info['needs_fixing'], ['target'])
+
+
+class PathIndexTest(TestCase):
+    """
+    Tests bundlewrap.items.directories.PathIndex.
+    """
+    def test_lookups(self):
+        bundle = MagicMock()
+        root = directories.Directory(bundle, "/", {})
+        d = directories.Directory(bundle, "/foo", {})
+        f = files.File(bundle, "/foo/bar", {})
+        symlink = symlinks.Symlink(bundle, "/foo/bar", {'target': "/47"})
+        other = MagicMock()
+        other.ITEM_TYPE_NAME = "pkg_apt"
+        index = directories.PathIndex([other, symlink, root, d, f])
+
+        self.assertEqual(index.items_above("/foo/bar/baz"), [(1, symlink), (4, f), (3, d), (2, root)])
+        self.assertEqual(index.items_above("/foo"), [(2, root)])
+        self.assertEqual(index.items_above("/"), [])
+        self.assertEqual(index.items_at("/foo/bar"), [(1, symlink), (4, f)])
+        self.assertEqual(index.items_at("/baz"), [])
+
+    def test_relative(self):
+        with self.assertRaises(ValueError):
+            directories.PathIndex([]).items_above("foo/bar")
+
+    def test_double_slash(self):
+        d = directories.Directory(MagicMock(), "//etc", {})
+        index = directories.PathIndex([d])
+        self.assertEqual(index.items_above("//etc/foo"), [(0, d)])
+        self.assertEqual(index.items_above("//"), [])
+
+
 class ValidatorModeTest(TestCase):
     """
     Tests bundlewrap.items.directories.validator_mode.
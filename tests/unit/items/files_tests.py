@@ -424,6 +424,26 @@ class FileGetAutoDepsTest(TestCase):
         self.assertEqual(f.get_auto_deps(items), ["symlink:/foo/bar"])
 
 
+class FileExpectedContentSizeTest(TestCase):
+    """
+    Tests bundlewrap.items.files.File._expected_content_size.
+    """
+    def test_text(self):
+        f = files.File(MagicMock(), "/foo", {
+            'content': "47\n",
+            'content_type': 'text',
+        })
+        self.assertEqual(f._expected_content_size, 3)
+
+    def test_any(self):
+        f = files.File(MagicMock(), "/foo", {'content_type': 'any'})
+        self.assertIsNone(f._expected_content_size)
+
+    def test_delete(self):
+        f = files.File(MagicMock(), "/foo", {'delete': True})
+        self.assertIsNone(f._expected_content_size)
+
+
 class FileGetStatusTest(TestCase):
     """
     Tests bundlewrap.items.files.File.get_status.
@@ -191,17 +191,20 @@ class InitTest(TestCase):
         self.assertEqual(i.attributes, {'foo': 49, 'bar': 48})
 
 
-class BundleCollisionTest(TestCase):
+class RedundantDependenciesTest(TestCase):
     """
-    Tests bundlewrap.items.__init__.Item._check_bundle_collisions.
+    Tests bundlewrap.items.__init__.Item._check_redundant_dependencies.
     """
-    def test_collision(self):
-        item1 = MockItem(MagicMock(), "item1", {}, skip_validation=True)
-        item2 = MockItem(MagicMock(), "item1", {}, skip_validation=True)
-        with self.assertRaises(BundleError):
-            item1._check_bundle_collisions([item1, item2])
-
-    def test_no_collision(self):
-        item1 = MockItem(MagicMock(), "item1", {}, skip_validation=True)
-        item2 = MockItem(MagicMock(), "item2", {}, skip_validation=True)
-        item1._check_bundle_collisions([item1, item2])
+    def test_redundant(self):
+        bundle = MagicMock()
+        bundle.name = "bundle1"
+        item = MockItem(bundle, "item1", {}, skip_validation=True)
+        item._deps = ["type1:a", "type1:b", "type1:c", "type1:b", "type1:a"]
+        with self.assertRaises(BundleError) as context:
+            item._check_redundant_dependencies()
+        self.assertIn("on type1:a, type1:b", str(context.exception))
+
+    def test_not_redundant(self):
+        item = MockItem(MagicMock(), "item1", {}, skip_validation=True)
+        item._deps = ["type1:a", "type1:b"]
+        item._check_redundant_dependencies()
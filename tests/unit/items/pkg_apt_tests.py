@@ -83,6 +83,31 @@ class GetStatusTest(TestCase):
         self.assertFalse(status.correct)
 
 
+class GetStatusBulkTest(TestCase):
+    """
+    Tests bundlewrap.items.pkg_apt.AptPkg.get_status_bulk.
+    """
+    def test_bulk(self):
+        node = MagicMock()
+        bundle = MagicMock()
+        bundle.node = node
+        pkg1 = pkg_apt.AptPkg(bundle, "foo", {'installed': True})
+        pkg2 = pkg_apt.AptPkg(bundle, "bar", {'installed': True})
+        runresult1 = RunResult()
+        runresult1.return_code = 0
+        runresult1.stdout = "Status: install ok installed\n"
+        runresult2 = RunResult()
+        runresult2.return_code = 1
+        runresult2.stdout = ""
+        node.run_many.return_value = [runresult1, runresult2]
+        pkg_apt.AptPkg.get_status_bulk([pkg1, pkg2])
+        self.assertEqual(node.run_many.call_count, 1)
+        self.assertEqual(len(node.run_many.call_args[0][0]), 2)
+        self.assertTrue(pkg1.cached_status.correct)
+        self.assertFalse(pkg2.cached_status.correct)
+        self.assertFalse(node.run.called)
+
+
 class PkgInstalledTest(TestCase):
     """
     Tests bundlewrap.items.pkg_apt.pkg_installed.
@@ -83,6 +83,28 @@ class GetStatusTest(TestCase):
         self.assertFalse(status.correct)
 
 
+class GetStatusBulkTest(TestCase):
+    """
+    Tests bundlewrap.items.svc_systemd.SvcSystemd.get_status_bulk.
+    """
+    def test_bulk(self):
+        node = MagicMock()
+        bundle = MagicMock()
+        bundle.node = node
+        svc1 = svc_systemd.SvcSystemd(bundle, "foo", {'running': True})
+        svc2 = svc_systemd.SvcSystemd(bundle, "bar", {'running': True})
+        runresult1 = RunResult()
+        runresult1.return_code = 0
+        runresult2 = RunResult()
+        runresult2.return_code = 3
+        node.run_many.return_value = [runresult1, runresult2]
+        svc_systemd.SvcSystemd.get_status_bulk([svc1, svc2])
+        self.assertEqual(node.run_many.call_count, 1)
+        self.assertTrue(svc1.cached_status.correct)
+        self.assertFalse(svc2.cached_status.correct)
+        self.assertFalse(node.run.called)
+
+
 class svcrunningTest(TestCase):
     """
     Tests bundlewrap.items.svc_systemd.svc_running.
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from datetime import timedelta
+from threading import current_thread, Lock
+from time import sleep
 from unittest import TestCase
 
 try:
@@ -10,8 +13,9 @@ except ImportError:
 
 from bundlewrap.exceptions import ItemDependencyError, NodeAlreadyLockedException, RepositoryError
 from bundlewrap.group import Group
-from bundlewrap.items import Item
-from bundlewrap.node import ApplyResult, apply_items, _flatten_group_hierarchy, Node, NodeLock
+from bundlewrap.items import Item, ItemStatus
+from bundlewrap.node import ApplyResult, apply_items, apply_nodes, _flatten_group_hierarchy, Node, NodeLock
+from bundlewrap.node import NODE_OVERSHOOT, prefetch_status, _save_item_durations, verify_items
 from bundlewrap.operations import RunResult
 from bundlewrap.repo import Repository
 from bundlewrap.utils import names
@@ -49,6 +53,173 @@ def get_mock_item(itype, name, deps_static, deps):
     return item
 
 
+class ConcurrencyTrackingItem(MockItem):
+    lock = Lock()
+    running = {}
+    max_running = {}
+
+    def apply(self, *args, **kwargs):
+        for key in (self.node.name, None):
+            with self.lock:
+                self.running[key] = self.running.get(key, 0) + 1
+                self.max_running[key] = max(self.max_running.get(key, 0), self.running[key])
+        sleep(0.01)
+        for key in (self.node.name, None):
+            with self.lock:
+                self.running[key] -= 1
+        return self._APPLY_RESULT
+
+
+def get_mock_node(name, items):
+    node = MagicMock()
+    node.dependency_cache = None
+    node.item_durations = None
+    node.items = items
+    node.name = name
+    for item in items:
+        item.bundle.node = node
+        item.node = node
+    return node
+
+
+@patch('bundlewrap.node.NodeLock')
+class ApplyNodesTest(TestCase):
+    """
+    Tests bundlewrap.node.apply_nodes.
+    """
+    def test_apply(self, NodeLock):
+        node1 = get_mock_node("node1", [
+            get_mock_item("type1", "name1", [], ["type1:name2"]),
+            get_mock_item("type1", "name2", [], []),
+        ])
+        node2 = get_mock_node("node2", [
+            get_mock_item("type1", "name1", [], []),
+        ])
+        events = list(apply_nodes([node1, node2], node_workers=1, item_workers=2))
+        self.assertEqual(
+            [(event['msg'], event['node'].name) for event in events if event['msg'] == 'NODE_STARTED'],
+            [('NODE_STARTED', "node2"), ('NODE_STARTED', "node1")],
+        )
+        results = {
+            event['node'].name: event['result']
+            for event in events if event['msg'] == 'NODE_FINISHED'
+        }
+        self.assertEqual(results["node1"].correct, 2)
+        self.assertEqual(
+            [item_id for time_elapsed, item_id in results["node1"].profiling_info],
+            ["type1:name2", "type1:name1"],
+        )
+        self.assertEqual(results["node2"].correct, 1)
+        self.assertEqual(NodeLock.return_value.__exit__.call_count, 2)
+        self.assertEqual(node1.connection.return_value.__exit__.call_count, 1)
+
+    def test_loop(self, NodeLock):
+        node1 = get_mock_node("node1", [
+            get_mock_item("type1", "name1", [], ["type1:name2"]),
+            get_mock_item("type1", "name2", [], ["type1:name1"]),
+        ])
+        node2 = get_mock_node("node2", [
+            get_mock_item("type1", "name1", [], []),
+        ])
+        events = list(apply_nodes([node1, node2], node_workers=2, item_workers=1))
+        self.assertEqual(
+            sorted((event['msg'], event['node'].name) for event in events),
+            [
+                ('NODE_FAILED', "node1"),
+                ('NODE_FINISHED', "node2"),
+                ('NODE_STARTED', "node1"),
+                ('NODE_STARTED', "node2"),
+            ],
+        )
+        self.assertEqual(node1.connection.return_value.__exit__.call_count, 1)
+
+    def test_precedes_checked_by_worker(self, NodeLock):
+        item1 = get_mock_item("type1", "name1", [], [])
+        item1.preceded_by = ["type1:name2"]
+        item2 = get_mock_item("type1", "name2", [], [])
+        item2.triggered = True
+        checking_threads = []
+
+        def precedes_incorrect_item(interactive=False):
+            checking_threads.append(current_thread())
+            return False
+
+        item2._precedes_incorrect_item = precedes_incorrect_item
+        node1 = get_mock_node("node1", [item1, item2])
+        events = list(apply_nodes([node1], node_workers=1, item_workers=2))
+        result = [event['result'] for event in events if event['msg'] == 'NODE_FINISHED'][0]
+        self.assertEqual(result.correct, 1)
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(len(checking_threads), 1)
+        self.assertIsNot(checking_threads[0], current_thread())
+
+    def test_caps(self, NodeLock):
+        ConcurrencyTrackingItem.running.clear()
+        ConcurrencyTrackingItem.max_running.clear()
+        nodes = []
+        for node_name in ("node1", "node2", "node3"):
+            items = []
+            for item_name in ("name1", "name2", "name3", "name4"):
+                item = get_mock_item("type1", item_name, [], [])
+                item.__class__ = ConcurrencyTrackingItem
+                items.append(item)
+            nodes.append(get_mock_node(node_name, items))
+        events = list(apply_nodes(nodes, node_workers=2, item_workers=2))
+        self.assertEqual(
+            [event['result'].correct for event in events if event['msg'] == 'NODE_FINISHED'],
+            [4, 4, 4],
+        )
+        for node_name in ("node1", "node2", "node3"):
+            self.assertLessEqual(ConcurrencyTrackingItem.max_running[node_name], 2)
+        self.assertLessEqual(ConcurrencyTrackingItem.max_running[None], 4)
+
+    def test_node_cap(self, NodeLock):
+        connected = []
+        max_connected = []
+
+        def connect(*args):
+            connected.append(None)
+            max_connected.append(len(connected))
+
+        def disconnect(*args):
+            connected.pop()
+
+        nodes = []
+        for node_name in ("node1", "node2", "node3", "node4", "node5", "node6"):
+            item = get_mock_item("type1", "name1", [], [])
+            item.__class__ = ConcurrencyTrackingItem
+            node = get_mock_node(node_name, [item])
+            node.connection.return_value.__enter__.side_effect = connect
+            node.connection.return_value.__exit__.side_effect = disconnect
+            nodes.append(node)
+        events = list(apply_nodes(nodes, node_workers=1, item_workers=8))
+        self.assertEqual(
+            len([event for event in events if event['msg'] == 'NODE_FINISHED']),
+            6,
+        )
+        self.assertLessEqual(max(max_connected), 1 + NODE_OVERSHOOT)
+
+
+class SaveItemDurationsTest(TestCase):
+    """
+    Tests bundlewrap.node._save_item_durations.
+    """
+    def test_skipped(self):
+        node = MagicMock()
+        _save_item_durations(node, [
+            ("type1:name1", Item.STATUS_FIXED, timedelta(seconds=2)),
+            ("type1:name2", Item.STATUS_SKIPPED, timedelta(0)),
+        ])
+        node.item_durations.save.assert_called_once_with({"type1:name1": 2.0})
+
+    def test_disabled(self):
+        node = MagicMock()
+        node.item_durations = None
+        _save_item_durations(node, [
+            ("type1:name1", Item.STATUS_OK, timedelta(seconds=2)),
+        ])
+
+
 class ApplyItemsTest(TestCase):
     """
     Tests bundlewrap.node.apply_items.
@@ -57,6 +228,8 @@ class ApplyItemsTest(TestCase):
         i1 = get_mock_item("type1", "name1", [], ["type1:name1"])
         i2 = get_mock_item("type1", "name2", [], [])
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2]
         with self.assertRaises(ItemDependencyError):
             list(apply_items(node))
@@ -65,6 +238,8 @@ class ApplyItemsTest(TestCase):
         i1 = get_mock_item("type1", "name1", [], ["type1:name2"])
         i2 = get_mock_item("type1", "name2", [], ["type1:name1"])
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2]
         with self.assertRaises(ItemDependencyError):
             list(apply_items(node))
@@ -75,6 +250,8 @@ class ApplyItemsTest(TestCase):
         i3 = get_mock_item("type1", "name3", [], ["type1:name4"])
         i4 = get_mock_item("type1", "name4", [], ["type1:name1"])
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2, i3, i4]
         with self.assertRaises(ItemDependencyError):
             list(apply_items(node))
@@ -83,6 +260,8 @@ class ApplyItemsTest(TestCase):
         i1 = get_mock_item("type1", "name1", [], ["type1:name2"])
         i2 = get_mock_item("type1", "name2", [], ["type1:"])
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2]
         with self.assertRaises(ItemDependencyError):
             list(apply_items(node))
@@ -93,6 +272,8 @@ class ApplyItemsTest(TestCase):
         i3 = get_mock_item("type1", "name3", [], [])
 
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2, i3]
 
         results = list(apply_items(node))
@@ -107,6 +288,8 @@ class ApplyItemsTest(TestCase):
         i3 = get_mock_item("type2", "name3", ["type1:"], [])
 
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2, i3]
 
         results = list(apply_items(node))
@@ -121,6 +304,8 @@ class ApplyItemsTest(TestCase):
         i3 = get_mock_item("type1", "name3", [], [])
 
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2, i3]
 
         results = list(apply_items(node, workers=2))
@@ -135,6 +320,8 @@ class ApplyItemsTest(TestCase):
         i3 = get_mock_item("type1", "name3", [], [])
 
         node = MagicMock()
+        node.dependency_cache = None
+        node.item_durations = None
         node.items = [i1, i2, i3]
 
         results = list(apply_items(node, interactive=True, profiling=True))
@@ -144,6 +331,77 @@ class ApplyItemsTest(TestCase):
         self.assertEqual(results[2][0], "type1:name1")
 
 
+class PrefetchStatusTest(TestCase):
+    """
+    Tests bundlewrap.node.prefetch_status.
+    """
+    def test_bulk_per_type(self):
+        class BulkItem(MockItem):
+            bulk_calls = []
+
+            @classmethod
+            def get_status_bulk(cls, items):
+                cls.bulk_calls.append(items)
+                for item in items:
+                    item._set_cached_status(ItemStatus(correct=True))
+
+        bundle = MockBundle()
+        bundle.node = MockNode()
+        i1 = BulkItem(bundle, "name1", {}, skip_validation=True)
+        i2 = BulkItem(bundle, "name2", {'triggered': True}, skip_validation=True)
+        i3 = BulkItem(bundle, "name3", {}, skip_validation=True)
+        i4 = get_mock_item("type1", "name4", [], [])
+        prefetch_status([i1, i2, i3, i4])
+        self.assertEqual(BulkItem.bulk_calls, [[i1, i3]])
+        self.assertTrue(i1.cached_status.correct)
+        self.assertNotIn('cached_status', getattr(i2, '_cache', {}))
+        self.assertNotIn('cached_status', getattr(i4, '_cache', {}))
+
+    def test_bulk_shared(self):
+        bulk_calls = []
+
+        def shared_bulk(cls, items):
+            bulk_calls.append(items)
+
+        class BulkItem1(MockItem):
+            get_status_bulk = classmethod(shared_bulk)
+
+        class BulkItem2(MockItem):
+            get_status_bulk = classmethod(shared_bulk)
+
+        bundle = MockBundle()
+        bundle.node = MockNode()
+        i1 = BulkItem1(bundle, "name1", {}, skip_validation=True)
+        i2 = BulkItem2(bundle, "name2", {}, skip_validation=True)
+        prefetch_status([i1, i2])
+        self.assertEqual(bulk_calls, [[i1, i2]])
+
+    def test_bulk_failed(self):
+        class BrokenBulkItem(MockItem):
+            @classmethod
+            def get_status_bulk(cls, items):
+                items[0]._set_cached_status(ItemStatus(correct=True))
+                raise RuntimeError()
+
+        bundle = MockBundle()
+        bundle.node = MockNode()
+        i1 = BrokenBulkItem(bundle, "name1", {}, skip_validation=True)
+        prefetch_status([i1])
+        self.assertNotIn('cached_status', i1._cache)
+
+
+class VerifyItemsTest(TestCase):
+    """
+    Tests bundlewrap.node.verify_items.
+    """
+    def test_prefetched(self):
+        i1 = get_mock_item("type1", "name1", [], [])
+        i2 = get_mock_item("type1", "name2", [], [])
+        i1._set_cached_status(ItemStatus(correct=True))
+        i2._set_cached_status(ItemStatus(correct=False))
+        self.assertEqual(sorted(verify_items([i1, i2])), [False, True])
+
+
 class ApplyResultTest(TestCase):
     """
     Tests bundlewrap.node.ApplyResult.
@@ -247,6 +505,26 @@ class FlattenGroupHierarchyTest(TestCase):
         with self.assertRaises(RuntimeError):
             _flatten_group_hierarchy([group1, group2, group3])
 
+    def test_keep_order(self):
+        group1 = MagicMock()
+        group1.name = "group1"
+        group2 = MagicMock()
+        group2.name = "group2"
+        group3 = MagicMock()
+        group3.name = "group3"
+        group4 = MagicMock()
+        group4.name = "group4"
+
+        group4.subgroups = [group1]
+        group3.subgroups = []
+        group2.subgroups = []
+        group1.subgroups = []
+
+        self.assertEqual(
+            _flatten_group_hierarchy([group1, group2, group3, group4]),
+            ["group2", "group3", "group4", "group1"],
+        )
+
 
 class InitTest(TestCase):
     """
@@ -292,6 +570,34 @@ class NodeTest(TestCase):
                 ("bundle1", "bundle2", "bundle3"),
             )
 
+    def test_metadata_not_shared(self):
+        repo = Repository()
+        n1 = Node("node1", {'metadata': {'foo': {'bar': [1]}}})
+        n2 = Node("node2", {})
+        repo.add_node(n1)
+        repo.add_node(n2)
+        group = Group("group1", {
+            'members': ["node1", "node2"],
+            'metadata': {'foo': {'baz': [2]}},
+        })
+        repo.add_group(group)
+        self.assertEqual(n1.metadata, {'foo': {'bar': [1], 'baz': [2]}})
+        n1.metadata['foo']['baz'].append(3)
+        self.assertEqual(n2.metadata, {'foo': {'baz': [2]}})
+        self.assertEqual(group.metadata, {'foo': {'baz': [2]}})
+
+    @patch('bundlewrap.repo.Repository.sources_hash', new="sourceshash")
+    def test_dependency_cache_key(self):
+        repo = Repository()
+        repo.path = "/tmp/repo"
+        n1 = Node("node1", {'metadata': {'foo': {1, 2}}})
+        n2 = Node("node2", {'metadata': {'foo': {2, 1}}})
+        n3 = Node("node3", {'metadata': {'foo': object()}})
+        for node in (n1, n2, n3):
+            repo.add_node(node)
+        self.assertEqual(n1.dependency_cache.key, n2.dependency_cache.key)
+        self.assertIsNone(n3.dependency_cache)
+
     def test_hostname_defaults(self):
         n = Node("node1", {})
         self.assertEqual(n.hostname, "node1")
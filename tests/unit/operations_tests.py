@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from io import BytesIO
+from os import environ
+from os.path import isdir
+from subprocess import Popen
+from threading import Thread
+from unittest import TestCase
+
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+from bundlewrap import operations
+from bundlewrap.exceptions import RemoteException
+
+
+def local_shell_driver(args, **kwargs):
+    """
+    Runs the remote shell driver locally instead of on a node.
+    """
+    return Popen(["bash", "-c", operations.SHELL_DRIVER], **kwargs)
+
+
+class ConnectionManagerTest(TestCase):
+    """
+    Tests bundlewrap.operations.ConnectionManager.
+    """
+    @patch('bundlewrap.operations.Popen')
+    def test_connect_and_close(self, Popen):
+        Popen.return_value.wait.return_value = 0
+        with operations.ConnectionManager(hostnames=["host1"]) as connections:
+            control_dir = connections.control_dir
+            self.assertEqual(environ[operations.CONTROL_DIR_ENV], control_dir)
+            self.assertTrue(isdir(control_dir))
+            self.assertEqual(connections.hostnames, ["host1"])
+            master_args = Popen.call_args[0][0]
+            self.assertIn("ControlMaster=yes", master_args)
+            self.assertEqual(master_args[-1], "host1")
+        exit_args = Popen.call_args[0][0]
+        self.assertEqual(exit_args[-3:], ["-O", "exit", "host1"])
+        self.assertEqual(connections.hostnames, [])
+        self.assertNotIn(operations.CONTROL_DIR_ENV, environ)
+        self.assertFalse(isdir(control_dir))
+
+    @patch('bundlewrap.operations.Popen')
+    def test_shared_control_dir(self, Popen):
+        Popen.return_value.wait.return_value = 0
+        with operations.ConnectionManager(hostnames=["host1"]) as connections1:
+            with operations.ConnectionManager(hostnames=["host2"]) as connections2:
+                self.assertEqual(connections1.control_dir, connections2.control_dir)
+            self.assertEqual(environ[operations.CONTROL_DIR_ENV], connections1.control_dir)
+            self.assertTrue(isdir(connections1.control_dir))
+            self.assertEqual(connections1.hostnames, ["host1"])
+        self.assertNotIn(operations.CONTROL_DIR_ENV, environ)
+        self.assertFalse(isdir(connections1.control_dir))
+
+    @patch('bundlewrap.operations.Popen')
+    def test_connect_failed(self, Popen):
+        Popen.return_value.wait.return_value = 255
+        with operations.ConnectionManager(hostnames=["host1"]) as connections:
+            self.assertEqual(connections.hostnames, [])
+        self.assertEqual(Popen.call_count, 1)
+
+    @patch('bundlewrap.operations.Popen')
+    def test_connect_once(self, Popen):
+        Popen.return_value.wait.return_value = 0
+        with operations.ConnectionManager() as connections:
+            connections.connect("host1")
+            connections.connect("host1")
+            self.assertEqual(Popen.call_count, 1)
+
+
+class SSHOptionsTest(TestCase):
+    """
+    Tests bundlewrap.operations._ssh_options.
+    """
+    def test_without_manager(self):
+        self.assertEqual(
+            operations._ssh_options("host1", add_host_keys=True),
+            ["-o", "StrictHostKeyChecking=no"],
+        )
+
+    @patch('bundlewrap.operations.Popen', new=MagicMock())
+    def test_with_manager(self):
+        with operations.ConnectionManager() as connections:
+            options = operations._ssh_options("host1")
+            self.assertEqual(options[:2], ["-o", "StrictHostKeyChecking=yes"])
+            self.assertIn("ControlMaster=no", options)
+            self.assertIn(
+                "ControlPath=" + operations._control_path("host1", connections.control_dir),
+                options,
+            )
+        self.assertEqual(len(operations._ssh_options("host1")), 2)
+
+
+def local_ssh(args, **kwargs):
+    """
+    Runs the script fed to ssh through a local shell.
+    """
+    return Popen(["bash"], **kwargs)
+
+
+class ReadFrameTest(TestCase):
+    """
+    Tests bundlewrap.operations._read_frame.
+    """
+    def test_frame(self):
+        stream = BytesIO(b"47 3 4 3\nout\nerr2 0 0 0\n")
+        command_id, result = operations._read_frame(stream)
+        self.assertEqual(command_id, 47)
+        self.assertEqual(result.return_code, 3)
+        self.assertEqual(result.stdout, b"out\n")
+        self.assertEqual(result.stderr, b"err")
+        command_id, result = operations._read_frame(stream)
+        self.assertEqual(command_id, 2)
+        self.assertEqual(result.stdout, b"")
+
+    def test_truncated(self):
+        with self.assertRaises(EOFError):
+            operations._read_frame(BytesIO(b"1 0 4 0\nou"))
+        with self.assertRaises(EOFError):
+            operations._read_frame(BytesIO(b""))
+
+    def test_malformed(self):
+        with self.assertRaises(RemoteException):
+            operations._read_frame(BytesIO(b"1 0 4\nout\n"))
+        with self.assertRaises(RemoteException):
+            operations._read_frame(BytesIO(b"Welcome!\n"))
+
+
+class RemoteShellTest(TestCase):
+    """
+    Tests bundlewrap.operations.RemoteShell.
+    """
+    @patch('bundlewrap.operations.Popen', side_effect=local_shell_driver)
+    def test_run(self, Popen):
+        shell = operations.RemoteShell("host1")
+        try:
+            result = shell.run("echo -n out; echo -n err >&2; exit 3")
+            self.assertEqual(result.return_code, 3)
+            self.assertEqual(result.stdout, b"out")
+            self.assertEqual(result.stderr, b"err")
+            result = shell.run("printf '1\\n2\\n'; cat")
+            self.assertEqual(result.return_code, 0)
+            self.assertEqual(result.stdout, b"1\n2\n")
+            result = shell.run("")
+            self.assertEqual(result.return_code, 0)
+        finally:
+            shell.close()
+        self.assertEqual(Popen.call_count, 1)
+        self.assertEqual(Popen.call_args[0][0][-2], "host1")
+
+    @patch('bundlewrap.operations.Popen')
+    def test_died(self, Popen):
+        Popen.return_value.stdout = BytesIO(b"")
+        shell = operations.RemoteShell("host1")
+        with self.assertRaises(RemoteException):
+            shell.run("true")
+
+    @patch('bundlewrap.operations.Popen')
+    def test_malformed(self, Popen):
+        Popen.return_value.stdout = BytesIO(b"Welcome!\n")
+        shell = operations.RemoteShell("host1")
+        with self.assertRaises(RemoteException):
+            shell.run("true")
+        self.assertTrue(Popen.return_value.kill.called)
+
+    @patch('bundlewrap.operations.Popen')
+    def test_out_of_sync(self, Popen):
+        Popen.return_value.stdout = BytesIO(b"2 0 0 0\n")
+        shell = operations.RemoteShell("host1")
+        with self.assertRaises(RemoteException):
+            shell.run("true")
+        self.assertTrue(Popen.return_value.kill.called)
+
+
+class RunManyTest(TestCase):
+    """
+    Tests bundlewrap.operations.run_many.
+    """
+    @patch('bundlewrap.operations.Popen', side_effect=local_ssh)
+    def test_run_many(self, Popen):
+        results = operations.run_many("host1", [
+            "echo -n 1",
+            "echo -n 2 >&2; exit 2",
+            "cat; echo \"'\"",
+        ], ignore_failure=True)
+        self.assertEqual(Popen.call_count, 1)
+        self.assertEqual(
+            [(r.return_code, r.stdout, r.stderr) for r in results],
+            [(0, b"1", b""), (2, b"", b"2"), (0, b"'\n", b"")],
+        )
+
+    @patch('bundlewrap.operations.Popen', side_effect=local_ssh)
+    def test_failure(self, Popen):
+        with self.assertRaises(RemoteException):
+            operations.run_many("host1", ["true", "false"])
+
+    @patch('bundlewrap.operations.Popen')
+    def test_connection_failure(self, Popen):
+        Popen.return_value.communicate.return_value = (b"", b"no route to host")
+        Popen.return_value.returncode = 255
+        with self.assertRaises(RemoteException):
+            operations.run_many("host1", ["true"])
+
+    @patch('bundlewrap.operations.Popen')
+    def test_empty(self, Popen):
+        self.assertEqual(operations.run_many("host1", []), [])
+        self.assertFalse(Popen.called)
+
+    @patch('bundlewrap.operations.Popen', side_effect=local_shell_driver)
+    @patch.dict(environ, {operations.PERSISTENT_SHELL_ENV: "1"})
+    def test_persistent_shell(self, Popen):
+        try:
+            results = operations.run_many("host1", ["echo -n 1", "exit 3"], ignore_failure=True)
+            self.assertEqual([r.stdout for r in results], [b"1", b""])
+            self.assertEqual([r.return_code for r in results], [0, 3])
+        finally:
+            operations._close_remote_shell("host1")
+
+
+class RunTest(TestCase):
+    """
+    Tests bundlewrap.operations.run.
+    """
+    @patch('bundlewrap.operations.Popen', side_effect=local_shell_driver)
+    @patch.dict(environ, {operations.PERSISTENT_SHELL_ENV: "1"})
+    def test_persistent_shell(self, Popen):
+        try:
+            result = operations.run("host1", "echo 47")
+            self.assertEqual(result.stdout, b"47\n")
+            result = operations.run("host1", "exit 1", ignore_failure=True)
+            self.assertEqual(result.return_code, 1)
+            with self.assertRaises(RemoteException):
+                operations.run("host1", "exit 1")
+            self.assertEqual(Popen.call_count, 1)
+        finally:
+            operations._close_remote_shell("host1")
+
+    @patch('bundlewrap.operations.Popen', side_effect=local_shell_driver)
+    @patch.dict(environ, {operations.PERSISTENT_SHELL_ENV: "1"})
+    def test_persistent_shell_concurrent(self, Popen):
+        results = []
+
+        def run_command():
+            results.append(operations.run("host1", "sleep 0.2; echo 47"))
+
+        try:
+            threads = [Thread(target=run_command) for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual([result.stdout for result in results], [b"47\n", b"47\n"])
+            # both commands ran at the same time in shells of their own
+            self.assertEqual(Popen.call_count, 2)
+            operations.run("host1", "true")
+            self.assertEqual(Popen.call_count, 2)
+        finally:
+            operations._close_remote_shell("host1")
@@ -6,15 +6,20 @@ from os.path import join
 from pickle import dumps, loads
 from shutil import rmtree
 from tempfile import mkdtemp
+from threading import Thread
+from time import sleep
 from unittest import TestCase
 
 try:
-    from unittest.mock import MagicMock
+    from unittest.mock import MagicMock, patch
 except ImportError:
-    from mock import MagicMock
+    from mock import MagicMock, patch
 
-from bundlewrap import repo
+from bundlewrap import repo, utils
+from bundlewrap.exceptions import RepositoryError
+from bundlewrap.group import Group
 from bundlewrap.items import Item
+from bundlewrap.node import Node
 from bundlewrap.repo import Repository
 
 
@@ -102,6 +107,111 @@ class RepoBundlesTest(RepoTest):
         )
 
 
+class RepoLazyLoadingTest(RepoTest):
+    """
+    Tests lazy loading in bundlewrap.repo.Repository.
+    """
+    def test_nodes_and_groups(self):
+        Repository.create(self.tmpdir)
+        with open(join(self.tmpdir, "nodes.py"), 'w') as f:
+            f.write("nodes = {'node1': {}}\n")
+        with open(join(self.tmpdir, "groups.py"), 'w') as f:
+            f.write("groups = {'group1': {'members': ['node1']}}\n")
+        r = Repository(self.tmpdir)
+        self.assertIsNone(r._node_dict)
+        self.assertIsNone(r._group_dict)
+        self.assertIsNone(r._item_classes)
+        node = r.get_node("node1")
+        self.assertIs(node.repo, r)
+        self.assertEqual([group.name for group in node.groups], ["group1"])
+        self.assertIsNone(r._item_classes)
+        self.assertGreater(len(r.item_classes), 0)
+
+    def test_name_collision(self):
+        Repository.create(self.tmpdir)
+        with open(join(self.tmpdir, "nodes.py"), 'w') as f:
+            f.write("nodes = {'foo': {}}\n")
+        with open(join(self.tmpdir, "groups.py"), 'w') as f:
+            f.write("groups = {'foo': {}}\n")
+        with self.assertRaises(RepositoryError):
+            Repository(self.tmpdir).nodes
+        with self.assertRaises(RepositoryError):
+            Repository(self.tmpdir).groups
+
+
+    def test_threads(self):
+        Repository.create(self.tmpdir)
+        with open(join(self.tmpdir, "items", "good1.py"), 'w') as f:
+            f.write("from bundlewrap.items import Item\n"
+                    "class GoodTestItem(Item): pass\n")
+        with open(join(self.tmpdir, "nodes.py"), 'w') as f:
+            f.write("nodes = {'node1': {}, 'node2': {}}\n")
+        r = Repository(self.tmpdir)
+        items_from_path = repo.items_from_path
+
+        def slow_items_from_path(path):
+            if path == r.items_dir:
+                sleep(0.1)
+            return items_from_path(path)
+
+        results = []
+
+        def load():
+            results.append((
+                sorted(cls.__name__ for cls in r.item_classes),
+                sorted(r.node_dict.keys()),
+            ))
+
+        with patch('bundlewrap.repo.items_from_path', side_effect=slow_items_from_path):
+            threads = [Thread(target=load) for i in range(4)]
+            for thread in threads:
+                thread.start()
+                # let the first thread start loading custom item classes
+                sleep(0.02)
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(results), 4)
+        for item_class_names, node_names in results:
+            self.assertIn("GoodTestItem", item_class_names)
+            self.assertEqual(node_names, ["node1", "node2"])
+        self.assertEqual(loads(dumps(r)).node_dict.keys(), r.node_dict.keys())
+
+
+class RepoSourcesHashTest(RepoTest):
+    """
+    Tests bundlewrap.repo.Repository.sources_hash.
+    """
+    def test_changes(self):
+        Repository.create(self.tmpdir)
+        mkdir(join(self.tmpdir, "bundles", "bundle1"))
+        hash1 = Repository(self.tmpdir).sources_hash
+        with open(join(self.tmpdir, "bundles", "bundle1", "bundle.pyc"), 'w') as f:
+            f.write("compiled")
+        self.assertEqual(Repository(self.tmpdir).sources_hash, hash1)
+        with open(join(self.tmpdir, "bundles", "bundle1", "bundle.py"), 'w') as f:
+            f.write("files = {}\n")
+        hash2 = Repository(self.tmpdir).sources_hash
+        self.assertNotEqual(hash2, hash1)
+        mkdir(join(self.tmpdir, "bundles", "bundle1", "files"))
+        with open(join(self.tmpdir, "bundles", "bundle1", "files", "motd"), 'w') as f:
+            f.write("${node.name}\n")
+        hash3 = Repository(self.tmpdir).sources_hash
+        self.assertNotEqual(hash3, hash2)
+        mkdir(join(self.tmpdir, "data"))
+        with open(join(self.tmpdir, "data", "users.json"), 'w') as f:
+            f.write("{}\n")
+        self.assertNotEqual(Repository(self.tmpdir).sources_hash, hash3)
+
+
+    def test_pickled(self):
+        Repository.create(self.tmpdir)
+        r = Repository(self.tmpdir)
+        sources_hash = r.sources_hash
+        with patch('bundlewrap.repo.utils.hash_local_file') as hash_local_file:
+            self.assertEqual(loads(dumps(r)).sources_hash, sources_hash)
+        self.assertFalse(hash_local_file.called)
+
+
 class RepoItemClasses2Test(RepoTest):
     """
     Tests bundlewrap.repo.Repository.item_classes.
@@ -125,6 +235,146 @@ class RepoItemClasses2Test(RepoTest):
             self.assertTrue(issubclass(cls, Item))
 
 
+class RepoGroupMembershipTest(TestCase):
+    """
+    Tests bundlewrap.repo.Repository.group_membership.
+    """
+    def test_membership(self):
+        r = Repository()
+        node1 = Node("node1")
+        node2 = Node("node2")
+        node3 = Node("web3")
+        for node in (node1, node2, node3):
+            r.add_node(node)
+        r.add_group(Group("group1", {'members': ["node1"], 'subgroups': ["group2"]}))
+        r.add_group(Group("group2", {'member_patterns': [r"^node"], 'subgroups': ["group3"]}))
+        r.add_group(Group("group3", {'members': ["web3"]}))
+        r.add_group(Group("group4", {}))
+
+        self.assertEqual(r.get_group("group1").nodes, [node1, node2, node3])
+        self.assertEqual(r.get_group("group2").nodes, [node1, node2, node3])
+        self.assertEqual(r.get_group("group4").nodes, [])
+        self.assertEqual(
+            [group.name for group in r.groups_for_node(node3)],
+            ["group1", "group2", "group3"],
+        )
+        self.assertTrue(node2.in_group("group2"))
+        self.assertFalse(node2.in_group("group3"))
+        self.assertEqual(r.nodes_in_any_group(["group3", "group4"]), [node3])
+
+    def test_threads(self):
+        r = Repository()
+        r.add_node(Node("node1"))
+        r.add_group(Group("group1", {'members': ["node1"]}))
+        build_group_membership = repo._build_group_membership
+
+        def slow_build_group_membership(groups, nodes):
+            sleep(0.05)
+            return build_group_membership(groups, nodes)
+
+        memberships = []
+        with patch(
+            'bundlewrap.repo._build_group_membership',
+            side_effect=slow_build_group_membership,
+        ) as mock:
+            threads = [
+                Thread(target=lambda: memberships.append(r.group_membership))
+                for i in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(len(set(map(id, memberships))), 1)
+        self.assertEqual(memberships[0].groups_by_node["node1"], {"group1"})
+
+    def test_nodes_by_bundle(self):
+        r = Repository()
+        node1 = Node("node1", {'bundles': ["bundle1"]})
+        node2 = Node("node2")
+        node3 = Node("node3")
+        for node in (node1, node2, node3):
+            r.add_node(node)
+        r.add_group(Group("group1", {
+            'bundles': ["bundle1", "bundle2"],
+            'members': ["node2"],
+        }))
+        with patch('bundlewrap.node.Bundle') as Bundle:
+            self.assertEqual(r.nodes_by_bundle, {
+                "bundle1": {node1, node2},
+                "bundle2": {node2},
+            })
+        self.assertFalse(Bundle.called)
+
+    def test_invalidated(self):
+        r = Repository()
+        r.add_group(Group("group1", {'member_patterns': [r"."]}))
+        self.assertEqual(r.get_group("group1").nodes, [])
+        node1 = Node("node1")
+        r.add_node(node1)
+        self.assertEqual(r.get_group("group1").nodes, [node1])
+
+    def test_subgroup_loop(self):
+        r = Repository()
+        r.add_group(Group("group1", {'subgroups': ["group2"]}))
+        r.add_group(Group("group2", {'subgroups': ["group1"]}))
+        with self.assertRaises(RepositoryError):
+            r.get_group("group1").nodes
+
+
+class RepoFlattenedGroupHierarchyTest(TestCase):
+    """
+    Tests bundlewrap.repo.Repository.flattened_group_hierarchy.
+    """
+    def test_cached(self):
+        r = Repository()
+        r.add_group(Group("group1", {}))
+        r.add_group(Group("group2", {'subgroups': ["group1"]}))
+        groups = r.groups
+        with patch('bundlewrap.repo._flatten_group_hierarchy', return_value=["group2", "group1"]) as flatten:
+            order = r.flattened_group_hierarchy(groups)
+            self.assertEqual(order, ["group2", "group1"])
+            order.append("group3")
+            self.assertEqual(r.flattened_group_hierarchy(groups), ["group2", "group1"])
+            self.assertEqual(flatten.call_count, 1)
+
+
+class RepoMergedGroupMetadataTest(TestCase):
+    """
+    Tests bundlewrap.repo.Repository.merged_group_metadata.
+    """
+    def test_prefixes(self):
+        r = Repository()
+        r.add_group(Group("group1", {'metadata': {'bar': 1}}))
+        r.add_group(Group("group2", {'metadata': {'baz': 2}}))
+        r.add_group(Group("group3", {'metadata': {'bar': 3}}))
+        with patch('bundlewrap.utils.merge_dict', wraps=utils.merge_dict) as merge_dict:
+            self.assertEqual(
+                r.merged_group_metadata(["group1", "group2"]),
+                {'bar': 1, 'baz': 2},
+            )
+            self.assertEqual(merge_dict.call_count, 2)
+            self.assertEqual(
+                r.merged_group_metadata(["group1", "group2", "group3"]),
+                {'bar': 3, 'baz': 2},
+            )
+            self.assertEqual(merge_dict.call_count, 3)
+            self.assertIs(
+                r.merged_group_metadata(["group1", "group2"]),
+                r.merged_group_metadata(("group1", "group2")),
+            )
+            self.assertEqual(merge_dict.call_count, 3)
+        self.assertEqual(r.merged_group_metadata([]), {})
+
+    def test_invalidated(self):
+        r = Repository()
+        r.add_group(Group("group1", {'metadata': {'foo': 1}}))
+        self.assertEqual(r.merged_group_metadata(["group1"]), {'foo': 1})
+        r.add_group(Group("group2", {'metadata': {'foo': 2}}))
+        self.assertEqual(r.merged_group_metadata(["group1", "group2"]), {'foo': 2})
+
+
 class RepoNodesWithAllGroupsTest(TestCase):
     def test_some_members(self):
         def _get_group(group_name):
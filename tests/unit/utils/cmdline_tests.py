@@ -74,18 +74,15 @@ class GetTargetNodesTest(TestCase):
             cmdline.get_target_nodes(repo, "node1")
 
     def test_bundle(self):
-        bundle1 = MagicMock()
-        bundle1.name = "goodbundle"
-        bundle2 = MagicMock()
-        bundle2.name = "badbundle"
-
         node1 = MagicMock()
-        node1.bundles = (bundle1, bundle2)
         node2 = MagicMock()
-        node2.bundles = (bundle2,)
 
         repo = MagicMock()
         repo.nodes = (node1, node2)
+        repo.nodes_by_bundle = {
+            "goodbundle": {node1},
+            "badbundle": {node1, node2},
+        }
 
         self.assertEqual(
             cmdline.get_target_nodes(repo, "bundle:goodbundle"),
@@ -93,18 +90,15 @@ class GetTargetNodesTest(TestCase):
         )
 
     def test_negated_bundle(self):
-        bundle1 = MagicMock()
-        bundle1.name = "goodbundle"
-        bundle2 = MagicMock()
-        bundle2.name = "badbundle"
-
         node1 = MagicMock()
-        node1.bundles = (bundle1,)
         node2 = MagicMock()
-        node2.bundles = (bundle2,)
 
         repo = MagicMock()
         repo.nodes = (node1, node2)
+        repo.nodes_by_bundle = {
+            "goodbundle": {node1},
+            "badbundle": {node2},
+        }
 
         self.assertEqual(
             cmdline.get_target_nodes(repo, "!bundle:badbundle"),
@@ -112,20 +106,22 @@ class GetTargetNodesTest(TestCase):
         )
 
     def test_negated_group(self):
-        group1 = MagicMock()
-        group1.name = "goodgroup"
-        group2 = MagicMock()
-        group2.name = "badgroup"
-
-        node1 = MagicMock()
-        node1.groups = (group1,)
-        node2 = MagicMock()
-        node2.groups = (group2,)
+        def get_group(name):
+            if name != "badgroup":
+                raise NoSuchGroup()
+            group = MagicMock()
+            group.nodes = ["node2"]
+            return group
 
         repo = MagicMock()
-        repo.nodes = (node1, node2)
+        repo.get_group = get_group
+        repo.nodes = ("node1", "node2")
 
         self.assertEqual(
             cmdline.get_target_nodes(repo, "!group:badgroup"),
-            [node1],
+            ["node1"],
+        )
+        self.assertEqual(
+            cmdline.get_target_nodes(repo, "!group:nosuchgroup"),
+            ["node1", "node2"],
         )
@@ -2,8 +2,11 @@
 from __future__ import unicode_literals
 
 from os import remove, symlink
+from os.path import join
 from platform import system
-from tempfile import mkstemp
+from shutil import rmtree
+from subprocess import PIPE, Popen
+from tempfile import mkdtemp, mkstemp
 from unittest import TestCase
 
 try:
@@ -11,6 +14,7 @@ try:
 except ImportError:
     from mock import MagicMock, patch
 
+from bundlewrap.exceptions import RemoteException
 from bundlewrap.node import Node
 from bundlewrap.operations import RunResult
 from bundlewrap.utils import remote
@@ -63,14 +67,26 @@ class GetPathTypeTest(TestCase):
         )
 
 
+def probe_paths_mock(path_type, desc, stat=None, symlink_target=None, sha1=None):
+    def probe_paths(node, paths, expected_sizes=None):
+        return {path: {
+            'desc': desc,
+            'path_type': path_type,
+            'sha1': sha1,
+            'sha1_skipped': False,
+            'stat': stat or {},
+            'symlink_target': symlink_target,
+        } for path in paths}
+    return probe_paths
+
+
 class PathInfoTest(TestCase):
     """
     Tests bundlewrap.utils.remote.PathInfo.
     """
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'nonexistent', ""))
-    def test_nonexistent(self, stat, get_path_type):
+    def test_nonexistent(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertFalse(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -81,10 +97,9 @@ class PathInfoTest(TestCase):
         with self.assertRaises(ValueError):
             p.symlink_target
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'file', "data"))
-    def test_binary(self, stat, get_path_type):
+    def test_binary(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertTrue(p.is_binary_file)
@@ -95,10 +110,9 @@ class PathInfoTest(TestCase):
         with self.assertRaises(ValueError):
             p.symlink_target
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'directory', "directory"))
-    def test_directory(self, stat, get_path_type):
+    def test_directory(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -109,10 +123,9 @@ class PathInfoTest(TestCase):
         with self.assertRaises(ValueError):
             p.symlink_target
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'file', "ASCII English text"))
-    def test_text(self, stat, get_path_type):
+    def test_text(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -123,10 +136,9 @@ class PathInfoTest(TestCase):
         with self.assertRaises(ValueError):
             p.symlink_target
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'symlink', "symbolic link to `/47'"))
-    def test_symlink_normal(self, stat, get_path_type):
+    def test_symlink_normal(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -136,10 +148,9 @@ class PathInfoTest(TestCase):
         self.assertFalse(p.is_text_file)
         self.assertEqual(p.symlink_target, "/47")
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'symlink', "broken symbolic link to `/47'"))
-    def test_symlink_broken(self, stat, get_path_type):
+    def test_symlink_broken(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -149,10 +160,9 @@ class PathInfoTest(TestCase):
         self.assertFalse(p.is_text_file)
         self.assertEqual(p.symlink_target, "/47")
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'symlink', "symbolic link to /47"))
-    def test_symlink_noquotes(self, stat, get_path_type):
+    def test_symlink_noquotes(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -162,10 +172,9 @@ class PathInfoTest(TestCase):
         self.assertFalse(p.is_text_file)
         self.assertEqual(p.symlink_target, "/47")
 
-    @patch('bundlewrap.utils.remote.stat')
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
         'symlink', "broken symbolic link to /47"))
-    def test_symlink_noquotes_broken(self, stat, get_path_type):
+    def test_symlink_noquotes_broken(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertTrue(p.exists)
         self.assertFalse(p.is_binary_file)
@@ -175,6 +184,20 @@ class PathInfoTest(TestCase):
         self.assertFalse(p.is_text_file)
         self.assertEqual(p.symlink_target, "/47")
 
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
+        'symlink', "symbolic link to `/47'", symlink_target="/48"))
+    def test_symlink_readlink(self, probe_paths):
+        p = remote.PathInfo(MagicMock(), "/")
+        self.assertEqual(p.symlink_target, "/48")
+
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
+        'file', "data", sha1="47"))
+    def test_sha1_probed(self, probe_paths):
+        node = MagicMock()
+        p = remote.PathInfo(node, "/")
+        self.assertEqual(p.sha1, "47")
+        self.assertFalse(node.run.called)
+
     def test_sha1(self):
         if system() == "Darwin":
             # no 'sha1sum' on Mac OS
@@ -189,15 +212,14 @@ class PathInfoTest(TestCase):
             "827bfc458708f0b442009c9c9836f7e4b65557fb",
         )
 
-    @patch('bundlewrap.utils.remote.stat', return_value={
-        'owner': "foo",
-        'group': "bar",
-        'mode': "4747",
-        'size': 4848,
-    })
-    @patch('bundlewrap.utils.remote.get_path_type', return_value=(
-        'file', "data"))
-    def test_stat(self, stat, get_path_type):
+    @patch('bundlewrap.utils.remote.probe_paths', side_effect=probe_paths_mock(
+        'file', "data", stat={
+            'owner': "foo",
+            'group': "bar",
+            'mode': "4747",
+            'size': 4848,
+        }))
+    def test_stat(self, probe_paths):
         p = remote.PathInfo(MagicMock(), "/")
         self.assertEqual(p.owner, "foo")
         self.assertEqual(p.group, "bar")
@@ -205,6 +227,134 @@ class PathInfoTest(TestCase):
         self.assertEqual(p.size, 4848)
 
 
+class ProbePathsTest(TestCase):
+    """
+    Tests bundlewrap.utils.remote.probe_paths.
+    """
+    def test_parse(self):
+        node = MagicMock()
+        run_result = RunResult()
+        run_result.stdout = (
+            b"exists\0ASCII text\0user:group:644:2\0\0" +
+            b"827bfc458708f0b442009c9c9836f7e4b65557fb\0" +
+            b"exists\0symbolic link to /47\0user:group:777:3\0/47\0\0" +
+            b"nonexistent\0\0\0\0\0"
+        )
+        node.run.return_value = run_result
+        result = remote.probe_paths(node, ["/file", "/link", "/nonexistent"])
+        self.assertEqual(node.run.call_count, 1)
+        self.assertEqual(result["/file"], {
+            'desc': "ASCII text",
+            'path_type': 'file',
+            'sha1': "827bfc458708f0b442009c9c9836f7e4b65557fb",
+            'sha1_skipped': False,
+            'stat': {'owner': "user", 'group': "group", 'mode': "0644", 'size': 2},
+            'symlink_target': None,
+        })
+        self.assertEqual(result["/link"]['path_type'], 'symlink')
+        self.assertEqual(result["/link"]['symlink_target'], "/47")
+        self.assertEqual(result["/nonexistent"]['path_type'], 'nonexistent')
+        self.assertEqual(result["/nonexistent"]['stat'], {})
+
+    def test_truncated(self):
+        node = MagicMock()
+        run_result = RunResult()
+        run_result.stdout = b"exists\0data\0"
+        node.run.return_value = run_result
+        with self.assertRaises(RemoteException):
+            remote.probe_paths(node, ["/file"])
+
+
+def run_locally(command, may_fail=False):
+    """
+    Replaces node.run() with running commands on the local machine.
+    """
+    process = Popen(["bash", "-c", command], stdout=PIPE, stderr=PIPE)
+    stdout, stderr = process.communicate()
+    run_result = RunResult()
+    run_result.return_code = process.returncode
+    run_result.stdout = stdout
+    run_result.stderr = stderr
+    return run_result
+
+
+class PathInfoBulkTest(TestCase):
+    """
+    Tests bundlewrap.utils.remote.PathInfo.bulk.
+    """
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+        self.node = MagicMock()
+        self.node.run.side_effect = run_locally
+        with open(join(self.tmpdir, "file"), 'w') as f:
+            f.write("47")
+        symlink("file", join(self.tmpdir, "link"))
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def test_bulk(self):
+        paths = [
+            self.tmpdir,
+            join(self.tmpdir, "file"),
+            join(self.tmpdir, "link"),
+            join(self.tmpdir, "nonexistent"),
+        ]
+        path_infos = remote.PathInfo.bulk(self.node, paths)
+        self.assertEqual(self.node.run.call_count, 1)
+        self.assertEqual(set(path_infos.keys()), set(paths))
+        self.assertTrue(path_infos[self.tmpdir].is_directory)
+        self.assertTrue(path_infos[join(self.tmpdir, "file")].is_file)
+        self.assertEqual(path_infos[join(self.tmpdir, "file")].size, 2)
+        self.assertEqual(
+            path_infos[join(self.tmpdir, "file")].sha1,
+            "827bfc458708f0b442009c9c9836f7e4b65557fb",
+        )
+        self.assertEqual(path_infos[join(self.tmpdir, "link")].symlink_target, "file")
+        self.assertFalse(path_infos[join(self.tmpdir, "nonexistent")].exists)
+        self.assertEqual(self.node.run.call_count, 1)
+
+    def test_expected_size(self):
+        path = join(self.tmpdir, "file")
+        self.assertEqual(
+            remote.PathInfo.bulk(self.node, {path: 2})[path].sha1,
+            "827bfc458708f0b442009c9c9836f7e4b65557fb",
+        )
+        self.assertIsNone(remote.PathInfo.bulk(self.node, {path: 3})[path].sha1)
+        self.assertEqual(self.node.run.call_count, 2)
+
+    def test_no_hash(self):
+        path = join(self.tmpdir, "file")
+        path_info = remote.PathInfo.bulk(self.node, {path: None})[path]
+        self.assertEqual(self.node.run.call_count, 1)
+        self.assertEqual(path_info.sha1, "827bfc458708f0b442009c9c9836f7e4b65557fb")
+
+    def test_single_lazy(self):
+        path = join(self.tmpdir, "file")
+        path_info = remote.PathInfo(self.node, path)
+        self.assertEqual(self.node.run.call_count, 1)
+        self.assertEqual(path_info.sha1, "827bfc458708f0b442009c9c9836f7e4b65557fb")
+        self.assertEqual(self.node.run.call_count, 2)
+
+    def test_single_expected_size(self):
+        path = join(self.tmpdir, "file")
+        self.assertEqual(
+            remote.PathInfo(self.node, path, expected_size=2).sha1,
+            "827bfc458708f0b442009c9c9836f7e4b65557fb",
+        )
+        self.assertIsNone(remote.PathInfo(self.node, path, expected_size=3).sha1)
+        self.assertEqual(self.node.run.call_count, 2)
+        self.assertEqual(self.node.run.call_count, 2)
+
+    @patch('bundlewrap.utils.remote.PROBE_MAX_SCRIPT_LENGTH', new=1)
+    def test_split(self):
+        paths = [join(self.tmpdir, "file"), join(self.tmpdir, "link")]
+        path_infos = remote.PathInfo.bulk(self.node, paths)
+        self.assertEqual(self.node.run.call_count, 2)
+        self.assertTrue(path_infos[paths[0]].is_file)
+        self.assertTrue(path_infos[paths[1]].is_symlink)
+
+
 class StatTest(TestCase):
     """
     Tests bundlewrap.utils.remote.stat.
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from os import listdir
 from os.path import join
 from shutil import rmtree
 from tempfile import mkdtemp
@@ -116,6 +117,22 @@ class GetAttrFromFileTest(TestCase):
         self.assertEqual(
             utils.getattr_from_file(self.fname, 'c'), 48)
 
+    def test_base_env(self):
+        with open(self.fname, 'w') as f:
+            f.write("c = b * 2")
+        with patch('bundlewrap.utils.get_file_contents', wraps=utils.get_file_contents):
+            self.assertEqual(utils.getattr_from_file(self.fname, 'c', base_env={'b': 1}), 2)
+            self.assertEqual(utils.getattr_from_file(self.fname, 'c', base_env={'b': 2}), 4)
+            self.assertEqual(utils.get_file_contents.call_count, 1)
+
+    def test_compile_cache_invalidated(self):
+        with open(self.fname, 'w') as f:
+            f.write("c = b")
+        self.assertEqual(utils.getattr_from_file(self.fname, 'c', base_env={'b': 1}), 1)
+        with open(self.fname, 'w') as f:
+            f.write("c = b + 1")
+        self.assertEqual(utils.getattr_from_file(self.fname, 'c', base_env={'b': 1}), 2)
+
 
 class MergeDictTest(TestCase):
     """
@@ -181,6 +198,20 @@ class MergeDictTest(TestCase):
             {1: ("a", "b")},
         )
 
+    def test_structural_sharing(self):
+        base = {1: {2: {3: 4}}, 5: {6: 7}, 8: ["a"]}
+        update = {5: {9: 10}, 8: ["b"]}
+        merged = utils.merge_dict(base, update)
+        self.assertEqual(merged, {1: {2: {3: 4}}, 5: {6: 7, 9: 10}, 8: ["a", "b"]})
+        self.assertIs(merged[1], base[1])
+        self.assertEqual(base, {1: {2: {3: 4}}, 5: {6: 7}, 8: ["a"]})
+        self.assertEqual(update, {5: {9: 10}, 8: ["b"]})
+
+    def test_atomic_base(self):
+        merged = utils.merge_dict({1: utils._AtomicList(["a"])}, {1: ["b"]})
+        self.assertEqual(merged, {1: ["a", "b"]})
+        self.assertIsInstance(merged[1], utils._AtomicList)
+
 
 class NamesTest(TestCase):
     """
@@ -193,3 +224,28 @@ class NamesTest(TestCase):
 
         l = (TestObj("obj1"), TestObj("obj2"))
         self.assertEqual(list(utils.names(l)), ["obj1", "obj2"])
+
+
+class WriteCacheFileTest(TestCase):
+    """
+    Tests bundlewrap.utils.write_cache_file.
+    """
+    def setUp(self):
+        self.tmpdir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.tmpdir)
+
+    def test_write(self):
+        path = join(self.tmpdir, "cachedir", "file.json")
+        utils.write_cache_file(path, "{}")
+        self.assertEqual(utils.get_file_contents(path), b"{}")
+        self.assertEqual(listdir(join(self.tmpdir, "cachedir")), ["file.json"])
+
+    def test_failure(self):
+        path = join(self.tmpdir, "file.json")
+        with open(path, 'w') as f:
+            f.write("previous")
+        # a file is in the way of the directory we want to write to
+        utils.write_cache_file(join(path, "file.json"), "{}")
+        self.assertEqual(utils.get_file_contents(path), b"previous")